@@ -0,0 +1,241 @@
+"""Benchmark the parse, score and render stages of each generator
+
+Synthetic patients are generated from the schema of health_report_data.json
+(values jittered around the sample, dated one month apart). Each scenario
+runs in a fresh interpreter so peak RSS is per scenario. Results are
+written as JSON and can be compared against an earlier run.
+
+Usage:
+    python benchmarks/pipeline_benchmark.py                    # quick scenarios
+    python benchmarks/pipeline_benchmark.py --full             # 1/1k/100k patients x 2/500 reports
+    python benchmarks/pipeline_benchmark.py --scenarios 1000x2 --compare old.json
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+QUICK_SCENARIOS = ['1x2', '1x500', '1000x2', '1000x20']
+FULL_SCENARIOS = ['1x2', '1x500', '1000x2', '1000x500', '100000x2', '100000x500']
+
+def load_template():
+    """Load the sample report the synthetic ones are modelled on"""
+    with open(os.path.join(REPO_DIR, 'health_report_data.json'), 'r') as f:
+        return json.load(f)
+
+def make_patient_reports(template, patient_idx, n_reports, rng):
+    """Generate one patient's reports, jittering numeric values around the template"""
+    from health_values import parse_lab_value
+
+    reports = []
+    start = date(2020, 1, 1)
+    for report_idx in range(n_reports):
+        report = copy.deepcopy(template)
+        info = report['patient_info']
+        info['name'] = f'PATIENT {patient_idx:06d}'
+        info['registration_number'] = f'SYN-{patient_idx:06d}'
+        info['collection_date'] = (start + timedelta(days=30 * report_idx)).isoformat()
+        for test in report['tests']:
+            value = parse_lab_value(test['value'])
+            if value is None or not isinstance(test['value'], str) or not test['value'][:1].isdigit():
+                continue
+            value *= rng.uniform(0.8, 1.2)
+            test['value'] = f'{value:.2f}'
+            ranges = test.get('ranges')
+            if ranges:
+                if value < ranges['normal_min']:
+                    test['status'] = 'LOW'
+                elif value > ranges['normal_max']:
+                    test['status'] = 'HIGH'
+                else:
+                    test['status'] = 'NORMAL'
+        reports.append(report)
+    return reports
+
+class StageTimer:
+    """Accumulate wall time and item counts per stage"""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name, items=1):
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        entry = self.stages.setdefault(name, {'seconds': 0.0, 'items': 0})
+        entry['seconds'] += seconds
+        entry['items'] += items
+
+    def results(self):
+        return {name: {'seconds': round(s['seconds'], 4), 'items': s['items'],
+                       'items_per_sec': round(s['items'] / s['seconds'], 2) if s['seconds'] else None}
+                for name, s in self.stages.items()}
+
+def run_scenario(n_patients, n_reports, render_sample, seed):
+    """Run every stage for one scenario in this process"""
+    import health_runtime
+    health_runtime.enable_headless()
+    warnings.simplefilter('ignore', UserWarning)
+    from health_blood_panel import calculate_health_score, create_blood_panel_report
+    from health_redar_generator import HealthRadarChart
+    from health_trends_generator import create_trend_chart
+    from health_values import parse_lab_values
+
+    template = load_template()
+    rng = random.Random(seed)
+    timer = StageTimer()
+    out_dir = tempfile.mkdtemp(prefix='health_bench_')
+    artifacts = 0
+    render_seconds = 0.0
+
+    for patient_idx in range(n_patients):
+        # Serialization is setup, not a measured stage
+        lines = [json.dumps(r) for r in make_patient_reports(template, patient_idx, n_reports, rng)]
+
+        with timer.stage('json_load', len(lines)):
+            reports = [json.loads(line) for line in lines]
+
+        with timer.stage('parse_values', len(reports)):
+            for report in reports:
+                parse_lab_values(test['value'] for test in report['tests'])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            with timer.stage('categorize', len(reports)):
+                charts = []
+                for report in reports:
+                    chart = HealthRadarChart(report)
+                    chart.categorize_tests()
+                    charts.append(chart)
+
+            with timer.stage('score', len(reports)):
+                for chart, report in zip(charts, reports):
+                    category_scores = chart.calculate_category_scores()
+                    chart.calculate_overall_health_score(category_scores)
+                    calculate_health_score(report['tests'])
+
+            if patient_idx < render_sample:
+                plt = health_runtime.get_pyplot()
+                latest = reports[-1]
+                latest_chart = charts[-1]
+                category_scores = latest_chart.calculate_category_scores()
+                overall_score = latest_chart.calculate_overall_health_score(category_scores)
+                stages = [
+                    ('render_blood', lambda: create_blood_panel_report(
+                        latest, os.path.join(out_dir, f'{patient_idx}_blood.png'))),
+                    ('render_radar', lambda: latest_chart.create_radar_chart(
+                        category_scores, overall_score, os.path.join(out_dir, f'{patient_idx}_radar.png'))),
+                    ('render_trends', lambda: create_trend_chart(
+                        reports, os.path.join(out_dir, f'{patient_idx}_trends.png')))
+                ]
+                for name, render in stages:
+                    start = time.perf_counter()
+                    with timer.stage(name):
+                        render()
+                    plt.close('all')
+                    render_seconds += time.perf_counter() - start
+                    artifacts += 1
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+    return {
+        'patients': n_patients,
+        'reports_per_patient': n_reports,
+        'stages': timer.results(),
+        'peak_rss_mb': round(peak_rss_mb, 1),
+        'artifacts': artifacts,
+        'artifacts_per_sec': round(artifacts / render_seconds, 3) if render_seconds else None
+    }
+
+def run_scenario_subprocess(scenario, render_sample, seed):
+    """Run a scenario in a fresh interpreter and return its result"""
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-one', scenario,
+                          '--render-sample', str(render_sample), '--seed', str(seed)],
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def get_commit():
+    """Get the current git commit, if available"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline):
+    """Print per-stage time ratios against a baseline result file"""
+    old = {(s['patients'], s['reports_per_patient']): s for s in baseline['scenarios']}
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} (ratio > 1 is slower):")
+    for scenario in results['scenarios']:
+        prev = old.get((scenario['patients'], scenario['reports_per_patient']))
+        if not prev:
+            continue
+        for stage, metrics in scenario['stages'].items():
+            prev_metrics = prev['stages'].get(stage)
+            if prev_metrics and prev_metrics['seconds']:
+                ratio = metrics['seconds'] / prev_metrics['seconds']
+                flag = '  <-- regression' if ratio > 1.1 else ''
+                print(f"  {scenario['patients']}x{scenario['reports_per_patient']:<5} "
+                      f"{stage:<14} {ratio:5.2f}x{flag}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', help='comma separated PATIENTSxREPORTS, e.g. 1000x2,1x500')
+    parser.add_argument('--full', action='store_true', help='run the full 1/1k/100k x 2/500 grid')
+    parser.add_argument('--render-sample', type=int, default=1,
+                        help='patients per scenario whose figures are rendered (default: 1)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default='bench_results.json', help='where to write results')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        n_patients, n_reports = (int(n) for n in args.run_one.split('x'))
+        print(json.dumps(run_scenario(n_patients, n_reports, args.render_sample, args.seed)))
+        return 0
+
+    scenarios = (args.scenarios.split(',') if args.scenarios
+                 else FULL_SCENARIOS if args.full else QUICK_SCENARIOS)
+    results = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'scenarios': []
+    }
+    for scenario in scenarios:
+        print(f"Running {scenario} ...", flush=True)
+        result = run_scenario_subprocess(scenario.strip(), args.render_sample, args.seed)
+        results['scenarios'].append(result)
+        for stage, metrics in result['stages'].items():
+            print(f"  {stage:<14} {metrics['seconds']:10.3f}s  {metrics['items_per_sec'] or 0:12.1f} items/s")
+        print(f"  peak RSS {result['peak_rss_mb']} MB, {result['artifacts_per_sec'] or 0} artifacts/s")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✓ Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
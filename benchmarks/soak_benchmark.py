@@ -0,0 +1,138 @@
+"""Soak test: render the figures over and over in one process and watch RSS
+
+Renders cycle through the blood panel, radar and trend charts (in memory,
+headless) for synthetic patients. Peak RSS is recorded once the warm-up
+renders are done and again at the end; the run fails when it grew by more
+than the allowed margin, or when figures are left open in pyplot.
+
+Usage:
+    python benchmarks/soak_benchmark.py                          # 300 renders
+    python benchmarks/soak_benchmark.py --renders 100000 --pool --format svg
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import sys
+import time
+import warnings
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from pipeline_benchmark import load_template, make_patient_reports  # noqa: E402
+
+GENERATORS = ['blood', 'radar', 'trends']
+
+def current_rss_mb():
+    """Resident set size right now (Linux), else the peak so far"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def soak(renders, generators, format, warmup, sample_every, patients, seed):
+    """Run the renders and return the RSS samples and end state"""
+    import health_runtime
+    health_runtime.enable_headless()
+    warnings.simplefilter('ignore', UserWarning)
+    from health_output import render_bytes
+
+    template = load_template()
+    rng = random.Random(seed)
+    # A small set of patients is enough; reusing them keeps input memory constant
+    histories = [make_patient_reports(template, idx, 6, rng) for idx in range(patients)]
+
+    samples = []
+    warm_peak = None
+    start = time.perf_counter()
+    for idx in range(renders):
+        generator = generators[idx % len(generators)]
+        reports = histories[(idx // len(generators)) % patients]
+        with contextlib.redirect_stdout(io.StringIO()):
+            render_bytes(generator, reports if generator == 'trends' else reports[-1:], format=format)
+        done = idx + 1
+        if done == warmup:
+            warm_peak = peak_rss_mb()
+        if done % sample_every == 0 or done == renders:
+            samples.append({'renders': done, 'rss_mb': round(current_rss_mb(), 1),
+                            'peak_rss_mb': round(peak_rss_mb(), 1),
+                            'seconds': round(time.perf_counter() - start, 1)})
+            print(f"  {done:>8} renders  RSS {samples[-1]['rss_mb']:8.1f} MB  "
+                  f"peak {samples[-1]['peak_rss_mb']:8.1f} MB  {samples[-1]['seconds']:8.1f}s", flush=True)
+
+    plt = sys.modules.get('matplotlib.pyplot')
+    pool = health_runtime.get_figure_pool()
+    return {
+        'renders': renders,
+        'generators': generators,
+        'format': format,
+        'warmup_renders': warmup,
+        'warmup_peak_rss_mb': round(warm_peak or peak_rss_mb(), 1),
+        'final_peak_rss_mb': round(peak_rss_mb(), 1),
+        'open_pyplot_figures': len(plt.get_fignums()) if plt else 0,
+        'pool': {'created': pool.created, 'reused': pool.reused} if pool else None,
+        'samples': samples
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--renders', type=int, default=300)
+    parser.add_argument('--generators', default=','.join(GENERATORS), help='comma separated generators to cycle')
+    parser.add_argument('--format', default='png', help='image format (svg renders fastest)')
+    parser.add_argument('--warmup', type=int, help='renders before the baseline peak is taken '
+                        '(default: 10%% of the run, at least two per generator)')
+    parser.add_argument('--max-growth-mb', type=float, default=25.0,
+                        help='allowed peak RSS growth after warm-up (default: 25)')
+    parser.add_argument('--sample-every', type=int, help='renders between RSS samples (default: 20 samples)')
+    parser.add_argument('--patients', type=int, default=10)
+    parser.add_argument('--pool', action='store_true', help='reuse figures from a pool (enable_figure_pool)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='write the results as JSON here')
+    args = parser.parse_args(argv)
+
+    generators = args.generators.split(',')
+    warmup = args.warmup or max(2 * len(generators), args.renders // 10)
+    if warmup >= args.renders:
+        parser.error('--renders must be larger than the warm-up')
+    if args.pool:
+        import health_runtime
+        health_runtime.enable_figure_pool()
+
+    print(f"Soaking {args.renders:,} renders ({', '.join(generators)}, {args.format}"
+          f"{', pooled' if args.pool else ''}) ...", flush=True)
+    result = soak(args.renders, generators, args.format, warmup,
+                  args.sample_every or max(1, args.renders // 20), args.patients, args.seed)
+    growth = result['final_peak_rss_mb'] - result['warmup_peak_rss_mb']
+    result['peak_growth_mb'] = round(growth, 1)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    print(f"\nPeak RSS after {warmup:,} warm-up renders: {result['warmup_peak_rss_mb']} MB; "
+          f"after {args.renders:,}: {result['final_peak_rss_mb']} MB ({growth:+.1f} MB)")
+    if result['pool']:
+        print(f"Figure pool: {result['pool']['created']} created, {result['pool']['reused']} reused")
+    failures = []
+    if growth > args.max_growth_mb:
+        failures.append(f"peak RSS grew {growth:.1f} MB (limit {args.max_growth_mb:g} MB)")
+    if result['open_pyplot_figures']:
+        failures.append(f"{result['open_pyplot_figures']} figure(s) left open in pyplot")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("✓ Memory stayed flat")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Cold-start benchmark for the report generators
+
+Imports each module in a fresh interpreter several times and fails when
+the median import time exceeds the budget, or when importing pulls in
+pyplot or seaborn (those must only load when something is rendered).
+
+Usage: python benchmarks/startup_benchmark.py [--budget-ms 250] [--runs 7]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    'health_blood_panel',
+    'health_redar_generator',
+    'health_trends_generator',
+    'health_batch',
+    'health_pipeline',
+    'health_scores',
+    'health_watch'
+]
+
+# Modules that must not be loaded just by importing a generator
+HEAVY_MODULES = ['matplotlib.pyplot', 'seaborn']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(module, runs):
+    """Import a module in fresh interpreters, returning (median seconds, heavy modules loaded)"""
+    timings = []
+    heavy = set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                             cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        timings.append(result['seconds'])
+        heavy.update(result['heavy'])
+    return statistics.median(timings), sorted(heavy)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=250.0, help='max median import time per module')
+    parser.add_argument('--runs', type=int, default=7, help='fresh interpreters per module')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in MODULES:
+        seconds, heavy = measure(module, args.runs)
+        over = seconds * 1000 > args.budget_ms
+        status = 'FAIL' if over or heavy else 'ok'
+        failed = failed or status == 'FAIL'
+        line = f"[{status:>4}] {module:<26} {seconds * 1000:7.1f} ms"
+        if heavy:
+            line += f"  imports {', '.join(heavy)} at import time"
+        print(line)
+
+    print(f"Budget: {args.budget_ms:.0f} ms per module")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+# Lets pytest import the top-level health_* modules from tests/
@@ -0,0 +1,276 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import time
+import traceback
+import warnings
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date
+import health_instrument
+from health_output import render
+from health_render_cache import RenderCache
+from health_stream import iter_reports, is_report_stream, group_by_patient, safe_patient_id
+
+# Generators the batch can fan out, with the file each one writes per patient
+GENERATORS = {
+    'blood': 'health_blood.png',
+    'radar': 'health_radar.png',
+    'trends': 'health_trends.png'
+}
+
+def discover_jobs(source):
+    """Collect (patient_id, reports) pairs from a directory, manifest, JSONL dump or columnar store
+
+    A directory holds one sub-directory of report JSONs per patient, or
+    single-report patients as top-level JSON files. A manifest lists one
+    report path per line, optionally as 'patient_id<TAB>path'. A JSONL dump
+    (sorted by patient) is streamed lazily and yields parsed reports instead
+    of paths, as does a columnar store (health_columnar), whose reports are
+    rebuilt from memory-mapped columns without reading JSON.
+    """
+    if os.path.isfile(os.path.join(source, 'strings.json')):
+        # Imported here, as it pulls in numpy
+        from health_columnar import ColumnarStore
+        return ColumnarStore(source).iter_patients()
+    if is_report_stream(source):
+        return ((safe_patient_id(key), reports)
+                for key, reports in group_by_patient(iter_reports(source)))
+
+    patients = {}
+    if os.path.isdir(source):
+        for entry in sorted(os.scandir(source), key=lambda e: e.name):
+            if entry.is_dir():
+                paths = sorted(os.path.join(entry.path, name) for name in os.listdir(entry.path)
+                               if name.endswith('.json'))
+                if paths:
+                    patients[entry.name] = paths
+            elif entry.name.endswith('.json'):
+                patients[os.path.splitext(entry.name)[0]] = [entry.path]
+    else:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                if '\t' in line:
+                    patient_id, path = line.split('\t', 1)
+                else:
+                    path = line
+                    patient_id = os.path.splitext(os.path.basename(path))[0]
+                patients.setdefault(patient_id, []).append(os.path.join(base_dir, path))
+    return list(patients.items())
+
+# Render caches opened by this worker, keyed by (directory, max_bytes)
+_caches = {}
+
+def _get_cache(directory, max_bytes):
+    """Open a render cache once per worker"""
+    key = (directory, max_bytes)
+    if key not in _caches:
+        _caches[key] = RenderCache(directory, max_bytes)
+    return _caches[key]
+
+def get_render_version(generator):
+    """Get the output version of a generator, so cache entries expire when it changes"""
+    if generator == 'blood':
+        import health_blood_panel
+        return health_blood_panel.RENDER_VERSION
+    elif generator == 'radar':
+        import health_redar_generator
+        return health_redar_generator.RENDER_VERSION
+    import health_trends_generator
+    return health_trends_generator.RENDER_VERSION
+
+def get_cache_options(generator, options):
+    """Get the render options that affect a generator's output"""
+    cache_options = dict(options)
+    if generator == 'blood':
+        # The blood panel prints today's date
+        cache_options['date'] = date.today().isoformat()
+    return cache_options
+
+def _init_worker(instrument_config=None):
+    """Load the generators and pyplot once per worker, headless
+
+    instrument_config holds health_instrument.enable() arguments, if any.
+    """
+    if instrument_config:
+        health_instrument.enable(**instrument_config)
+    import health_runtime
+    health_runtime.enable_headless()
+    warnings.simplefilter('ignore', UserWarning)
+    health_runtime.get_seaborn()
+    import health_blood_panel  # noqa: F401
+    import health_redar_generator  # noqa: F401
+    import health_trends_generator  # noqa: F401
+
+def render_job(job):
+    """Render one generator's output for one patient inside a worker
+
+    Reports are given as JSON paths or already-parsed report dicts, in
+    any order: the blood panel and radar use the latest one by collection
+    date, like health_cohort does. options holds extra keyword arguments
+    for the generator. With a
+    cache_config of (directory, max_bytes), unchanged reports are served
+    from the render cache without touching matplotlib.
+    """
+    patient_id, generator, reports, output_file, options, cache_config = job
+    import health_trends_generator
+    from health_cohort import latest_report
+
+    health_instrument.set_context(patient_id=patient_id, generator=generator)
+    start = time.perf_counter()
+    error = None
+    cached = False
+    try:
+        reports = health_trends_generator.load_reports(reports)
+        # Only the trend figure needs the full history; file names need not sort by date
+        if generator != 'trends':
+            reports = [latest_report(reports)]
+
+        cache = key = None
+        if cache_config:
+            cache = _get_cache(*cache_config)
+            key = cache.make_key(generator, get_render_version(generator), reports,
+                                 get_cache_options(generator, options))
+            hit = cache.get(key)
+            if hit:
+                try:
+                    shutil.copyfile(hit, output_file)
+                    cached = True
+                except FileNotFoundError:
+                    pass  # Evicted by another worker since get(); render it again
+
+        if not cached:
+            # Generators report progress on stdout, which is noise in a batch
+            with contextlib.redirect_stdout(io.StringIO()), \
+                    health_instrument.profile_report(f'{patient_id}_{generator}'):
+                render(generator, reports, output_file, **options)
+            if cache:
+                cache.put(key, output_file)
+    except Exception:
+        error = traceback.format_exc().strip().splitlines()[-1]
+    return {
+        'patient_id': patient_id,
+        'generator': generator,
+        'output_file': output_file,
+        'seconds': round(time.perf_counter() - start, 3),
+        'cached': cached,
+        'error': error
+    }
+
+def iter_render_jobs(patients, output_dir, generators, options=None, cache_config=None):
+    """Expand patients into one render job per generator
+
+    options maps a generator name to extra keyword arguments for it.
+    """
+    options = options or {}
+    for patient_id, reports in patients:
+        patient_dir = os.path.join(output_dir, patient_id)
+        os.makedirs(patient_dir, exist_ok=True)
+        for generator in generators:
+            yield (patient_id, generator, reports, os.path.join(patient_dir, GENERATORS[generator]),
+                   options.get(generator, {}), cache_config)
+
+def run_batch(jobs, workers=None, max_in_flight=None, on_result=None, instrument_config=None):
+    """Run render jobs over a process pool, keeping at most max_in_flight queued"""
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    results = []
+
+    def collect(done):
+        for future in done:
+            result = future.result()
+            results.append(result)
+            if on_result:
+                on_result(result)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(instrument_config,)) as pool:
+        pending = set()
+        for job in jobs:
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(render_job, job))
+        collect(wait(pending)[0])
+
+    return results
+
+def print_result(result):
+    """Print one line per finished job"""
+    status = 'FAIL' if result['error'] else 'hit' if result.get('cached') else 'ok'
+    line = f"[{status:>4}] {result['patient_id']} {result['generator']:<6} {result['seconds']:7.2f}s"
+    if result['error']:
+        line += f"  {result['error']}"
+    print(line, flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render health reports for many patients')
+    parser.add_argument('source', help='directory of report JSONs, a manifest file, a JSONL dump'
+                                       " ('-' reads JSONL from stdin) or a columnar store")
+    parser.add_argument('-o', '--output-dir', default='renders', help='where to write patient outputs')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help='jobs queued on the pool at once (default: 2 x workers)')
+    parser.add_argument('-g', '--generators', default=','.join(GENERATORS),
+                        help='comma separated subset of: ' + ', '.join(GENERATORS))
+    parser.add_argument('--template', action='store_true',
+                        help='render blood panels over a static layer cached once per worker')
+    parser.add_argument('--cache-dir', help='reuse renders of unchanged reports from this cache directory')
+    parser.add_argument('--cache-max-mb', type=float, default=1024, help='render cache size limit (default: 1024)')
+    parser.add_argument('--trace', help='append per-stage timing spans as JSON lines to this file')
+    parser.add_argument('--trace-allocations', action='store_true',
+                        help='record allocated bytes per span with tracemalloc (slower)')
+    parser.add_argument('--profile-slowest', type=int, default=0, metavar='N',
+                        help='keep cProfile dumps of the N slowest renders')
+    parser.add_argument('--profile-dir', default='profiles', help='where to write profile dumps')
+    parser.add_argument('--report', help='write per-job results as JSON lines to this file')
+    args = parser.parse_args(argv)
+
+    generators = [g.strip() for g in args.generators.split(',') if g.strip()]
+    unknown = [g for g in generators if g not in GENERATORS]
+    if unknown:
+        parser.error(f"unknown generator(s): {', '.join(unknown)}")
+
+    patients = discover_jobs(args.source)
+    print(f"Rendering from '{args.source}' with {args.workers or os.cpu_count()} worker(s)")
+
+    start = time.perf_counter()
+    options = {'blood': {'use_template': True}} if args.template else {}
+    cache_config = (args.cache_dir, int(args.cache_max_mb * 1024 * 1024)) if args.cache_dir else None
+    jobs = iter_render_jobs(patients, args.output_dir, generators, options, cache_config)
+    instrument_config = None
+    if args.trace or args.trace_allocations or args.profile_slowest:
+        instrument_config = dict(log_file=args.trace, trace_allocations=args.trace_allocations,
+                                 profile_slowest=args.profile_slowest, profile_dir=args.profile_dir)
+    results = run_batch(jobs, args.workers, args.max_in_flight, on_result=print_result,
+                        instrument_config=instrument_config)
+    elapsed = time.perf_counter() - start
+
+    failures = [r for r in results if r['error']]
+    hits = sum(1 for r in results if r['cached'])
+    print("=" * 60)
+    print(f"✓ {len(results) - len(failures)} job(s) succeeded ({hits} from cache), {len(failures)} failed "
+          f"in {elapsed:.1f}s ({len(results) / elapsed if elapsed else 0:.2f} jobs/s)")
+
+    if args.profile_slowest:
+        kept = health_instrument.prune_profiles(args.profile_dir, args.profile_slowest)
+        print(f"✓ Profiles of the {len(kept)} slowest render(s) kept in {args.profile_dir}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+
+    return 1 if failures else 0
+
+
+# Usage: python health_batch.py reports/ -o renders/ -w 8
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,82 +1,59 @@
-import json
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle, FancyBboxPatch
-import numpy as np
 from datetime import datetime
+import numpy as np
+from health_categories import HEMATOLOGY, DIFFERENTIAL, URINE
+from health_classify import classify
+from health_instrument import span
+from health_model import ABNORMAL_CODES, load_report
+from health_output import get_format, target_name
+from health_ranges import RANGES, report_context
+from health_runtime import render_figure
+from health_scores import panel_score
+from health_units import unit_factors
+from health_values import parse_lab_value, parse_lab_values
 
 def calculate_health_score(tests):
     """Calculate overall health score based on test results"""
-    total_tests = len([t for t in tests if t.get('status') is not None])
-    normal_tests = sum(1 for test in tests if test.get('status') == 'NORMAL')
-    score = (normal_tests / total_tests) * 100 if total_tests > 0 else 0
-    return round(score, 1)
+    return panel_score(tests)
 
 def get_bar_color(value, normal_min, normal_max):
     """Get intelligent color for bar based on value position"""
     try:
-        val = float(value)
-        min_val = float(normal_min)
-        max_val = float(normal_max)
-        
-        if val < min_val:
-            return '#f39c12'  # Orange for low
-        elif val > max_val:
-            return '#e74c3c'  # Red for high
-        else:
-            return '#27ae60'  # Green for normal
+        # Orange for low, red for high, green for normal
+        return str(classify(float(value), float(normal_min), float(normal_max)).colors)
     except:
         return '#95a5a6'
 
 def parse_numeric_value(value_str):
     """Parse numeric value from string"""
-    try:
-        if isinstance(value_str, (int, float)):
-            return float(value_str)
-        cleaned = ''.join(c for c in str(value_str) if c.isdigit() or c in '.-')
-        return float(cleaned) if cleaned and cleaned not in ['.', '-', ''] else None
-    except:
-        return None
+    return parse_lab_value(value_str)
 
-def create_blood_panel_report(json_file_path, output_file='health_blood.png'):
-    """Generate professional blood panel report"""
-    
-    # Load JSON data
-    with open(json_file_path, 'r') as f:
-        data = json.load(f)
-    
-    patient_info = data.get('patient_info', {})
-    tests = data.get('tests', [])
-    
-    # Calculate health score
-    health_score = calculate_health_score(tests)
-    
-    # Categorize tests
-    hematology_keywords = ['hemoglobin', 'rbc', 'h.ct', 'hct', 'mcv', 'mch', 'rdw', 
-                           'wbc', 'tlc', 'platelet', 'esr', 'glucose', 'hbsag', 'hiv']
-    differential_keywords = ['polymorph', 'lymphocyte', 'eosinophil', 'monocyte', 'basophil']
-    
-    hematology_tests = []
-    differential_tests = []
-    urine_tests = []
-    
-    for test in tests:
-        name_lower = test.get('name', '').lower()
-        if any(kw in name_lower for kw in hematology_keywords):
-            hematology_tests.append(test)
-        elif any(kw in name_lower for kw in differential_keywords):
-            differential_tests.append(test)
-        elif 'urine' in name_lower or any(x in name_lower for x in 
-            ['bile', 'pus', 'epithelial', 'cast', 'fungus', 'crystal', 'bacteria', 
-             'specific gravity', 'volume', 'colour', 'appearance', 'reaction']):
-            urine_tests.append(test)
-    
-    # Create figure with light gray background
-    fig, ax = plt.subplots(figsize=(18, 12), facecolor='#e8e8e8')
-    
+# Bump when the rendered output changes, to invalidate cached renders
+RENDER_VERSION = 6
+
+# Panel canvas size and the position of the differential table
+PANEL_FIGSIZE = (18, 12)
+DIFF_X = 62
+DIFF_Y = 79
+
+# Range drawn for tests with no stated or default normal range
+PANEL_DEFAULT_RANGE = (0, 100)
+
+# Fixed axes margins used in template mode (no tight bbox to crop against)
+TEMPLATE_MARGINS = dict(left=0.01, right=0.99, bottom=0.01, top=0.99)
+
+# Template figure with its static layer drawn, one per process, keyed by (dpi, date)
+_TEMPLATE_CACHE = {}
+
+def setup_panel_axes(ax):
+    """Give the panel axes a bare 0-100 coordinate system"""
     # Remove default axes
     ax.set_xlim(0, 100)
     ax.set_ylim(0, 100)
     ax.axis('off')
+
+def draw_static_layer(ax, date_text):
+    """Draw the parts of the panel that are the same for every patient"""
+    from matplotlib.patches import Rectangle, FancyBboxPatch
     
     # White content box background
     white_box = FancyBboxPatch((2, 2), 96, 96, 
@@ -90,9 +67,93 @@ def create_blood_panel_report(json_file_path, output_file='health_blood.png'):
     # Title
     ax.text(50, 96.5, 'Detailed Blood Panel & Urine Analysis Report', 
            ha='center', fontsize=24, fontweight='bold', family='sans-serif', zorder=10)
-    ax.text(50, 93.5, datetime.now().strftime('%B %d, %Y'), 
+    ax.text(50, 93.5, date_text, 
            ha='center', fontsize=12, color='#666', zorder=10)
     
+    # Section headers
+    ax.text(8, 84, 'Hematology & Chemistry Results', 
+           fontsize=14, fontweight='bold', zorder=10)
+    ax.text(56, 84, 'Differential & Urine Analysis', 
+           fontsize=14, fontweight='bold', zorder=10)
+    
+    # Right section - Differential tests
+    y_pos = DIFF_Y
+    diff_x = DIFF_X
+    
+    # Differential table header
+    ax.text(diff_x, y_pos, 'Polymorphs (%)', fontsize=9.5, zorder=10)
+    ax.text(diff_x + 20, y_pos, '4.0-10.0', fontsize=9.5, color='#666', zorder=10)
+    
+    y_pos -= 3.5
+    ax.text(diff_x, y_pos, 'Lymphocytes (%)', fontsize=9.5, zorder=10)
+    ax.text(diff_x + 15, y_pos, 'Eosinophils (%)', fontsize=9.5, zorder=10)
+    
+    y_pos -= 3.5
+    ax.text(diff_x, y_pos, 'Monocytes (%)', fontsize=9.5, zorder=10)
+    ax.text(diff_x + 15, y_pos, 'Monocytes (%)', fontsize=9.5, zorder=10)
+    
+    y_pos -= 3.5
+    ax.text(diff_x, y_pos, 'Baseln (%)', fontsize=9.5, zorder=10)
+    
+    # Urine Analysis section
+    y_pos -= 6
+    ax.text(diff_x, y_pos, 'Urine Analysis', 
+           fontsize=13, fontweight='bold', zorder=10)
+    
+    # Urine table
+    y_pos -= 5
+    urine_data = [
+        ['Volume', 'Colour', 'Appearance'],
+        ['Reaction', 'Specific Gravity', 'Bile Salts'],
+        ['Protein', 'Bile Pigments', ''],
+        ['Red Cells', 'NIL', ''],
+        ['Fungus', 'Present (++)', ''],
+        ['Crystals', 'Bacteria', '']
+    ]
+    
+    for row in urine_data:
+        for i, param in enumerate(row):
+            if param:
+                x_pos = diff_x + i * 13
+                ax.text(x_pos, y_pos, param, fontsize=8.5, zorder=10)
+                if i == 2 and param:
+                    ax.text(x_pos + 9, y_pos, 'NORMAL', 
+                           fontsize=7.5, color='#666', zorder=10)
+        y_pos -= 3
+    
+    # Legend at bottom left
+    legend_y = 14
+    ax.add_patch(Rectangle((7, legend_y - 0.7), 1.2, 1.2, 
+                          facecolor='#3498db', edgecolor='none', zorder=5))
+    ax.text(9, legend_y, 'Your Result', fontsize=9.5, va='center', zorder=10)
+    
+    ax.add_patch(Rectangle((7, legend_y - 3.5), 1.2, 1.2, 
+                          facecolor='#27ae60', edgecolor='none', zorder=5))
+    ax.text(9, legend_y - 2.8, 'Healthy Reference Range', 
+           fontsize=9.5, va='center', zorder=10)
+    
+    # Warning banner at bottom
+    warning_box = FancyBboxPatch((6, 4), 88, 4.5, 
+                                boxstyle="round,pad=0.4",
+                                facecolor='#e74c3c', edgecolor='none', zorder=5)
+    ax.add_patch(warning_box)
+    
+    ax.text(50, 6.8, 
+           'IMPORTANT: Several results are HIGH. Consult with a physician for accurate interpretation and', 
+           ha='center', fontsize=10.5, color='white', fontweight='bold', zorder=10)
+    ax.text(50, 5.2, 'recommendations.', 
+           ha='center', fontsize=10.5, color='white', fontweight='bold', zorder=10)
+
+def draw_patient_layer(ax, health_score, hematology_tests, differential_tests, context=None,
+                       measurements=None):
+    """Draw the per-patient score, bars, values and status text (ranges resolved for context)
+
+    measurements is an optional (values, mins, maxs) tuple of arrays aligned
+    with hematology_tests, for callers that already parsed the values and
+    resolved the ranges (NaN where unknown), both in canonical units.
+    """
+    from matplotlib.patches import Rectangle, FancyBboxPatch
+    
     # Overall Health Score Box
     score_color = '#27ae60' if health_score >= 80 else '#f39c12' if health_score >= 60 else '#e74c3c'
     score_box = FancyBboxPatch((40, 88.5), 20, 4, 
@@ -105,43 +166,37 @@ def create_blood_panel_report(json_file_path, output_file='health_blood.png'):
     ax.text(50, 91, f'Overall Health Score: {health_score}%', 
            ha='center', fontsize=13, fontweight='bold', color=score_color, zorder=10)
     
-    # Section headers
-    ax.text(8, 84, 'Hematology & Chemistry Results', 
-           fontsize=14, fontweight='bold', zorder=10)
-    ax.text(56, 84, 'Differential & Urine Analysis', 
-           fontsize=14, fontweight='bold', zorder=10)
-    
     # Left section - Hematology tests with bar charts
     y_pos = 79
     bar_width = 18
     bar_height = 2.2
     
-    for test in hematology_tests[:13]:
+    # Bounds, fill ratios and colors for all shown tests in one go, in canonical units
+    shown = hematology_tests[:13]
+    factors = unit_factors([test.get('name', '') for test in shown], [test.get('unit', '') for test in shown])
+    if measurements is not None:
+        values, normal_mins, normal_maxs = (np.array(column[:13], dtype=float) for column in measurements)
+    else:
+        values = parse_lab_values(test.get('value', '') for test in shown) * factors
+        normal_mins, normal_maxs = RANGES.resolve_bounds(shown, context or report_context({}))
+    # Tests without a known range are drawn against 0-100
+    unknown = np.isnan(normal_mins) | np.isnan(normal_maxs)
+    normal_mins[unknown], normal_maxs[unknown] = PANEL_DEFAULT_RANGE
+    range_vals = normal_maxs - normal_mins
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Values above the range extend the bar by a quarter of the overshoot
+        fill_ratios = np.where(values <= normal_maxs, (values - normal_mins) / range_vals,
+                               1 + ((values - normal_maxs) / range_vals) * 0.25)
+    fill_ratios = np.clip(fill_ratios, 0, 1.2)
+    bar_colors = classify(values, normal_mins, normal_maxs).colors
+    has_bar = ~np.isnan(values) & (range_vals != 0)
+    
+    for idx, test in enumerate(shown):
         name = test.get('name', '')
         value = test.get('value', '')
         unit = test.get('unit', '').strip()
         status = test.get('status', 'NORMAL')
-        
-        # Get ranges
-        ranges = test.get('ranges', {})
-        ref_range = test.get('reference_range', '')
-        
-        if ranges:
-            normal_min = ranges.get('normal_min', 0)
-            normal_max = ranges.get('normal_max', 100)
-        elif ref_range:
-            try:
-                ref_clean = ref_range.strip().replace('\n', '')
-                parts = ref_clean.split('-')
-                if len(parts) >= 2:
-                    normal_min = float(parts[0].strip())
-                    normal_max = float(parts[1].strip())
-                else:
-                    normal_min, normal_max = 0, 100
-            except:
-                normal_min, normal_max = 0, 100
-        else:
-            normal_min, normal_max = 0, 100
+        normal_min, normal_max = normal_mins[idx], normal_maxs[idx]
         
         # Shorten name for display
         display_name = name[:28] if len(name) > 28 else name
@@ -156,31 +211,11 @@ def create_blood_panel_report(json_file_path, output_file='health_blood.png'):
                           linewidth=0.5, zorder=5)
         ax.add_patch(bg_bar)
         
-        # Draw filled bar based on value
-        val_numeric = parse_numeric_value(value)
-        if val_numeric is not None and normal_min != normal_max:
-            try:
-                range_val = normal_max - normal_min
-                
-                # Calculate fill percentage
-                if val_numeric <= normal_max:
-                    fill_ratio = (val_numeric - normal_min) / range_val
-                else:
-                    # Extend beyond for high values
-                    fill_ratio = 1 + ((val_numeric - normal_max) / range_val) * 0.25
-                
-                fill_ratio = max(0, min(fill_ratio, 1.2))
-                fill_width = bar_width * fill_ratio
-                
-                # Get color
-                bar_color = get_bar_color(val_numeric, normal_min, normal_max)
-                
-                # Draw filled portion
-                filled_bar = Rectangle((28, y_pos - bar_height/2), fill_width, bar_height, 
-                                      facecolor=bar_color, edgecolor='none', zorder=6)
-                ax.add_patch(filled_bar)
-            except:
-                pass
+        # Draw filled portion
+        if has_bar[idx]:
+            filled_bar = Rectangle((28, y_pos - bar_height/2), bar_width * fill_ratios[idx], bar_height, 
+                                  facecolor=bar_colors[idx], edgecolor='none', zorder=6)
+            ax.add_patch(filled_bar)
         
         # Value text with color based on status
         value_color = '#e74c3c' if status in ['HIGH', 'LOW', 'ABNORMAL'] else '#27ae60'
@@ -188,7 +223,8 @@ def create_blood_panel_report(json_file_path, output_file='health_blood.png'):
                fontsize=10, va='center', fontweight='bold', color=value_color, zorder=10)
         
         # Normal range text (smaller, gray)
-        range_text = f"{normal_min}-{normal_max}"
+        # Shown in the row's own unit, next to its value as reported
+        range_text = f"{normal_min / factors[idx]:g}-{normal_max / factors[idx]:g}"
         ax.text(51, y_pos, range_text, 
                fontsize=7.5, va='center', color='#888', zorder=10)
         
@@ -202,17 +238,9 @@ def create_blood_panel_report(json_file_path, output_file='health_blood.png'):
         
         y_pos -= 5.2
     
-    # Right section - Differential tests
-    y_pos = 79
-    diff_x = 62
-    
-    # Differential table header
-    ax.text(diff_x, y_pos, 'Polymorphs (%)', fontsize=9.5, zorder=10)
-    ax.text(diff_x + 20, y_pos, '4.0-10.0', fontsize=9.5, color='#666', zorder=10)
-    
-    y_pos -= 3.5
-    ax.text(diff_x, y_pos, 'Lymphocytes (%)', fontsize=9.5, zorder=10)
-    ax.text(diff_x + 15, y_pos, 'Eosinophils (%)', fontsize=9.5, zorder=10)
+    # Right section - Lymphocytes value
+    y_pos = DIFF_Y - 3.5
+    diff_x = DIFF_X
     
     # Find lymphocytes value
     for test in differential_tests:
@@ -224,74 +252,126 @@ def create_blood_panel_report(json_file_path, output_file='health_blood.png'):
                        fontsize=9.5, color='#e74c3c', fontweight='bold', zorder=10)
             else:
                 ax.text(diff_x + 30, y_pos, str(value), fontsize=9.5, zorder=10)
+
+def get_panel_template(dpi=300):
+    """Get the template figure and its static-layer background, drawn once per process"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
     
-    y_pos -= 3.5
-    ax.text(diff_x, y_pos, 'Monocytes (%)', fontsize=9.5, zorder=10)
-    ax.text(diff_x + 15, y_pos, 'Monocytes (%)', fontsize=9.5, zorder=10)
+    date_text = datetime.now().strftime('%B %d, %Y')
+    key = (dpi, date_text)
+    if key not in _TEMPLATE_CACHE:
+        # Kept outside pyplot so plt.close('all') in callers can't tear it down
+        fig = Figure(figsize=PANEL_FIGSIZE, facecolor='#e8e8e8', dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        fig.subplots_adjust(**TEMPLATE_MARGINS)
+        setup_panel_axes(ax)
+        draw_static_layer(ax, date_text)
+        fig.canvas.draw()
+        background = fig.canvas.copy_from_bbox(fig.bbox)
+        # Only the current day's template is kept
+        _TEMPLATE_CACHE.clear()
+        _TEMPLATE_CACHE[key] = (fig, ax, background)
+    return _TEMPLATE_CACHE[key]
+
+def render_from_template(output_file, health_score, hematology_tests, differential_tests, dpi=300,
+                         context=None, measurements=None):
+    """Blit the per-patient layer over the cached static background and save it as PNG
+
+    output_file is a path or a binary file-like object.
+    """
+    from PIL import Image
     
-    y_pos -= 3.5
-    ax.text(diff_x, y_pos, 'Baseln (%)', fontsize=9.5, zorder=10)
+    fig, ax, background = get_panel_template(dpi)
+    canvas = fig.canvas
+    canvas.restore_region(background)
     
-    # Urine Analysis section
-    y_pos -= 6
-    ax.text(diff_x, y_pos, 'Urine Analysis', 
-           fontsize=13, fontweight='bold', zorder=10)
+    static_artists = set(ax.get_children())
+    draw_patient_layer(ax, health_score, hematology_tests, differential_tests, context, measurements)
+    patient_artists = [a for a in ax.get_children() if a not in static_artists]
+    try:
+        for artist in sorted(patient_artists, key=lambda a: a.get_zorder()):
+            ax.draw_artist(artist)
+    finally:
+        # Leave the template holding only the static layer
+        for artist in patient_artists:
+            artist.remove()
     
-    # Urine table
-    y_pos -= 5
-    urine_data = [
-        ['Volume', 'Colour', 'Appearance'],
-        ['Reaction', 'Specific Gravity', 'Bile Salts'],
-        ['Protein', 'Bile Pigments', ''],
-        ['Red Cells', 'NIL', ''],
-        ['Fungus', 'Present (++)', ''],
-        ['Crystals', 'Bacteria', '']
-    ]
+    width, height = canvas.get_width_height()
+    image = Image.frombuffer('RGBA', (width, height), canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1)
+    image.convert('RGB').save(output_file, format='png', dpi=(dpi, dpi))
+
+def render_blood_panel(output_file, health_score, hematology_tests, differential_tests, context=None,
+                       use_template=False, format=None, measurements=None):
+    """Draw and save the panel for an already scored and sectioned report
+
+    measurements is passed on to draw_patient_layer(); see
+    create_blood_panel_report() for the other arguments.
+    """
+    format = get_format(output_file, format)
+    if use_template and format != 'png':
+        raise ValueError(f"Template mode only writes PNG, not '{format}'")
+    if use_template:
+        with span('blood.render_template'):
+            render_from_template(output_file, health_score, hematology_tests, differential_tests,
+                                 context=context, measurements=measurements)
+        return
     
-    for row in urine_data:
-        for i, param in enumerate(row):
-            if param:
-                x_pos = diff_x + i * 13
-                ax.text(x_pos, y_pos, param, fontsize=8.5, zorder=10)
-                if i == 2 and param:
-                    ax.text(x_pos + 9, y_pos, 'NORMAL', 
-                           fontsize=7.5, color='#666', zorder=10)
-        y_pos -= 3
+    # Create figure with light gray background; it is torn down once saved
+    with render_figure(PANEL_FIGSIZE, facecolor='#e8e8e8') as fig:
+        with span('blood.draw'):
+            ax = fig.add_subplot()
+            setup_panel_axes(ax)
+            draw_static_layer(ax, datetime.now().strftime('%B %d, %Y'))
+            draw_patient_layer(ax, health_score, hematology_tests, differential_tests, context,
+                               measurements)
+        
+        # Save with tight layout
+        with span('blood.layout'):
+            fig.tight_layout()
+        with span('blood.save', figure=fig):
+            fig.savefig(output_file, format=format, dpi=300, bbox_inches='tight', 
+                       facecolor='#e8e8e8', edgecolor='none')
+
+def create_blood_panel_report(json_file_path, output_file='health_blood.png', use_template=False,
+                              format=None):
+    """Generate professional blood panel report (from a JSON path or an already-parsed report)
+
+    output_file is a path or a binary file-like object; format defaults to
+    the path's extension, else PNG. With use_template, the static layer is
+    rasterized once per process and only the per-patient artists are drawn
+    on top of it for each report (PNG only).
+    """
+    format = get_format(output_file, format)
+    if use_template and format != 'png':
+        raise ValueError(f"Template mode only writes PNG, not '{format}'")
+    # Load JSON data
+    with span('blood.load'):
+        data = load_report(json_file_path)
     
-    # Legend at bottom left
-    legend_y = 14
-    ax.add_patch(Rectangle((7, legend_y - 0.7), 1.2, 1.2, 
-                          facecolor='#3498db', edgecolor='none', zorder=5))
-    ax.text(9, legend_y, 'Your Result', fontsize=9.5, va='center', zorder=10)
+    tests = data.tests
+    context = report_context(data)
     
-    ax.add_patch(Rectangle((7, legend_y - 3.5), 1.2, 1.2, 
-                          facecolor='#27ae60', edgecolor='none', zorder=5))
-    ax.text(9, legend_y - 2.8, 'Healthy Reference Range', 
-           fontsize=9.5, va='center', zorder=10)
+    # Calculate health score
+    health_score = calculate_health_score(tests)
     
-    # Warning banner at bottom
-    warning_box = FancyBboxPatch((6, 4), 88, 4.5, 
-                                boxstyle="round,pad=0.4",
-                                facecolor='#e74c3c', edgecolor='none', zorder=5)
-    ax.add_patch(warning_box)
+    # Categorize tests
+    sections = {HEMATOLOGY: [], DIFFERENTIAL: [], URINE: []}
     
-    ax.text(50, 6.8, 
-           'IMPORTANT: Several results are HIGH. Consult with a physician for accurate interpretation and', 
-           ha='center', fontsize=10.5, color='white', fontweight='bold', zorder=10)
-    ax.text(50, 5.2, 'recommendations.', 
-           ha='center', fontsize=10.5, color='white', fontweight='bold', zorder=10)
+    with span('blood.categorize', tests=len(tests)):
+        for test in tests:
+            if test.section is not None:
+                sections[test.section].append(test)
     
-    # Save with tight layout
-    plt.tight_layout()
-    plt.savefig(output_file, dpi=300, bbox_inches='tight', 
-               facecolor='#e8e8e8', edgecolor='none')
-    plt.close()
+    render_blood_panel(output_file, health_score, sections[HEMATOLOGY], sections[DIFFERENTIAL], context,
+                       use_template, format)
     
     # Print summary
-    print(f"✓ Blood panel report saved to: {output_file}")
+    print(f"✓ Blood panel report saved to: {target_name(output_file)}")
     print(f"✓ Overall Health Score: {health_score}%")
     
-    abnormal = [t for t in tests if t.get('status') in ['HIGH', 'LOW', 'ABNORMAL']]
+    abnormal = [t for t in tests if t.code in ABNORMAL_CODES]
     if abnormal:
         print(f"\n⚠ ATTENTION REQUIRED - Abnormal Results Found: {len(abnormal)}")
         print("=" * 60)
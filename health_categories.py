@@ -0,0 +1,100 @@
+import re
+from health_names import OTHER_TEST, TEST_NAMES, normalize_name
+
+# Radar categories
+BLOOD = 'Blood Health'
+METABOLIC = 'Metabolic Health'
+IMMUNE = 'Immune Function'
+KIDNEY = 'Kidney Function'
+LIVER = 'Liver Health'
+INFLAMMATION = 'Inflammation'
+CATEGORIES = [BLOOD, METABOLIC, IMMUNE, KIDNEY, LIVER, INFLAMMATION]
+
+# Blood panel sections
+HEMATOLOGY = 'hematology'
+DIFFERENTIAL = 'differential'
+URINE = 'urine'
+
+# (radar category, blood panel section, name keywords), highest priority first.
+# A test name takes the first rule with any keyword as a substring, so the
+# radar and the blood panel always agree on where a test belongs.
+CATEGORY_RULES = [
+    (BLOOD, HEMATOLOGY, ['hemoglobin', 'rbc', 'h.ct', 'hct', 'mcv', 'mch', 'platelet', 'rdw']),
+    (METABOLIC, HEMATOLOGY, ['glucose', 'hba1c', 'sugar']),
+    (IMMUNE, HEMATOLOGY, ['wbc', 'tlc', 'hbsag', 'hiv']),
+    (IMMUNE, DIFFERENTIAL, ['polymorph', 'lymphocyte', 'eosinophil', 'monocyte', 'basophil']),
+    (KIDNEY, URINE, ['urine', 'protein', 'creatinine', 'urea', 'kidney']),
+    # Urine examination findings, ahead of the liver abbreviations ('casts' contains 'ast')
+    (None, URINE, ['pus', 'epithelial', 'cast', 'fungus', 'crystal', 'bacteria',
+                   'specific gravity', 'volume', 'colour', 'appearance', 'reaction']),
+    (LIVER, URINE, ['bile']),
+    (LIVER, None, ['bilirubin', 'alt', 'ast', 'liver', 'sgpt', 'sgot']),
+    (INFLAMMATION, HEMATOLOGY, ['esr']),
+    (INFLAMMATION, None, ['crp', 'inflammation'])
+]
+
+class KeywordIndex:
+    """Classify test names by keyword rules with one compiled pattern
+
+    All keywords go into a single alternation, ordered by rule priority and
+    wrapped in a lookahead so overlapping matches are all seen. A name is
+    matched lowercased, then, if nothing matched, with its punctuation and
+    spaces dropped ('M.C.V' as 'mcv'). With a names index, the canonical
+    spelling is matched and results are memoized per test id, so every
+    alias ('MCV', 'Neutrophils', 'WBC (Urine)') lands where the test it
+    names does; without one (or for names past the index's limit), the
+    name itself is matched, memoized only without an index.
+    """
+
+    def __init__(self, rules, names=None):
+        self.rules = rules
+        self.names = names
+        self._rule_index = {}
+        for idx, (_, _, keywords) in enumerate(rules):
+            for keyword in keywords:
+                self._rule_index.setdefault(keyword, idx)
+        # At each position the alternation takes the first (highest priority) keyword that matches
+        keywords = sorted(self._rule_index, key=self._rule_index.get)
+        self._pattern = re.compile('(?=(' + '|'.join(map(re.escape, keywords)) + '))')
+        self._memo = {}
+
+    def lookup(self, name):
+        """Get (category, section) for a test name; either may be None"""
+        key = name if self.names is None else self.names.test_id(name)
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        if self.names is not None:
+            if key == OTHER_TEST:
+                return self._classify(name)
+            name = self.names.names[key]
+        result = self._memo[key] = self._classify(name)
+        return result
+
+    def _classify(self, name):
+        """Get (category, section) for a name, unmemoized"""
+        best = self._match(name.lower())
+        if best is None:
+            best = self._match(normalize_name(name))
+        return self.rules[best][:2] if best is not None else (None, None)
+
+    def _match(self, text):
+        """Get the index of the highest priority rule matching a lowercase name, or None"""
+        best = None
+        for match in self._pattern.finditer(text):
+            idx = self._rule_index[match.group(1)]
+            if best is None or idx < best:
+                best = idx
+        return best
+
+    def category(self, name):
+        """Get the radar category for a test name, or None"""
+        return self.lookup(name)[0]
+
+    def section(self, name):
+        """Get the blood panel section for a test name, or None"""
+        return self.lookup(name)[1]
+
+# Shared index used by the generators
+TEST_CATEGORIES = KeywordIndex(CATEGORY_RULES, TEST_NAMES)
@@ -0,0 +1,57 @@
+from collections import namedtuple
+import numpy as np
+
+# Classification codes
+LOW, NORMAL, HIGH, UNKNOWN = 0, 1, 2, 3
+CODE_NAMES = np.array(['LOW', 'NORMAL', 'HIGH', 'UNKNOWN'])
+
+# Bar colors per code: orange for low, green for normal, red for high, gray when unknown
+CODE_COLORS = np.array(['#f39c12', '#27ae60', '#e74c3c', '#95a5a6'])
+
+# Scores per code, matching the radar chart's status scores (HIGH/LOW = 70)
+CODE_SCORES = np.array([70, 100, 70, 50])
+
+# Scores per reported status string; anything else scores DEFAULT_SCORE
+STATUS_SCORES = {'NORMAL': 100, 'HIGH': 70, 'LOW': 70, 'ABNORMAL': 40}
+DEFAULT_SCORE = 50
+
+# Codes for reported status strings: LOW/NORMAL/HIGH as above, ABNORMAL for
+# any other reported status, MISSING where a report lacks the test
+ABNORMAL = 4
+MISSING = -1
+STATUS_CODES = {'LOW': LOW, 'NORMAL': NORMAL, 'HIGH': HIGH}
+
+Classification = namedtuple('Classification', ['codes', 'colors', 'scores'])
+
+def classify_values(values, mins, maxs):
+    """Get LOW/NORMAL/HIGH codes for arrays of values against (min, max) bounds
+
+    Inputs broadcast against each other; NaN in a value or bound gives UNKNOWN.
+    """
+    values = np.asarray(values, dtype=float)
+    mins = np.asarray(mins, dtype=float)
+    maxs = np.asarray(maxs, dtype=float)
+    with np.errstate(invalid='ignore'):
+        codes = np.where(values < mins, LOW, np.where(values > maxs, HIGH, NORMAL))
+    unknown = np.isnan(values) | np.isnan(mins) | np.isnan(maxs)
+    return np.where(unknown, UNKNOWN, codes).astype(np.int8)
+
+def classify(values, mins, maxs):
+    """Classify a whole batch in one call, returning codes, colors and scores"""
+    codes = classify_values(values, mins, maxs)
+    return Classification(codes, CODE_COLORS[codes], CODE_SCORES[codes])
+
+def status_codes(statuses):
+    """Map a column of reported status strings to status codes"""
+    lookup = {status: STATUS_CODES.get(status, ABNORMAL) for status in set(statuses)}
+    return np.fromiter((lookup[status] for status in statuses), dtype=np.int8, count=len(statuses))
+
+def score_statuses(statuses):
+    """Score an array of reported status strings (NORMAL=100, HIGH/LOW=70, ABNORMAL=40)"""
+    statuses = np.asarray(statuses, dtype=object)
+    if statuses.size == 0:
+        return np.zeros(statuses.shape, dtype=np.int16)
+    # Look up each distinct status once, then scatter back to the rows
+    unique, inverse = np.unique(statuses.astype(str), return_inverse=True)
+    lookup = np.array([STATUS_SCORES.get(status, DEFAULT_SCORE) for status in unique], dtype=np.int16)
+    return lookup[inverse].reshape(statuses.shape)
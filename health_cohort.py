@@ -0,0 +1,339 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from health_categories import CATEGORIES, TEST_CATEGORIES
+from health_classify import LOW, HIGH, ABNORMAL, MISSING, STATUS_SCORES, DEFAULT_SCORE, status_codes
+from health_columnar import ColumnarStore, is_columnar_store
+from health_names import OTHER_TEST, TEST_NAMES
+from health_units import normalize_values
+from health_values import parse_lab_values
+import health_trends_generator as trends
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+def latest_report(reports):
+    """Pick a patient's most recent report (the last one when undated)"""
+    dates = [trends.get_report_date(report) for report in reports]
+    if all(d is not None for d in dates):
+        return reports[max(range(len(reports)), key=dates.__getitem__)]
+    return reports[-1]
+
+class Cohort:
+    """Columnar view of a population, one row per patient
+
+    values and codes are (patients, tests) arrays over `tests` (NaN and
+    MISSING where a patient lacks the test), category_scores is
+    (patients, categories) with NaN where no test falls in a category,
+    and overall_scores averages each row's category scores like the
+    radar chart does.
+    """
+
+    def __init__(self, patient_ids, tests, values, codes, category_scores):
+        self.patient_ids = patient_ids
+        self.tests = tests
+        self.values = values
+        self.codes = codes
+        self.category_scores = category_scores
+        with np.errstate(invalid='ignore'):
+            self.overall_scores = np.nanmean(category_scores, axis=1) if len(patient_ids) else np.empty(0)
+
+    def __len__(self):
+        return len(self.patient_ids)
+
+    def percentiles(self, q=PERCENTILES):
+        """Get per-test value percentiles as a (len(q), tests) array"""
+        if not len(self):
+            return np.full((len(q), len(self.tests)), np.nan)
+        with np.errstate(invalid='ignore'):
+            return np.nanpercentile(self.values, q, axis=0)
+
+    def abnormal_rates(self):
+        """Get per-test reported counts and low/high/abnormal rates among reported values"""
+        reported = (self.codes != MISSING).sum(axis=0)
+        low = (self.codes == LOW).sum(axis=0)
+        high = (self.codes == HIGH).sum(axis=0)
+        other = (self.codes == ABNORMAL).sum(axis=0)
+        denominator = np.maximum(reported, 1)
+        return {
+            'reported': reported,
+            'low': low / denominator,
+            'high': high / denominator,
+            'abnormal': (low + high + other) / denominator
+        }
+
+    def category_distributions(self, q=PERCENTILES):
+        """Get category-score percentiles as (len(q), categories), plus mean and patient counts"""
+        scored = ~np.isnan(self.category_scores)
+        with np.errstate(invalid='ignore'):
+            percentiles = (np.nanpercentile(self.category_scores, q, axis=0) if len(self)
+                           else np.full((len(q), len(CATEGORIES)), np.nan))
+            means = np.nanmean(self.category_scores, axis=0) if len(self) else np.full(len(CATEGORIES), np.nan)
+        return percentiles, means, scored.sum(axis=0)
+
+    def summary(self, q=PERCENTILES):
+        """Collect every statistic into a JSON-serializable dict"""
+        def clean(x):
+            return None if np.isnan(x) else round(float(x), 4)
+
+        value_percentiles = self.percentiles(q)
+        rates = self.abnormal_rates()
+        category_percentiles, category_means, category_counts = self.category_distributions(q)
+        with np.errstate(invalid='ignore'):
+            overall = np.nanpercentile(self.overall_scores, q) if len(self) else np.full(len(q), np.nan)
+        return {
+            'patients': len(self),
+            'tests': {
+                test: {
+                    'reported': int(rates['reported'][i]),
+                    'percentiles': {str(p): clean(value_percentiles[j, i]) for j, p in enumerate(q)},
+                    'low_rate': clean(rates['low'][i]),
+                    'high_rate': clean(rates['high'][i]),
+                    'abnormal_rate': clean(rates['abnormal'][i])
+                } for i, test in enumerate(self.tests)
+            },
+            'categories': {
+                category: {
+                    'patients': int(category_counts[i]),
+                    'mean': clean(category_means[i]),
+                    'percentiles': {str(p): clean(category_percentiles[j, i]) for j, p in enumerate(q)}
+                } for i, category in enumerate(CATEGORIES)
+            },
+            'overall_score_percentiles': {str(p): clean(overall[j]) for j, p in enumerate(q)}
+        }
+
+class CohortBuilder:
+    """Accumulate reports into a Cohort, parsing in chunks
+
+    Rows are buffered as flat (row, column, raw value, status) lists and
+    converted to arrays every chunk_size patients, so memory stays close
+    to the final matrix size and each distinct value string is parsed
+    once per chunk.
+    """
+
+    def __init__(self, tests=None, chunk_size=10000):
+        self.tests = list(tests or trends.key_tests)
+        self.chunk_size = chunk_size
+        self._columns = {TEST_NAMES.test_id(name): idx for idx, name in enumerate(self.tests)}
+        self._columns.pop(OTHER_TEST, None)
+        self._categories = {category: idx for idx, category in enumerate(CATEGORIES)}
+        self._patient_ids = []
+        self._chunks = []
+        self._reset_buffers()
+
+    def _reset_buffers(self):
+        self._rows = 0
+        self._cells = ([], [], [], [], [])  # row, column, raw value, unit, status
+        self._scored = ([], [], [])  # row, category, status
+
+    def add(self, patient_id, report):
+        """Add one patient's report as a row"""
+        row = self._rows
+        cell_rows, cell_columns, cell_values, cell_units, cell_statuses = self._cells
+        score_rows, score_categories, score_statuses = self._scored
+        for test in report.get('tests', []):
+            name = test.get('name', '')
+            status = test.get('status', 'NORMAL')
+            column = self._columns.get(TEST_NAMES.test_id(name))
+            if column is not None:
+                cell_rows.append(row)
+                cell_columns.append(column)
+                cell_values.append(test.get('value'))
+                cell_units.append(test.get('unit', ''))
+                cell_statuses.append(status)
+            category = TEST_CATEGORIES.category(name)
+            if category is not None:
+                score_rows.append(row)
+                score_categories.append(self._categories[category])
+                score_statuses.append(status)
+        self._patient_ids.append(patient_id)
+        self._rows += 1
+        if self._rows >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        """Convert the buffered rows into a chunk of arrays"""
+        n_rows, n_tests, n_categories = self._rows, len(self.tests), len(CATEGORIES)
+        if not n_rows:
+            return
+        cell_rows, cell_columns, cell_values, cell_units, cell_statuses = self._cells
+        values = np.full((n_rows, n_tests), np.nan)
+        codes = np.full((n_rows, n_tests), MISSING, dtype=np.int8)
+        rows = np.array(cell_rows, dtype=np.intp)
+        columns = np.array(cell_columns, dtype=np.intp)
+        values[rows, columns] = normalize_values(parse_lab_values(cell_values),
+                                                 [self.tests[column] for column in cell_columns], cell_units)
+        codes[rows, columns] = status_codes(cell_statuses)
+
+        # Category means via one bincount over (row, category) cells
+        score_rows, score_categories, score_statuses = self._scored
+        lookup = {status: STATUS_SCORES.get(status, DEFAULT_SCORE) for status in set(score_statuses)}
+        scores = np.fromiter((lookup[s] for s in score_statuses), dtype=float, count=len(score_statuses))
+        cells = np.array(score_rows, dtype=np.intp) * n_categories + np.array(score_categories, dtype=np.intp)
+        totals = np.bincount(cells, weights=scores, minlength=n_rows * n_categories)
+        counts = np.bincount(cells, minlength=n_rows * n_categories)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            category_scores = np.round(totals / counts, 1).reshape(n_rows, n_categories)
+
+        self._chunks.append((values, codes, category_scores))
+        self._reset_buffers()
+
+    def build(self):
+        """Finish the last chunk and return the Cohort"""
+        self._flush()
+        if self._chunks:
+            values, codes, category_scores = (np.concatenate(parts) for parts in zip(*self._chunks))
+        else:
+            values = np.empty((0, len(self.tests)))
+            codes = np.empty((0, len(self.tests)), dtype=np.int8)
+            category_scores = np.empty((0, len(CATEGORIES)))
+        return Cohort(self._patient_ids, self.tests, values, codes, category_scores)
+
+def build_cohort(patients, tests=None):
+    """Build a Cohort from (patient_id, reports) pairs, using each patient's latest report
+
+    Reports may be JSON paths or already-parsed report dicts.
+    """
+    builder = CohortBuilder(tests)
+    for patient_id, reports in patients:
+        reports = trends.load_reports(reports)
+        if reports:
+            builder.add(patient_id, latest_report(reports))
+    return builder.build()
+
+def build_cohort_from_store(store, tests=None):
+    """Build a Cohort straight from a ColumnarStore's memory-mapped columns
+
+    No JSON is read and no value is parsed: cells are scattered into the
+    matrix by (patient row, test column), and category scores come from
+    per-string lookup tables and one bincount.
+    """
+    tests = list(tests or trends.key_tests)
+    patient_ids, latest = store.latest_reports()
+    n_patients, n_categories = len(patient_ids), len(CATEGORIES)
+
+    # Result row -> patient row (-1 for reports that aren't a patient's latest)
+    patient_row = np.full(store.n_reports, -1, dtype=np.intp)
+    patient_row[latest] = np.arange(n_patients)
+    rows = patient_row[store.rows['report']]
+    names = np.asarray(store.rows['name'])
+
+    # String id -> test column / category / status score, filled for the ids actually used
+    column_of = TEST_NAMES.column_map(store.strings, names, tests)
+    category_of = np.full(len(store.strings), -1, dtype=np.intp)
+    for name_id in np.unique(names).tolist():
+        name = store.strings[name_id]
+        category = TEST_CATEGORIES.category(name)
+        category_of[name_id] = CATEGORIES.index(category) if category is not None else -1
+    score_of = np.zeros(len(store.strings))
+    statuses = np.asarray(store.rows['status'])
+    for status_id in np.unique(statuses).tolist():
+        score_of[status_id] = STATUS_SCORES.get(store.strings[status_id], DEFAULT_SCORE)
+
+    values = np.full((n_patients, len(tests)), np.nan)
+    codes = np.full((n_patients, len(tests)), MISSING, dtype=np.int8)
+    columns = column_of[names]
+    cells = (rows >= 0) & (columns >= 0)
+    values[rows[cells], columns[cells]] = store.rows['value'][cells] * store.unit_factors()[cells]
+    codes[rows[cells], columns[cells]] = store.rows['code'][cells]
+
+    categories = category_of[names]
+    scored = (rows >= 0) & (categories >= 0)
+    flat = rows[scored] * n_categories + categories[scored]
+    totals = np.bincount(flat, weights=score_of[statuses[scored]], minlength=n_patients * n_categories)
+    counts = np.bincount(flat, minlength=n_patients * n_categories)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        category_scores = np.round(totals / counts, 1).reshape(n_patients, n_categories)
+    return Cohort(patient_ids, tests, values, codes, category_scores)
+
+def render_cohort_summary(cohort, output_file='cohort_summary.png'):
+    """Draw abnormal rates, category-score distributions and the overall score histogram"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from health_runtime import get_pyplot, get_seaborn
+
+    plt = get_pyplot()
+    sns = get_seaborn()
+    rates = cohort.abnormal_rates()
+    percentiles, means, counts = cohort.category_distributions()
+
+    with sns.axes_style(trends.TREND_STYLE), plt.rc_context(trends.TREND_RC):
+        fig = Figure(figsize=(20, 14), facecolor='#f8f9fa')
+        FigureCanvasAgg(fig)
+        fig.suptitle(f'Cohort Summary - {len(cohort):,} patients', fontsize=22, fontweight='bold')
+        grid = fig.add_gridspec(2, 2, width_ratios=[1.2, 1])
+
+        # Abnormal rates per test, split into low / high / other
+        ax = fig.add_subplot(grid[:, 0])
+        y = np.arange(len(cohort.tests))
+        other = rates['abnormal'] - rates['low'] - rates['high']
+        ax.barh(y, rates['low'] * 100, color='#f39c12', label='Low')
+        ax.barh(y, rates['high'] * 100, left=rates['low'] * 100, color='#e74c3c', label='High')
+        ax.barh(y, other * 100, left=(rates['low'] + rates['high']) * 100, color='#95a5a6', label='Other abnormal')
+        ax.set_yticks(y, [f'{test} (n={n:,})' for test, n in zip(cohort.tests, rates['reported'])])
+        ax.invert_yaxis()
+        ax.set_xlabel('% of patients with the test reported')
+        ax.set_title('Abnormal Rate by Test', fontsize=14, fontweight='bold')
+        ax.legend(loc='lower right')
+
+        # Category scores as boxes built from the precomputed percentiles (5/25/50/75/95)
+        ax = fig.add_subplot(grid[0, 1])
+        boxes = [{'label': f'{category}\n(n={n:,})', 'whislo': p[0], 'q1': p[1], 'med': p[2],
+                  'q3': p[3], 'whishi': p[4], 'mean': mean, 'fliers': []}
+                 for category, p, mean, n in zip(CATEGORIES, percentiles.T, means, counts) if n]
+        if boxes:
+            ax.bxp(boxes, showmeans=True, patch_artist=True,
+                   boxprops=dict(facecolor='#3498db', alpha=0.4))
+        ax.set_ylim(0, 105)
+        ax.tick_params(axis='x', labelsize=9)
+        ax.set_ylabel('Category score')
+        ax.set_title('Category Score Distribution (5-95th percentile whiskers)', fontsize=14, fontweight='bold')
+
+        # Overall score histogram
+        ax = fig.add_subplot(grid[1, 1])
+        scores = cohort.overall_scores[~np.isnan(cohort.overall_scores)]
+        hist, edges = np.histogram(scores, bins=20, range=(0, 100))
+        ax.bar(edges[:-1], hist, width=np.diff(edges), align='edge', color='#27ae60', edgecolor='white')
+        ax.set_xlabel('Overall health score')
+        ax.set_ylabel('Patients')
+        ax.set_title('Overall Score Distribution', fontsize=14, fontweight='bold')
+
+        fig.tight_layout(rect=[0, 0, 1, 0.95])
+        fig.savefig(output_file, dpi=150, facecolor='#f8f9fa')
+    print(f"✓ Cohort summary chart saved to: {output_file}")
+    return fig
+
+def main(argv=None):
+    from health_batch import discover_jobs
+
+    parser = argparse.ArgumentParser(description='Compute population statistics across many patients')
+    parser.add_argument('source', help='directory of patients, manifest file, JSONL dump or columnar store')
+    parser.add_argument('-o', '--output-dir', default='cohort', help='where to write the summary')
+    parser.add_argument('--no-chart', action='store_true', help='only write cohort_summary.json')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if is_columnar_store(args.source):
+        cohort = build_cohort_from_store(ColumnarStore(args.source))
+    else:
+        cohort = build_cohort(discover_jobs(args.source))
+    print(f"Loaded {len(cohort):,} patients in {time.perf_counter() - start:.1f}s")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    summary_file = os.path.join(args.output_dir, 'cohort_summary.json')
+    with open(summary_file, 'w') as f:
+        json.dump(cohort.summary(), f, indent=2)
+    print(f"✓ Cohort statistics saved to: {summary_file}")
+
+    if not args.no_chart:
+        import health_runtime
+        health_runtime.enable_headless()
+        render_cohort_summary(cohort, os.path.join(args.output_dir, 'cohort_summary.png'))
+    return 0
+
+
+# Usage: python health_cohort.py SOURCE -o cohort/
+if __name__ == "__main__":
+    sys.exit(main())
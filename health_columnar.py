@@ -0,0 +1,260 @@
+import argparse
+import json
+import os
+import sys
+import time
+from array import array
+import numpy as np
+from health_classify import STATUS_CODES, ABNORMAL
+from health_ranges import stated_range
+from health_units import unit_factor
+from health_values import parse_lab_value
+import health_trends_generator as trends
+
+# Bump when the layout or value parsing changes; older stores must be rebuilt
+STORE_VERSION = 2
+
+# One entry per test result, in report order: (file name, dtype)
+ROW_COLUMNS = {
+    'report': np.int32,     # Report index
+    'name': np.int32,       # String id of the test name
+    'value': np.float64,    # Parsed numeric value (NaN when not numeric)
+    'raw': np.int32,        # String id of the value as reported
+    'unit': np.int32,       # String id of the unit
+    'status': np.int32,     # String id of the reported status
+    'code': np.int8,        # Status code (health_classify.status_codes)
+    'range_min': np.float64,  # Range the report states (NaN when none)
+    'range_max': np.float64
+}
+
+# patient_info fields kept, each as a string id column 'info_<field>'
+INFO_FIELDS = ['name', 'age', 'sex', 'registration_number', 'collection_date',
+               'reporting_date', 'lab_name']
+
+# One entry per report
+REPORT_COLUMNS = {
+    'patient': np.int32,    # String id of the patient id
+    'date': 'datetime64[D]',  # Collection date (NaT when undated)
+    'offset': np.int64,     # First row of the report; one extra entry closes the last report
+    **{'info_' + field: np.int32 for field in INFO_FIELDS}
+}
+
+_NAT = np.iinfo(np.int64).min
+_EPOCH = np.datetime64('1970-01-01', 'D').astype(object)
+
+def is_columnar_store(path):
+    """Check whether a path is a store written by write_store()"""
+    return os.path.isfile(os.path.join(path, 'strings.json'))
+
+class StoreWriter:
+    """Append reports to compact typed buffers, then write .npy columns
+
+    Text (test names, units, statuses, raw values, patient fields) is
+    interned into one string table and stored as integer ids; the
+    meaning/tips prose is dropped.
+    """
+
+    def __init__(self):
+        self.strings = {}
+        self._row_arrays = {name: array('d' if np.dtype(dtype).kind == 'f' else 'b' if dtype is np.int8 else 'i')
+                            for name, dtype in ROW_COLUMNS.items()}
+        self._report_arrays = {name: array('q') for name in REPORT_COLUMNS}
+        self._n_reports = 0
+        self._n_rows = 0
+        self._parsed = {}
+
+    def intern(self, text):
+        """Get the string id of a piece of text (None is kept as null)"""
+        text = None if text is None else str(text)
+        string_id = self.strings.get(text)
+        if string_id is None:
+            string_id = self.strings[text] = len(self.strings)
+        return string_id
+
+    def add(self, patient_id, report):
+        """Append one report for a patient"""
+        rows = self._row_arrays
+        reports = self._report_arrays
+        info = report.get('patient_info') or {}
+        date = trends.get_report_date(report)
+
+        reports['patient'].append(self.intern(patient_id))
+        reports['date'].append((date.date() - _EPOCH).days if date else _NAT)
+        reports['offset'].append(self._n_rows)
+        for field in INFO_FIELDS:
+            reports['info_' + field].append(self.intern(info.get(field)))
+
+        for test in report.get('tests', []):
+            raw = test.get('value')
+            # Values repeat heavily across reports, so parse each distinct one once
+            key = raw if isinstance(raw, (str, int, float)) else repr(raw)
+            value = self._parsed.get(key)
+            if value is None:
+                parsed = parse_lab_value(raw)
+                value = self._parsed[key] = np.nan if parsed is None else parsed
+            status = test.get('status', 'NORMAL')
+            bounds = stated_range(test) or (np.nan, np.nan)
+
+            rows['report'].append(self._n_reports)
+            rows['name'].append(self.intern(test.get('name', '')))
+            rows['value'].append(value)
+            rows['raw'].append(self.intern(raw))
+            rows['unit'].append(self.intern(test.get('unit', '')))
+            rows['status'].append(self.intern(status))
+            rows['code'].append(STATUS_CODES.get(status, ABNORMAL))
+            rows['range_min'].append(bounds[0])
+            rows['range_max'].append(bounds[1])
+            self._n_rows += 1
+        self._n_reports += 1
+
+    def write(self, path):
+        """Write the columns and string table to a store directory"""
+        os.makedirs(path, exist_ok=True)
+        for name, dtype in ROW_COLUMNS.items():
+            column = np.frombuffer(self._row_arrays[name], dtype=self._row_arrays[name].typecode)
+            np.save(os.path.join(path, f'row_{name}.npy'), column.astype(dtype, copy=False))
+        self._report_arrays['offset'].append(self._n_rows)
+        for name, dtype in REPORT_COLUMNS.items():
+            column = np.frombuffer(self._report_arrays[name], dtype=np.int64)
+            column = column.view(dtype) if name == 'date' else column.astype(dtype)
+            np.save(os.path.join(path, f'report_{name}.npy'), column)
+        # Written last, so a store is only recognized once every column is there
+        with open(os.path.join(path, 'strings.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': STORE_VERSION, 'reports': self._n_reports, 'rows': self._n_rows,
+                       'strings': list(self.strings)}, f, ensure_ascii=False)
+
+def write_store(patients, path):
+    """Convert (patient_id, reports) pairs to a store; reports may be paths or dicts
+
+    Returns (patients, reports) counts.
+    """
+    writer = StoreWriter()
+    n_patients = 0
+    for patient_id, reports in patients:
+        for report in trends.load_reports(reports):
+            writer.add(patient_id, report)
+        n_patients += 1
+    writer.write(path)
+    return n_patients, writer._n_reports
+
+class ColumnarStore:
+    """Read-only view of a store with every column memory-mapped
+
+    rows[name] and reports[name] are numpy arrays backed by the .npy
+    files, so numeric work reads them without copying or parsing;
+    strings maps ids back to text.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'strings.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != STORE_VERSION:
+            raise ValueError(f"Store '{path}' has version {meta.get('version')}, expected {STORE_VERSION}")
+        self.strings = meta['strings']
+        self._string_ids = None
+        self._unit_factors = None
+        self.rows = {name: np.load(os.path.join(path, f'row_{name}.npy'), mmap_mode='r')
+                     for name in ROW_COLUMNS}
+        self.reports = {name: np.load(os.path.join(path, f'report_{name}.npy'), mmap_mode='r')
+                        for name in REPORT_COLUMNS}
+        self.n_reports = meta['reports']
+        self.n_rows = meta['rows']
+
+    def string_id(self, text):
+        """Get the id of a string, or None when the store never saw it"""
+        if self._string_ids is None:
+            self._string_ids = {text: idx for idx, text in enumerate(self.strings)}
+        return self._string_ids.get(text)
+
+    def unit_factors(self):
+        """Per-row factors converting values and stated ranges to canonical units
+
+        Each distinct (test name, unit) pair in the store is resolved once,
+        then scattered to the rows; the result is cached.
+        """
+        if self._unit_factors is None:
+            n_strings = len(self.strings)
+            pairs = np.asarray(self.rows['name'], dtype=np.int64) * n_strings + np.asarray(self.rows['unit'])
+            unique, inverse = np.unique(pairs, return_inverse=True)
+            lookup = np.array([unit_factor(self.strings[pair // n_strings], self.strings[pair % n_strings] or '')
+                               for pair in unique.tolist()], dtype=float)
+            self._unit_factors = lookup[inverse]
+        return self._unit_factors
+
+    def patients(self):
+        """Get (patient ids, report indices per patient), patients in order of first appearance"""
+        patient_ids = np.asarray(self.reports['patient'])
+        unique, first, inverse = np.unique(patient_ids, return_index=True, return_inverse=True)
+        order = np.argsort(first, kind='stable')
+        # Stable sort keeps each patient's reports in stored order
+        by_patient = np.argsort(inverse, kind='stable')
+        splits = np.cumsum(np.bincount(inverse, minlength=len(unique)))[:-1]
+        groups = np.split(by_patient, splits)
+        return [self.strings[unique[i]] for i in order], [groups[i] for i in order]
+
+    def latest_reports(self):
+        """Get (patient ids, index of each patient's latest report)
+
+        The latest report is the one with the latest date; undated reports
+        sort before dated ones, and ties go to the last one stored.
+        """
+        patient_ids = np.asarray(self.reports['patient'])
+        dates = np.asarray(self.reports['date']).view(np.int64)
+        order = np.lexsort((np.arange(len(patient_ids)), dates, patient_ids))
+        sorted_patients = patient_ids[order]
+        last = np.flatnonzero(np.append(sorted_patients[1:] != sorted_patients[:-1], True))
+        latest = order[last]
+        # Keep patients in order of first appearance
+        _, first = np.unique(patient_ids, return_index=True)
+        latest = latest[np.argsort(first, kind='stable')]
+        return [self.strings[patient_ids[i]] for i in latest], latest
+
+    def report(self, idx):
+        """Rebuild one report as a dict the generators accept (without the prose)"""
+        strings = self.strings
+        reports = self.reports
+        start, end = reports['offset'][idx], reports['offset'][idx + 1]
+        rows = {name: column[start:end] for name, column in self.rows.items()}
+        tests = []
+        for i in range(end - start):
+            test = {
+                'name': strings[rows['name'][i]],
+                'value': strings[rows['raw'][i]],
+                'unit': strings[rows['unit'][i]],
+                'status': strings[rows['status'][i]]
+            }
+            if not np.isnan(rows['range_min'][i]):
+                test['ranges'] = {'normal_min': float(rows['range_min'][i]),
+                                  'normal_max': float(rows['range_max'][i])}
+            tests.append(test)
+        return {
+            'patient_info': {field: strings[reports['info_' + field][idx]] for field in INFO_FIELDS},
+            'tests': tests
+        }
+
+    def iter_patients(self):
+        """Yield (patient_id, reports) with reports rebuilt from the columns"""
+        patient_ids, groups = self.patients()
+        for patient_id, indices in zip(patient_ids, groups):
+            yield patient_id, [self.report(idx) for idx in indices]
+
+def main(argv=None):
+    from health_batch import discover_jobs
+
+    parser = argparse.ArgumentParser(description='Convert report JSON to a memory-mappable columnar store')
+    parser.add_argument('source', help='directory of patients, manifest file or JSONL dump')
+    parser.add_argument('-o', '--output', required=True, help='store directory to write')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    n_patients, n_reports = write_store(discover_jobs(args.source), args.output)
+    size = sum(entry.stat().st_size for entry in os.scandir(args.output))
+    print(f"✓ Stored {n_reports:,} reports for {n_patients:,} patients in '{args.output}' "
+          f"({size / 1024 / 1024:.1f} MB, {time.perf_counter() - start:.1f}s)")
+    return 0
+
+
+# Usage: python health_columnar.py SOURCE -o store/
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import cProfile
+import heapq
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+# Instrumentation is off until enable() is called. While off, span() and
+# profile_report() hand back one shared no-op object, so the hooks left in
+# the generators cost a function call and nothing else.
+_sink = None
+_trace_allocations = False
+_context = {}
+_profiler = None
+
+class _NullSpan:
+    """Span returned while instrumentation is disabled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class Span:
+    """Time one stage and emit it to the sink on exit
+
+    Attributes set with set() are added to the record; a 'figure'
+    attribute is replaced by the figure's artist count.
+    """
+    __slots__ = ('name', 'attrs', 'start', 'start_bytes')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start_bytes = tracemalloc.get_traced_memory()[0] if _trace_allocations else None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        record = dict(_context)
+        record['span'] = self.name
+        record['seconds'] = round(seconds, 6)
+        if self.start_bytes is not None:
+            record['allocated_bytes'] = tracemalloc.get_traced_memory()[0] - self.start_bytes
+        for key, value in self.attrs.items():
+            if key == 'figure':
+                record['artists'] = sum(1 for _ in value.findobj())
+            else:
+                record[key] = value
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        if _sink is not None:
+            _sink(record)
+        return False
+
+def span(name, **attrs):
+    """Time a stage as `with span('trends.save', figure=fig):`"""
+    if _sink is None:
+        return _NULL_SPAN
+    return Span(name, attrs)
+
+def set_context(**attrs):
+    """Attach attributes (e.g. patient_id) to every span emitted from now on"""
+    _context.clear()
+    _context.update(attrs)
+
+def is_enabled():
+    """Check whether spans are being recorded"""
+    return _sink is not None
+
+def _json_lines_sink(path):
+    """Make a sink appending one JSON line per span (stderr when path is None)"""
+    stream = open(path, 'a', encoding='utf-8') if path else sys.stderr
+
+    def write(record):
+        # One write per record keeps lines intact when several processes append
+        stream.write(json.dumps(record, default=str) + '\n')
+        stream.flush()
+    return write
+
+def enable(callback=None, log_file=None, trace_allocations=False,
+           profile_slowest=0, profile_dir='profiles'):
+    """Turn instrumentation on
+
+    Spans go to callback(record) if given, else as JSON lines to log_file
+    (or stderr). With trace_allocations, spans also record the net bytes
+    allocated (via tracemalloc). With profile_slowest=N, profile_report()
+    keeps cProfile dumps of the N slowest reports in profile_dir.
+    """
+    global _sink, _trace_allocations, _profiler
+    _sink = callback or _json_lines_sink(log_file)
+    _trace_allocations = trace_allocations
+    if trace_allocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _profiler = SlowestProfiles(profile_slowest, profile_dir) if profile_slowest else None
+
+def disable():
+    """Turn instrumentation off"""
+    global _sink, _trace_allocations, _profiler
+    _sink = None
+    _profiler = None
+    if _trace_allocations and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _trace_allocations = False
+
+class SlowestProfiles:
+    """Keep cProfile dumps for the slowest N reports profiled in this process
+
+    Dumps are named '<seconds>_<key>.prof', so prune_profiles() can keep
+    the overall slowest N when several processes share the directory.
+    """
+
+    def __init__(self, limit, directory):
+        self.limit = limit
+        self.directory = directory
+        self._kept = []  # Min-heap of (seconds, path)
+        os.makedirs(directory, exist_ok=True)
+
+    def profile(self, key):
+        return _ProfileRun(self, key)
+
+    def record(self, seconds, key, profile):
+        if len(self._kept) >= self.limit and seconds <= self._kept[0][0]:
+            return
+        safe_key = re.sub(r'[^A-Za-z0-9._-]+', '_', str(key))
+        path = os.path.join(self.directory, f'{seconds:012.6f}_{safe_key}.prof')
+        profile.dump_stats(path)
+        heapq.heappush(self._kept, (seconds, path))
+        if len(self._kept) > self.limit:
+            _, evicted = heapq.heappop(self._kept)
+            if os.path.exists(evicted):
+                os.remove(evicted)
+
+class _ProfileRun:
+    """Profile one report and hand the result to SlowestProfiles"""
+    __slots__ = ('owner', 'key', 'profile', 'start')
+
+    def __init__(self, owner, key):
+        self.owner = owner
+        self.key = key
+
+    def __enter__(self):
+        self.profile = cProfile.Profile()
+        self.start = time.perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profile.disable()
+        self.owner.record(time.perf_counter() - self.start, self.key, self.profile)
+        return False
+
+def profile_report(key):
+    """Profile one report when slowest-N profiling is on (no-op otherwise)"""
+    if _profiler is None:
+        return _NULL_SPAN
+    return _profiler.profile(key)
+
+def prune_profiles(directory, limit):
+    """Keep only the slowest `limit` profile dumps in a directory"""
+    if not os.path.isdir(directory):
+        return []
+    dumps = sorted((name for name in os.listdir(directory) if name.endswith('.prof')), reverse=True)
+    for name in dumps[limit:]:
+        os.remove(os.path.join(directory, name))
+    return [os.path.join(directory, name) for name in dumps[:limit]]
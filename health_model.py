@@ -0,0 +1,191 @@
+import json
+import sys
+from enum import IntEnum
+import numpy as np
+from health_categories import TEST_CATEGORIES
+from health_classify import STATUS_SCORES, DEFAULT_SCORE
+from health_names import TEST_NAMES
+from health_units import unit_factors
+from health_values import parse_lab_value
+
+class Status(IntEnum):
+    """Reported test status; LOW/NORMAL/HIGH/ABNORMAL share health_classify's codes"""
+    LOW = 0
+    NORMAL = 1
+    HIGH = 2
+    OTHER = 3  # Any other reported string, or an explicit null
+    ABNORMAL = 4
+
+# Statuses reported as needing attention
+ABNORMAL_CODES = frozenset((Status.LOW, Status.HIGH, Status.ABNORMAL))
+
+# LabTest attributes readable with get() and [] (other fields come from the source row)
+_TEST_ATTRS = frozenset(('name', 'key', 'test_id', 'category', 'section', 'value', 'number', 'unit', 'status',
+                         'code', 'score'))
+
+# Memos below are cleared when they reach this many entries, so arbitrary
+# input can't grow a long-running process (lab values repeat heavily, like
+# names and statuses, so the limit is rarely hit)
+_MEMO_LIMIT = 65536
+
+# Per distinct raw name: (interned name, lowered key, test id, radar category, blood panel section)
+_NAMES = {}
+
+# Per distinct raw value string: its parsed number, or None
+_NUMBERS = {}
+
+# Per distinct raw status: (interned status, Status, score)
+_STATUSES = {}
+_STATUS_CODES = {'LOW': Status.LOW, 'NORMAL': Status.NORMAL, 'HIGH': Status.HIGH, 'ABNORMAL': Status.ABNORMAL}
+
+def _intern(text):
+    return sys.intern(text) if type(text) is str else text
+
+def _name_info(name):
+    info = _NAMES.get(name)
+    if info is None:
+        category, section = TEST_CATEGORIES.lookup(name)
+        if len(_NAMES) >= _MEMO_LIMIT:
+            _NAMES.clear()
+        info = _NAMES[name] = (sys.intern(name), sys.intern(name.lower()), TEST_NAMES.test_id(name), category,
+                               section)
+    return info
+
+def _parse_number(value):
+    number = parse_lab_value(value)
+    if type(value) is str:
+        if len(_NUMBERS) >= _MEMO_LIMIT:
+            _NUMBERS.clear()
+        _NUMBERS[value] = number
+    return number
+
+def _status_info(status):
+    info = _STATUSES.get(status)
+    if info is None:
+        if len(_STATUSES) >= _MEMO_LIMIT:
+            _STATUSES.clear()
+        info = _STATUSES[status] = (_intern(status), _STATUS_CODES.get(status, Status.OTHER),
+                                    STATUS_SCORES.get(status, DEFAULT_SCORE))
+    return info
+
+class LabTest:
+    """One test row: interned name and unit, parsed value, status code and score
+
+    The test id (shared by every spelling of a test), category and section
+    come from the shared name and keyword indexes, looked up once per
+    distinct name. The source row is kept, not copied, for the fields
+    only some callers read (ranges, reference_range, meaning, tips); get()
+    and [] read either like the raw dict does, so code written against
+    report dicts also takes a model.
+    """
+    __slots__ = ('name', 'key', 'test_id', 'category', 'section', 'value', 'number', 'unit', 'status', 'code',
+                 'score', 'row')
+
+    def __init__(self, data):
+        get = data.get
+        name = data['name']
+        self.name, self.key, self.test_id, self.category, self.section = _NAMES.get(name) or _name_info(name)
+        self.value = value = get('value')
+        try:
+            self.number = _NUMBERS[value]
+        except (KeyError, TypeError):
+            self.number = _parse_number(value)
+        unit = get('unit', '')
+        self.unit = sys.intern(unit) if type(unit) is str else unit
+        # A missing status reads as NORMAL, like test.get('status', 'NORMAL') always did
+        status = get('status', 'NORMAL')
+        self.status, self.code, self.score = _STATUSES.get(status) or _status_info(status)
+        self.row = data
+
+    def get(self, field, default=None):
+        if field in _TEST_ATTRS:
+            value = getattr(self, field)
+            return default if value is None else value
+        return self.row.get(field, default)
+
+    def __getitem__(self, field):
+        if field in _TEST_ATTRS:
+            return getattr(self, field)
+        return self.row[field]
+
+    def __repr__(self):
+        return f'LabTest({self.name!r}, {self.value!r}, {self.unit!r}, {self.status!r})'
+
+    def to_dict(self):
+        """Get the source row dict"""
+        return self.row
+
+class Report:
+    """A validated report: patient_info as given plus a list of LabTest rows"""
+    __slots__ = ('patient_info', 'tests', 'source')
+
+    def __init__(self, patient_info, tests, source):
+        self.patient_info = patient_info
+        self.tests = tests
+        self.source = source
+
+    def get(self, field, default=None):
+        if field == 'patient_info':
+            return self.patient_info
+        if field == 'tests':
+            return self.tests
+        return self.source.get(field, default)
+
+    def __getitem__(self, field):
+        if field == 'patient_info':
+            return self.patient_info
+        if field == 'tests':
+            return self.tests
+        return self.source[field]
+
+    def __repr__(self):
+        return f"Report({self.patient_info.get('name')!r}, {len(self.tests)} tests)"
+
+    def numbers(self):
+        """Parsed values of all rows as a float array (NaN when not numeric)"""
+        return np.fromiter((np.nan if test.number is None else test.number for test in self.tests),
+                           dtype=float, count=len(self.tests))
+
+    def factors(self):
+        """Factors converting each row's value to its test's canonical unit"""
+        return unit_factors([test.name for test in self.tests], [test.unit for test in self.tests])
+
+    def normalized_numbers(self):
+        """Parsed values of all rows in their tests' canonical units (NaN when not numeric)"""
+        return self.numbers() * self.factors()
+
+    def to_dict(self):
+        """Get the source report dict"""
+        return self.source
+
+def build_report(data):
+    """Validate a parsed report dict and build its model (models pass through)
+
+    Raises ValueError when the report is not an object, patient_info is not
+    an object, tests is not a list, or a test row has no string name.
+    """
+    if isinstance(data, Report):
+        return data
+    if not isinstance(data, dict):
+        raise ValueError(f'Report must be a JSON object, not {type(data).__name__}')
+    patient_info = data.get('patient_info') or {}
+    if not isinstance(patient_info, dict):
+        raise ValueError("Report 'patient_info' must be a JSON object")
+    rows = data.get('tests')
+    if rows is None:
+        rows = []
+    if not isinstance(rows, list):
+        raise ValueError("Report 'tests' must be a list")
+    tests = []
+    for idx, row in enumerate(rows):
+        if type(row) is not dict or type(row.get('name')) is not str:
+            raise ValueError(f'Test {idx} must be a JSON object with a string name')
+        tests.append(LabTest(row))
+    return Report(patient_info, tests, data)
+
+def load_report(source):
+    """Load a report JSON file (or take a parsed report or model) as a Report"""
+    if isinstance(source, (dict, Report)):
+        return build_report(source)
+    with open(source, 'r') as f:
+        return build_report(json.load(f))
@@ -0,0 +1,131 @@
+import re
+import numpy as np
+
+# Canonical test names (the spellings the charts and default ranges use), each
+# with the other spellings labs print for the same test. Case, spaces and
+# punctuation never matter ('H.CT', 'hct' and 'H CT' are already the same).
+TEST_ALIASES = {
+    'HEMOGLOBIN': ['Hb', 'Hgb', 'Haemoglobin', 'Hemoglobin (Hb)', 'Haemoglobin (Hb)'],
+    'Total RBC Count': ['RBC', 'RBC Count', 'Red Blood Cell Count', 'Red Blood Cells', 'Erythrocyte Count'],
+    'H.CT': ['Hematocrit', 'Haematocrit', 'PCV', 'Packed Cell Volume', 'Hematocrit (PCV)'],
+    'M.C.V': ['Mean Corpuscular Volume', 'Mean Cell Volume'],
+    'M.C.H.': ['Mean Corpuscular Hemoglobin', 'Mean Corpuscular Haemoglobin', 'Mean Cell Hemoglobin'],
+    'M.C.H.C.': ['Mean Corpuscular Hemoglobin Concentration', 'Mean Corpuscular Haemoglobin Concentration',
+                 'Mean Cell Hemoglobin Concentration'],
+    'R.D.W': ['RDW-CV', 'Red Cell Distribution Width', 'RDW (CV)'],
+    'Total WBC Count (TLC)': ['WBC', 'WBC Count', 'TLC', 'Total WBC Count', 'Total Leucocyte Count',
+                              'Total Leukocyte Count', 'White Blood Cell Count', 'White Blood Cells',
+                              'Leucocyte Count', 'Leukocyte Count'],
+    'Platelet Count': ['Platelets', 'Platelet', 'PLT', 'PLT Count', 'Thrombocyte Count'],
+    '1 Hour ESR': ['ESR', 'ESR (1 Hour)', 'ESR 1st Hour', 'ESR 1 Hour', 'Erythrocyte Sedimentation Rate'],
+    'Polymorphs': ['Neutrophils', 'Neutrophil', 'Polymorph', 'Polymorphs (Neutrophils)', 'Segmented Neutrophils'],
+    'Lymphocytes': ['Lymphocyte', 'Lymphs'],
+    'Eosinophils': ['Eosinophil', 'Eos'],
+    'Monocytes': ['Monocyte', 'Monos'],
+    'Basophils': ['Basophil', 'Basos'],
+    'Mean Blood Glucose': ['Estimated Average Glucose', 'eAG', 'Mean Plasma Glucose'],
+    'HbsAg': ['Hepatitis B Surface Antigen', 'HBs Antigen', 'Australia Antigen'],
+    'Urine Volume': ['Volume'],
+    'Urine Colour': ['Colour', 'Color', 'Urine Color'],
+    'Urine Appearance': ['Appearance', 'Transparency'],
+    'Urine Reaction': ['Reaction', 'Urine pH', 'pH (Urine)'],
+    'Specific Gravity': ['Urine Specific Gravity', 'Sp. Gravity', 'Sp Gr'],
+    'Urine Protein': ['Protein (Urine)', 'Urine Albumin', 'Albumin (Urine)'],
+    'Urine Glucose': ['Glucose (Urine)', 'Urine Sugar', 'Sugar (Urine)'],
+    'Pus Cells': ['Pus Cell', 'Leucocytes (Urine)', 'WBC (Urine)'],
+    'Red Cells': ['RBC (Urine)', 'Red Blood Cells (Urine)'],
+    'Epithelial Cells': ['Epithelial Cell', 'Squamous Epithelial Cells']
+}
+
+_PUNCTUATION = re.compile(r'[^0-9a-z]+')
+
+# Id of names past the index's limit on tests outside the table
+OTHER_TEST = -1
+
+def normalize_name(name):
+    """Reduce a test name to its join key: lowercase letters and digits only"""
+    return _PUNCTUATION.sub('', str(name).lower())
+
+class TestNameIndex:
+    """Map raw test names to integer test ids through an alias table
+
+    Each distinct raw name is normalized once and memoized, so a lookup is
+    one dict hit. The table's tests get ids 0..len(aliases)-1 in table
+    order; any other name gets the next free id the first time it is seen
+    (keyed by its normalized form, named by that first spelling), so
+    unknown tests still join across reports and labs. Those ids are only
+    stable within a process; persist names, not ids.
+
+    Long-running processes see arbitrary names, so both stores are
+    bounded: at most max_unknown tests outside the table get ids (later
+    ones get OTHER_TEST and are their own canonical spelling), and the
+    raw-name memo is cleared when it reaches max_spellings.
+    """
+
+    def __init__(self, aliases, max_unknown=4096, max_spellings=65536):
+        self.names = []
+        self._ids = {}
+        self._memo = {}
+        self.max_unknown = max_unknown
+        self.max_spellings = max_spellings
+        self._table_size = len(aliases)
+        for canonical, spellings in aliases.items():
+            test_id = self._add(canonical)
+            for spelling in spellings:
+                key = normalize_name(spelling)
+                if self._ids.setdefault(key, test_id) != test_id:
+                    raise ValueError(f"Alias '{spelling}' of '{canonical}' already names "
+                                     f"'{self.names[self._ids[key]]}'")
+
+    def __len__(self):
+        return len(self.names)
+
+    def _add(self, name):
+        key = normalize_name(name)
+        test_id = self._ids.get(key)
+        if test_id is None:
+            if len(self.names) - self._table_size >= self.max_unknown:
+                return OTHER_TEST
+            test_id = self._ids[key] = len(self.names)
+            self.names.append(name)
+        return test_id
+
+    def test_id(self, name):
+        """Get the integer id of a raw test name (OTHER_TEST past the limit on unknown tests)"""
+        try:
+            return self._memo[name]
+        except KeyError:
+            pass
+        test_id = self._add(name)
+        if test_id != OTHER_TEST:
+            if len(self._memo) >= self.max_spellings:
+                self._memo.clear()
+            self._memo[name] = test_id
+        return test_id
+
+    def canonical(self, name):
+        """Get the canonical spelling of a raw test name"""
+        test_id = self.test_id(name)
+        return name if test_id == OTHER_TEST else self.names[test_id]
+
+    def ids(self, names):
+        """Get test ids for a column of raw names as an array"""
+        memo = self._memo
+        return np.fromiter((memo[name] if name in memo else self.test_id(name) for name in names),
+                           dtype=np.intp)
+
+    def column_map(self, strings, name_ids, tests):
+        """Map string-table ids of test names to columns of tests (-1 for other tests)
+
+        For columnar stores: only the ids in name_ids are looked up, and
+        every spelling of a test maps to that test's column.
+        """
+        columns = {self.test_id(name): col for col, name in enumerate(tests)}
+        columns.pop(OTHER_TEST, None)
+        column_of = np.full(len(strings), -1, dtype=np.intp)
+        for name_id in np.unique(name_ids).tolist():
+            column_of[name_id] = columns.get(self.test_id(strings[name_id]), -1)
+        return column_of
+
+# Shared per-process index used for every cross-report join
+TEST_NAMES = TestNameIndex(TEST_ALIASES)
@@ -0,0 +1,53 @@
+import io
+import os
+
+# Content types of the formats callers usually ask for
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+    'pdf': 'application/pdf'
+}
+
+def target_name(target):
+    """Describe an output target for messages: the path, or the buffer's name"""
+    if isinstance(target, (str, os.PathLike)):
+        return os.fspath(target)
+    return getattr(target, 'name', None) or f'<{type(target).__name__}>'
+
+def get_format(target, format=None):
+    """Pick the image format: the one given, else the path's extension, else PNG"""
+    if format:
+        return format.lower()
+    if isinstance(target, (str, os.PathLike)):
+        extension = os.path.splitext(os.fspath(target))[1].lstrip('.').lower()
+        if extension:
+            return extension
+    return 'png'
+
+def render(generator, reports, target, format=None, **options):
+    """Render one generator's figure for already-loaded reports to a path or file-like target
+
+    options are extra keyword arguments for the generator (e.g. use_template
+    for the blood panel); ones it doesn't take raise TypeError. Only the
+    trend chart uses more than the latest report by collection date.
+    """
+    import health_blood_panel
+    import health_redar_generator
+    import health_trends_generator
+    from health_cohort import latest_report
+
+    if generator == 'blood':
+        health_blood_panel.create_blood_panel_report(latest_report(reports), target, format=format, **options)
+    elif generator == 'radar':
+        chart = health_redar_generator.HealthRadarChart(latest_report(reports))
+        chart.generate_report(target, format=format, **options)
+    elif generator == 'trends':
+        health_trends_generator.create_trend_chart(reports, target, format=format, **options)
+    else:
+        raise ValueError(f"Unknown generator '{generator}'")
+
+def render_bytes(generator, reports, format='png', **options):
+    """Render one generator's figure into memory and return the image bytes"""
+    buffer = io.BytesIO()
+    render(generator, reports, buffer, format=format, **options)
+    return buffer.getvalue()
@@ -0,0 +1,229 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import numpy as np
+from health_categories import HEMATOLOGY, DIFFERENTIAL
+from health_classify import CODE_NAMES, classify_values
+from health_cohort import latest_report
+from health_instrument import span
+from health_model import build_report
+from health_ranges import RANGES, report_context
+from health_scores import abnormal_tests, category_scores, get_health_condition, overall_score, panel_score
+from health_trend_stats import TREND_NAMES, series_stats
+from health_units import resolve_unit
+import health_trends_generator as trends
+
+# Artifacts in render order, with their file names (the scripts' defaults, minus the extension)
+ARTIFACTS = {'blood': 'health_blood', 'radar': 'health_radar', 'trends': 'health_trends'}
+
+SUMMARY_FILE = 'health_summary.json'
+
+class Workup:
+    """One report parsed, classified and scored once, shared by every renderer
+
+    Per test row: values (parsed and converted to the test's canonical
+    unit, NaN when not numeric), mins/maxs (the resolved normal range in
+    the same unit, NaN when unknown), codes (LOW/NORMAL/HIGH
+    against that range), scores (from the reported status), categories
+    and sections. Per report: panel_score (the blood panel's share of
+    NORMAL results) and category_scores/overall_score (the radar's
+    category means of status scores).
+    """
+
+    def __init__(self, report):
+        self.report = report = build_report(report)
+        self.patient_info = report.patient_info
+        self.tests = report.tests
+        self.context = report_context(report)
+
+        self.values = report.normalized_numbers()
+        self.mins, self.maxs = RANGES.resolve_bounds(self.tests, self.context)
+        self.codes = classify_values(self.values, self.mins, self.maxs)
+        self.scores = np.fromiter((test.score for test in self.tests), dtype=np.int16, count=len(self.tests))
+        self.categories = [test.category for test in self.tests]
+        self.sections = [test.section for test in self.tests]
+
+        self.panel_score = panel_score(self.tests)
+        self.category_scores = category_scores(self.tests)
+        self.overall_score = overall_score(self.category_scores)
+
+    def section_tests(self, section):
+        """Get (tests, indices) of the rows in a blood panel section"""
+        indices = [idx for idx, test_section in enumerate(self.sections) if test_section == section]
+        return [self.tests[idx] for idx in indices], np.array(indices, dtype=np.intp)
+
+    @property
+    def abnormal(self):
+        """Tests reported HIGH, LOW or ABNORMAL"""
+        return abnormal_tests(self.tests)
+
+    @property
+    def parsed(self):
+        """(values, mins, maxs), the form build_trend_series() takes"""
+        return self.values, self.mins, self.maxs
+
+def analyze_reports(reports):
+    """Parse and score every report once; returns (workups in input order, the latest one)"""
+    workups = [Workup(report) for report in reports]
+    latest = latest_report(reports)
+    return workups, next(workup for workup in workups if workup.report is latest)
+
+def render_artifact(generator, workup, reports, series, output_file, format=None):
+    """Render one artifact from a workup (and, for trends, the joined series); returns seconds"""
+    import health_blood_panel
+    import health_redar_generator
+
+    start = time.perf_counter()
+    # The generators report progress on stdout; the pipeline prints its own
+    with contextlib.redirect_stdout(io.StringIO()):
+        if generator == 'blood':
+            hematology, indices = workup.section_tests(HEMATOLOGY)
+            differential, _ = workup.section_tests(DIFFERENTIAL)
+            health_blood_panel.render_blood_panel(
+                output_file, workup.panel_score, hematology, differential, workup.context, format=format,
+                measurements=(workup.values[indices], workup.mins[indices], workup.maxs[indices]))
+        elif generator == 'radar':
+            chart = health_redar_generator.HealthRadarChart(workup.report)
+            chart.create_radar_chart(workup.category_scores, workup.overall_score, output_file, format)
+        elif generator == 'trends':
+            trends.create_trend_chart(reports, output_file, format=format, series=series)
+        else:
+            raise ValueError(f"Unknown artifact '{generator}'")
+    return time.perf_counter() - start
+
+def _clean(value):
+    """Make a NumPy scalar JSON-safe (NaN becomes null)"""
+    value = float(value)
+    return None if np.isnan(value) else round(value, 4)
+
+def build_summary(workup, series, n_reports):
+    """Summarize the latest workup and the trends across the history as a JSON-ready dict"""
+    condition, _ = get_health_condition(workup.overall_score)
+    tests = []
+    for idx, test in enumerate(workup.tests):
+        tests.append({
+            'name': test.get('name', ''),
+            'value': test.get('value'),
+            'unit': test.get('unit', ''),
+            'status': test.get('status'),
+            'numeric_value': _clean(workup.values[idx]),
+            'numeric_unit': resolve_unit(test.name, test.unit).unit,
+            'normal_min': _clean(workup.mins[idx]),
+            'normal_max': _clean(workup.maxs[idx]),
+            'range_check': str(CODE_NAMES[workup.codes[idx]]),
+            'category': workup.categories[idx]
+        })
+
+    labels, test_data = series
+    measured = [name for name, data in test_data.items() if np.count_nonzero(~np.isnan(data['values'])) > 1]
+    stats = series_stats(test_data, measured)
+    trend_summary = {}
+    for row, name in enumerate(measured):
+        trend_summary[name] = {
+            'trend': str(TREND_NAMES[stats.trend[row]]),
+            'slope_per_report': _clean(stats.slope[row]),
+            'pct_change': _clean(stats.pct_change[row]),
+            'time_in_range': _clean(stats.time_in_range[row]),
+            'change_point': int(stats.change_point[row]),
+            'deteriorating': bool(stats.deteriorating[row])
+        }
+
+    return {
+        'patient_info': workup.patient_info,
+        'reports': n_reports,
+        'panel_score': workup.panel_score,
+        'overall_score': workup.overall_score,
+        'condition': condition,
+        'category_scores': workup.category_scores,
+        'abnormal': [test.get('name') for test in workup.abnormal],
+        'deteriorating': [name for name, trend in trend_summary.items() if trend['deteriorating']],
+        'tests': tests,
+        'trends': trend_summary
+    }
+
+def run_pipeline(reports, output_dir='.', artifacts=tuple(ARTIFACTS), format='png', parallel=False):
+    """Parse and score reports once, then render the artifacts and write the JSON summary
+
+    reports are JSON paths or parsed dicts, oldest first (dated reports are
+    ordered by date). The blood panel and radar use the latest report; the
+    trend chart uses all of them. With parallel, each artifact renders in
+    its own headless worker process. Returns the summary, which also lists
+    the files written and per-stage seconds.
+    """
+    start = time.perf_counter()
+    timings = {}
+    with span('pipeline.load', reports=len(reports)):
+        reports = [build_report(report) for report in trends.load_reports(reports)]
+    if not reports:
+        raise ValueError('No reports to process')
+    with span('pipeline.analyze'):
+        workups, latest = analyze_reports(reports)
+        series = trends.build_trend_series(reports, [workup.parsed for workup in workups])
+    timings['parse_and_score'] = time.perf_counter() - start
+
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = {generator: os.path.join(output_dir, f'{ARTIFACTS[generator]}.{format}')
+               for generator in artifacts}
+    if parallel and len(outputs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        from health_batch import _init_worker
+        with ProcessPoolExecutor(max_workers=len(outputs), initializer=_init_worker) as pool:
+            futures = {generator: pool.submit(render_artifact, generator, latest, reports, series, path, format)
+                       for generator, path in outputs.items()}
+            for generator, future in futures.items():
+                timings['render_' + generator] = future.result()
+    else:
+        for generator, path in outputs.items():
+            with span('pipeline.render', artifact=generator):
+                timings['render_' + generator] = render_artifact(generator, latest, reports, series, path, format)
+
+    summary = build_summary(latest, series, len(reports))
+    summary['artifacts'] = outputs
+    summary['seconds'] = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+    summary['seconds']['total'] = round(time.perf_counter() - start, 3)
+    summary_file = os.path.join(output_dir, SUMMARY_FILE)
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    summary['artifacts']['summary'] = summary_file
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Produce the blood panel, radar and trend charts plus a JSON '
+                                                 'summary from one parse of the reports')
+    parser.add_argument('reports', nargs='*', default=['health_report_data.json', 'health_report_data1.json'],
+                        help='report JSON files, oldest first (default: the two sample reports)')
+    parser.add_argument('-o', '--output-dir', default='.', help='where to write the artifacts')
+    parser.add_argument('--format', default='png', help='image format (png, svg or pdf)')
+    parser.add_argument('--only', help=f"comma separated artifacts (default: {','.join(ARTIFACTS)})")
+    parser.add_argument('--parallel', action='store_true', help='render the artifacts in parallel processes')
+    args = parser.parse_args(argv)
+
+    artifacts = args.only.split(',') if args.only else list(ARTIFACTS)
+    unknown = [name for name in artifacts if name not in ARTIFACTS]
+    if unknown:
+        parser.error(f"unknown artifact(s): {', '.join(unknown)}")
+
+    import health_runtime
+    health_runtime.enable_headless()
+    summary = run_pipeline(args.reports, args.output_dir, artifacts, args.format.lower(), args.parallel)
+
+    print(f"✓ {summary['patient_info'].get('name', 'Unknown patient')}: {summary['reports']} report(s), "
+          f"overall score {summary['overall_score']}/100 ({summary['condition']}), "
+          f"panel score {summary['panel_score']}%")
+    if summary['abnormal']:
+        print(f"⚠ Abnormal results: {', '.join(summary['abnormal'])}")
+    if summary['deteriorating']:
+        print(f"⚠ Deteriorating markers: {', '.join(summary['deteriorating'])}")
+    for name, path in summary['artifacts'].items():
+        print(f"✓ {name:<8} {path}")
+    print(f"Done in {summary['seconds']['total']:.1f}s")
+    return 0
+
+
+# Usage: python health_pipeline.py report1.json report2.json -o out/ [--parallel]
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+from health_names import TEST_NAMES
+from health_units import unit_factor
+
+# Fallback normal ranges per test, used when a report doesn't state one
+DEFAULT_RANGES = {
+    'HEMOGLOBIN': (13.0, 17.0),
+    'Total RBC Count': (4.5, 5.5),
+    'H.CT': (40.0, 50.0),
+    'M.C.V': (83.0, 101.0),
+    'M.C.H.': (27.0, 32.0),
+    'M.C.H.C.': (31.5, 34.5),
+    'R.D.W': (11.6, 14.0),
+    'Total WBC Count (TLC)': (4000, 11000),
+    'Platelet Count': (150000, 410000),
+    '1 Hour ESR': (0, 15),
+    'Polymorphs': (40, 75),
+    'Lymphocytes': (20, 40),
+    'Eosinophils': (1, 6),
+    'Monocytes': (2, 10),
+    'Mean Blood Glucose': (70, 100),
+    'Specific Gravity': (1.010, 1.025),
+    'Urine Volume': (800, 2000),
+    'Urine Glucose': (0, 0)
+}
+
+# Fallbacks that differ by sex, tried before DEFAULT_RANGES
+SEX_DEFAULT_RANGES = {
+    ('HEMOGLOBIN', 'F'): (12.0, 15.0),
+    ('Total RBC Count', 'F'): (3.8, 4.8),
+    ('H.CT', 'F'): (36.0, 46.0),
+    ('1 Hour ESR', 'F'): (0, 20)
+}
+
+# Age bands as (upper bound in years, label)
+AGE_BANDS = [(18, 'child'), (65, 'adult'), (float('inf'), 'senior')]
+
+RangeContext = namedtuple('RangeContext', ['sex', 'age_band', 'lab'])
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+_REFERENCE = re.compile(rf'({_NUMBER.pattern})\s*(?:-|–|to)\s*({_NUMBER.pattern})')
+_UPPER_LIMIT = re.compile(r'^(?:<|<=|≤|upto|up to)\s*(\d+(?:\.\d+)?)')
+_AGE = re.compile(r'(\d+(?:\.\d+)?)\s*([ymd]?)')
+
+@lru_cache(maxsize=65536)
+def parse_reference_range(text):
+    """Parse a reference range string ('26 - 33', '< 5') into (min, max), or None"""
+    text = ' '.join(str(text).lower().split())
+    match = _REFERENCE.search(text)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    match = _UPPER_LIMIT.match(text)
+    if match:
+        return 0.0, float(match.group(1))
+    return None
+
+def _range_bound(value):
+    """Read one stated bound (a number, or a string holding one), or None"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value) if value == value else None
+    match = _NUMBER.search(str(value or ''))
+    return float(match.group(0)) if match else None
+
+def stated_range(test):
+    """Get the normal range a test row states itself, or None (also when it can't be read)"""
+    ranges = test.get('ranges')
+    if isinstance(ranges, dict):
+        low, high = _range_bound(ranges.get('normal_min')), _range_bound(ranges.get('normal_max'))
+        if low is not None and high is not None:
+            return low, high
+    reference = test.get('reference_range')
+    if reference:
+        return parse_reference_range(reference)
+    return None
+
+def normalize_sex(sex):
+    """Map 'MALE'/'Female'/'m' etc. to 'M' or 'F' (None when unknown)"""
+    sex = str(sex or '').strip().upper()[:1]
+    return sex if sex in ('M', 'F') else None
+
+def get_age_band(age):
+    """Map an age such as '38 Y' or '6 M' to its band label (None when unknown)"""
+    match = _AGE.match(str(age or '').strip().lower())
+    if not match:
+        return None
+    years = float(match.group(1))
+    if match.group(2) in ('m', 'd'):
+        years = 0  # Months or days old
+    for upper, label in AGE_BANDS:
+        if years < upper:
+            return label
+    return None
+
+def report_context(report):
+    """Get the (sex, age band, lab) a report's ranges apply to"""
+    info = report.get('patient_info') or {}
+    lab = str(info.get('lab_name') or '').strip() or None
+    return RangeContext(normalize_sex(info.get('sex')), get_age_band(info.get('age')), lab)
+
+class RangeRegistry:
+    """Normal ranges for report rows: the row's own, else the default for its test and sex
+
+    A range a row states is authoritative for that row only; nothing a
+    row states is remembered, so a report classifies the same way whatever
+    was resolved before it. Defaults get integer ids indexing flat
+    mins/maxs arrays, one per (test, sex) with a default (id 0 is the
+    unknown range), so the registry stays the size of the default tables
+    and a report's bounds come from one fancy-index lookup. The context's
+    age band and lab don't change any default yet. Bounds are in each
+    test's canonical unit (health_units), so stated ranges are converted
+    from their row's unit. Unknown bounds are NaN.
+    """
+
+    def __init__(self, defaults=DEFAULT_RANGES, sex_defaults=SEX_DEFAULT_RANGES):
+        self.defaults = defaults
+        self.sex_defaults = sex_defaults
+        self._ids = {}
+        self._mins = [np.nan]
+        self._maxs = [np.nan]
+        self._arrays = None
+
+    def __len__(self):
+        return len(self._mins)
+
+    def _bounds(self):
+        if self._arrays is None:
+            self._arrays = np.array(self._mins, dtype=float), np.array(self._maxs, dtype=float)
+        return self._arrays
+
+    def default_range(self, name, sex=None):
+        """Get the fallback range for a test (any spelling of it), or None"""
+        name = TEST_NAMES.canonical(name)
+        return self.sex_defaults.get((name, sex)) or self.defaults.get(name)
+
+    def default_id(self, name, context):
+        """Get the id of a test's default range in a report context (0 when there is none)"""
+        key = (TEST_NAMES.canonical(name), context.sex)
+        range_id = self._ids.get(key)
+        if range_id is None:
+            bounds = self.default_range(*key)
+            if bounds is None:
+                return 0  # Not memoized: unknown names are unbounded
+            range_id = self._ids[key] = len(self._mins)
+            self._mins.append(float(bounds[0]))
+            self._maxs.append(float(bounds[1]))
+            self._arrays = None
+        return range_id
+
+    def _stated(self, name, test):
+        """Get a row's stated range in its test's canonical unit, or None"""
+        stated = stated_range(test)
+        if stated is not None:
+            # Stated in the row's unit; the registry holds canonical units
+            factor = unit_factor(name, test.get('unit', ''))
+            if factor != 1.0:
+                stated = (stated[0] * factor, stated[1] * factor)
+        return stated
+
+    def resolve_range(self, name, context, test=None):
+        """Get one row's (min, max), or None when unknown"""
+        stated = self._stated(name, test) if test is not None else None
+        if stated is not None:
+            return stated
+        range_id = self.default_id(name, context)
+        if range_id == 0:
+            return None
+        return self._mins[range_id], self._maxs[range_id]
+
+    def resolve_bounds(self, tests, context):
+        """Get (mins, maxs) arrays for a list of test rows from one report"""
+        ids = np.fromiter((self.default_id(test.get('name', ''), context) for test in tests),
+                          dtype=np.intp, count=len(tests))
+        mins, maxs = self._bounds()
+        mins, maxs = mins[ids], maxs[ids]
+        for idx, test in enumerate(tests):
+            stated = self._stated(test.get('name', ''), test)
+            if stated is not None:
+                mins[idx], maxs[idx] = stated
+        return mins, maxs
+
+# Shared per-process registry of default ranges
+RANGES = RangeRegistry()
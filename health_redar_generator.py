@@ -1,30 +1,29 @@
 import json
-import matplotlib.pyplot as plt
-import numpy as np
 from math import pi
-import seaborn as sns
-from datetime import datetime
+from health_runtime import render_figure
+from health_instrument import span
+from health_output import get_format, target_name
+from health_classify import STATUS_SCORES, DEFAULT_SCORE
+from health_categories import CATEGORIES
+from health_model import load_report
+from health_scores import get_health_condition, overall_score
+
+# Bump when the rendered output changes, to invalidate cached renders
+RENDER_VERSION = 3
 
 class HealthRadarChart:
     def __init__(self, json_file_path):
-        """Initialize with JSON file path"""
+        """Initialize with JSON file path or an already-parsed report"""
         self.json_file_path = json_file_path
         self.data = None
-        self.health_categories = {
-            'Blood Health': [],
-            'Metabolic Health': [],
-            'Immune Function': [],
-            'Kidney Function': [],
-            'Liver Health': [],
-            'Inflammation': []
-        }
+        self.health_categories = {category: [] for category in CATEGORIES}
         self.load_data()
     
     def load_data(self):
         """Load JSON data from file"""
         try:
-            with open(self.json_file_path, 'r') as file:
-                self.data = json.load(file)
+            with span('radar.load'):
+                self.data = load_report(self.json_file_path)
             print(f"✓ Successfully loaded data for {self.data['patient_info']['name']}")
         except FileNotFoundError:
             print(f"Error: File '{self.json_file_path}' not found!")
@@ -32,57 +31,25 @@ class HealthRadarChart:
         except json.JSONDecodeError:
             print("Error: Invalid JSON file!")
             return False
+        except ValueError as e:
+            print(f"Error: Invalid report: {e}")
+            return False
         return True
     
     def calculate_test_score(self, test):
         """Calculate individual test score (0-100)"""
         status = test.get('status', 'NORMAL')
-        
-        if status == 'NORMAL':
-            return 100
-        elif status in ['HIGH', 'LOW']:
-            return 70
-        elif status == 'ABNORMAL':
-            return 40
-        else:
-            return 50
+        return STATUS_SCORES.get(status, DEFAULT_SCORE)
     
     def categorize_tests(self):
         """Categorize tests into health categories"""
         if not self.data:
             return
         
-        tests = self.data.get('tests', [])
-        
-        for test in tests:
-            name_lower = test['name'].lower()
-            score = self.calculate_test_score(test)
-            test_info = {
-                'name': test['name'],
-                'value': test['value'],
-                'unit': test.get('unit', ''),
-                'status': test.get('status', 'NORMAL'),
-                'score': score
-            }
-            
-            # Categorize based on test name
-            if any(keyword in name_lower for keyword in ['hemoglobin', 'rbc', 'hct', 'mcv', 'mch', 'platelet', 'rdw']):
-                self.health_categories['Blood Health'].append(test_info)
-            
-            elif any(keyword in name_lower for keyword in ['glucose', 'hba1c', 'sugar', 'mean blood glucose']):
-                self.health_categories['Metabolic Health'].append(test_info)
-            
-            elif any(keyword in name_lower for keyword in ['wbc', 'lymphocyte', 'polymorphs', 'eosinophil', 'monocyte', 'basophil', 'hiv', 'hbsag']):
-                self.health_categories['Immune Function'].append(test_info)
-            
-            elif any(keyword in name_lower for keyword in ['urine', 'protein', 'creatinine', 'urea', 'kidney']):
-                self.health_categories['Kidney Function'].append(test_info)
-            
-            elif any(keyword in name_lower for keyword in ['bile', 'bilirubin', 'alt', 'ast', 'liver', 'sgpt', 'sgot']):
-                self.health_categories['Liver Health'].append(test_info)
-            
-            elif any(keyword in name_lower for keyword in ['esr', 'crp', 'inflammation']):
-                self.health_categories['Inflammation'].append(test_info)
+        # Rows already carry their category and status score; file them as they are
+        for test in self.data.tests:
+            if test.category is not None:
+                self.health_categories[test.category].append(test)
     
     def calculate_category_scores(self):
         """Calculate average scores for each category"""
@@ -90,7 +57,7 @@ class HealthRadarChart:
         
         for category, tests in self.health_categories.items():
             if tests:
-                avg_score = sum(test['score'] for test in tests) / len(tests)
+                avg_score = sum(test.score for test in tests) / len(tests)
                 category_scores[category] = round(avg_score, 1)
             else:
                 category_scores[category] = 0
@@ -99,25 +66,11 @@ class HealthRadarChart:
     
     def calculate_overall_health_score(self, category_scores):
         """Calculate overall health score out of 100"""
-        valid_scores = [score for score in category_scores.values() if score > 0]
-        
-        if valid_scores:
-            overall_score = round(sum(valid_scores) / len(valid_scores), 1)
-        else:
-            overall_score = 0
-        
-        return overall_score
+        return overall_score(category_scores)
     
     def get_health_condition(self, score):
         """Determine health condition based on score"""
-        if score >= 90:
-            return "Excellent", "green"
-        elif score >= 75:
-            return "Good", "blue"
-        elif score >= 60:
-            return "Fair", "orange"
-        else:
-            return "Needs Attention", "red"
+        return get_health_condition(score)
     
     def print_chart_explanation(self):
         """Print explanation about the radar chart"""
@@ -169,8 +122,12 @@ HEALTH CONDITION RATINGS:
 """
         print(explanation)
     
-    def create_radar_chart(self, category_scores, overall_score):
-        """Create the radar chart visualization"""
+    def create_radar_chart(self, category_scores, overall_score, output_file='health_radar.png', format=None,
+                           show=False):
+        """Create the radar chart visualization (output_file is a path or a binary file-like object)
+
+        With show, the chart is also shown (unless headless) after saving.
+        """
         # Filter out categories with 0 scores
         active_categories = {k: v for k, v in category_scores.items() if v > 0}
         
@@ -189,8 +146,19 @@ HEALTH CONDITION RATINGS:
         values += values[:1]  # Complete the circle
         angles += angles[:1]
         
-        # Create figure with larger size
-        fig = plt.figure(figsize=(20, 14))
+        # Create figure with larger size; it is torn down once saved (and shown)
+        with render_figure((20, 14), show=show) as fig:
+            self._draw_radar_chart(fig, active_categories, angles, values, overall_score)
+            
+            # Save chart
+            with span('radar.save', figure=fig):
+                fig.savefig(output_file, format=get_format(output_file, format), dpi=300, bbox_inches='tight')
+            print(f"✓ Chart saved as '{target_name(output_file)}'")
+    
+    def _draw_radar_chart(self, fig, active_categories, angles, values, overall_score):
+        """Draw the radar, score, patient and test panels onto a figure"""
+        categories = list(active_categories)
+        N = len(categories)
         
         # Create grid spec: 4 rows, 2 columns for better spacing
         gs = fig.add_gridspec(4, 2, height_ratios=[0.3, 0.8, 0.1, 1.3], width_ratios=[1.2, 1], 
@@ -244,12 +212,12 @@ HEALTH CONDITION RATINGS:
         ax_radar = fig.add_subplot(gs[0:4, 0], polar=True)
         
         # Draw one axis per variable and add labels
-        plt.xticks(angles[:-1], categories, size=11, weight='bold')
+        ax_radar.set_xticks(angles[:-1], categories, size=11, weight='bold')
         
         # Draw ylabels
         ax_radar.set_rlabel_position(0)
-        plt.yticks([25, 50, 75, 100], ["25", "50", "75", "100"], color="grey", size=9)
-        plt.ylim(0, 100)
+        ax_radar.set_yticks([25, 50, 75, 100], ["25", "50", "75", "100"], color="grey", size=9)
+        ax_radar.set_ylim(0, 100)
         
         # Plot data - Your health score (solid line)
         ax_radar.plot(angles, values, linewidth=2.5, linestyle='solid', color='#3b82f6', 
@@ -361,14 +329,6 @@ RECOMMENDATIONS
                          fontsize=9, verticalalignment='top', fontfamily='monospace',
                          bbox=dict(boxstyle='round,pad=0.6', facecolor='#e6ffe6', alpha=0.95, 
                                   edgecolor='#28a745', linewidth=3))
-        
-        # Save with fixed filename
-        filename = "health_radar.png"
-        plt.savefig(filename, dpi=300, bbox_inches='tight')
-        print(f"✓ Chart saved as '{filename}'")
-        
-        # Show the plot
-        plt.show()
     
     def generate_detailed_report(self):
         """Generate a detailed text report"""
@@ -412,7 +372,7 @@ RECOMMENDATIONS
         
         print("\n" + "="*80 + "\n")
     
-    def generate_report(self):
+    def generate_report(self, output_file='health_radar.png', format=None, show=False):
         """Main method to generate complete health report"""
         if not self.data:
             print("Error: No data loaded!")
@@ -424,17 +384,20 @@ RECOMMENDATIONS
         print("\nGenerating Health Balance Radar Chart...\n")
         
         # Categorize tests
-        self.categorize_tests()
+        with span('radar.categorize'):
+            self.categorize_tests()
         
         # Calculate scores
-        category_scores = self.calculate_category_scores()
-        overall_score = self.calculate_overall_health_score(category_scores)
+        with span('radar.score'):
+            category_scores = self.calculate_category_scores()
+            overall_score = self.calculate_overall_health_score(category_scores)
         
         # Generate detailed text report
         self.generate_detailed_report()
         
         # Create visualization
-        self.create_radar_chart(category_scores, overall_score)
+        with span('radar.render'):
+            self.create_radar_chart(category_scores, overall_score, output_file, format, show)
 
 
 # Example usage
@@ -450,7 +413,7 @@ if __name__ == "__main__":
     health_chart = HealthRadarChart(json_file)
     
     # Generate complete report with visualization
-    health_chart.generate_report()
+    health_chart.generate_report(show=True)
     
     print("\n✓ Health report generation complete!")
     print("✓ Chart saved as 'health_radar.png'")
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+def normalize_report(report):
+    """Serialize a report canonically, so key order and whitespace don't change its hash"""
+    return json.dumps(report, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+class RenderCache:
+    """Persistent on-disk cache of rendered artifacts with size-bounded LRU eviction
+
+    Entries are keyed by a hash of the normalized report content, the
+    generator name and version, and the render options. A hit is just a
+    file path, so serving it never touches matplotlib. Several processes
+    can share one cache directory.
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None  # Approximate bytes in the cache, counted on first write
+        os.makedirs(directory, exist_ok=True)
+
+    def make_key(self, generator, version, reports, options=None):
+        """Hash the reports with the generator version and render options"""
+        digest = hashlib.sha256()
+        header = {'generator': generator, 'version': version, 'options': options or {}}
+        digest.update(json.dumps(header, sort_keys=True, default=str).encode('utf-8'))
+        for report in reports:
+            digest.update(b'\0')
+            digest.update(normalize_report(report))
+        return digest.hexdigest()
+
+    def _path(self, key, suffix):
+        # Shard by key prefix to keep directories small
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    def get(self, key, suffix='.png'):
+        """Get the cached artifact path for a key, or None on a miss"""
+        path = self._path(key, suffix)
+        try:
+            os.utime(path)  # Mark as recently used
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, source_path, suffix='.png'):
+        """Copy a rendered artifact into the cache and evict old entries if over budget"""
+        path = self._path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so concurrent readers never see a partial artifact
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self.evict()
+        return path
+
+    def _entries(self):
+        """List (path, size, last used) for every cached artifact"""
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another process
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self, target_ratio=0.9):
+        """Remove least recently used artifacts until the cache is under target_ratio of max_bytes"""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * target_ratio
+        for path, size, _ in sorted(entries, key=lambda e: e[2]):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
@@ -0,0 +1,141 @@
+import os
+from contextlib import contextmanager
+
+# Headless mode forces the Agg backend and turns plt.show() into a no-op.
+# Enable it with HEALTH_HEADLESS=1 or enable_headless() before rendering.
+_headless = os.environ.get('HEALTH_HEADLESS', '').lower() not in ('', '0', 'false', 'no')
+
+def enable_headless():
+    """Render without a display: force the Agg backend and skip plt.show()"""
+    global _headless
+    _headless = True
+    import matplotlib
+    matplotlib.use('Agg')
+
+def is_headless():
+    """Check whether headless mode is on"""
+    return _headless
+
+def get_pyplot():
+    """Import pyplot on first use (with the Agg backend in headless mode)"""
+    if _headless:
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def get_seaborn():
+    """Import seaborn on first use"""
+    get_pyplot()
+    import seaborn as sns
+    return sns
+
+def show_figures():
+    """Show open figures, unless running headless"""
+    if not _headless:
+        get_pyplot().show()
+
+# Figure pool for long-running processes; off unless enabled with
+# HEALTH_FIGURE_POOL=1 or enable_figure_pool()
+_pool = None
+
+def _agg_figure(figsize, **kwargs):
+    """Create a figure on its own Agg canvas, outside pyplot's figure registry"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize, **kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+def _reset_figure(fig):
+    """Drop everything drawn on a figure, back to its freshly created layout"""
+    import matplotlib
+    fig.clear()
+    fig.subplotpars.update(**{name: matplotlib.rcParams['figure.subplot.' + name]
+                              for name in ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')})
+
+class FigurePool:
+    """Idle figures kept per (size, dpi, colors) for reuse across renders
+
+    A released figure is cleared and parked rather than rebuilt, so its
+    canvas and the Agg renderer buffer are reused by the next render of
+    the same size. At most max_idle figures are kept per size, which
+    bounds the memory the pool holds.
+    """
+
+    def __init__(self, max_idle=1):
+        self.max_idle = max_idle
+        self.created = 0
+        self.reused = 0
+        self._idle = {}
+
+    def acquire(self, figsize, dpi=None, facecolor=None, edgecolor=None):
+        import matplotlib
+        rc = matplotlib.rcParams
+        # Resolve rcParams defaults now, so figures made under a style only match that style
+        key = (tuple(figsize), dpi or rc['figure.dpi'], facecolor or rc['figure.facecolor'],
+               edgecolor or rc['figure.edgecolor'])
+        idle = self._idle.get(key)
+        if idle:
+            self.reused += 1
+            return idle.pop()
+        self.created += 1
+        fig = _agg_figure(key[0], dpi=key[1], facecolor=key[2], edgecolor=key[3])
+        fig._pool_key = key
+        return fig
+
+    def release(self, fig):
+        _reset_figure(fig)
+        idle = self._idle.setdefault(fig._pool_key, [])
+        if len(idle) < self.max_idle:
+            idle.append(fig)
+
+def enable_figure_pool(max_idle=1):
+    """Reuse headless figures between renders instead of creating new ones"""
+    global _pool
+    _pool = FigurePool(max_idle)
+    return _pool
+
+def get_figure_pool():
+    """Get the active FigurePool, or None"""
+    return _pool
+
+if os.environ.get('HEALTH_FIGURE_POOL', '').lower() not in ('', '0', 'false', 'no'):
+    enable_figure_pool()
+
+def new_figure(figsize, **kwargs):
+    """Get a figure to render on
+
+    Headless, this is a pyplot-free figure (from the pool when enabled), so
+    nothing is left behind in pyplot's registry; with a display it is a
+    regular pyplot figure that show_figures() can show.
+    """
+    if not _headless:
+        return get_pyplot().figure(figsize=figsize, **kwargs)
+    if _pool is not None:
+        return _pool.acquire(figsize, **kwargs)
+    return _agg_figure(figsize, **kwargs)
+
+def release_figure(fig):
+    """Tear down a figure from new_figure(): close it, or hand it back to the pool"""
+    if getattr(fig, '_pool_key', None) is not None and _pool is not None:
+        _pool.release(fig)
+        return
+    if fig.canvas.manager is not None:
+        get_pyplot().close(fig)
+    # Clearing breaks the figure/artist reference cycles, so memory comes back without a gc pass
+    fig.clear()
+
+@contextmanager
+def render_figure(figsize, show=False, **kwargs):
+    """Context manager giving a figure from new_figure() that is always released
+
+    With show, open figures are shown (unless headless) before the release.
+    """
+    fig = new_figure(figsize, **kwargs)
+    try:
+        yield fig
+        if show:
+            show_figures()
+    finally:
+        release_figure(fig)
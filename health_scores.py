@@ -0,0 +1,115 @@
+import argparse
+import json
+import sys
+import time
+from health_categories import CATEGORIES, TEST_CATEGORIES
+from health_classify import STATUS_SCORES, DEFAULT_SCORE
+from health_stream import iter_reports, is_report_stream, patient_key
+
+# Reported statuses that count as abnormal results
+ABNORMAL_STATUSES = ('HIGH', 'LOW', 'ABNORMAL')
+
+def panel_score(tests):
+    """Share of NORMAL results among tests with a status, in percent (the blood panel's score)"""
+    total_tests = len([t for t in tests if t.get('status') is not None])
+    normal_tests = sum(1 for test in tests if test.get('status') == 'NORMAL')
+    score = (normal_tests / total_tests) * 100 if total_tests > 0 else 0
+    return round(score, 1)
+
+def category_scores(tests):
+    """Average status score per radar category (0 when no test falls in it)"""
+    totals = dict.fromkeys(CATEGORIES, 0)
+    counts = dict.fromkeys(CATEGORIES, 0)
+    for test in tests:
+        category = TEST_CATEGORIES.category(test.get('name', ''))
+        if category is not None:
+            totals[category] += STATUS_SCORES.get(test.get('status', 'NORMAL'), DEFAULT_SCORE)
+            counts[category] += 1
+    return {category: round(totals[category] / counts[category], 1) if counts[category] else 0
+            for category in CATEGORIES}
+
+def overall_score(scores):
+    """Average of the non-zero category scores (the radar's overall score)"""
+    valid_scores = [score for score in scores.values() if score > 0]
+    return round(sum(valid_scores) / len(valid_scores), 1) if valid_scores else 0
+
+def get_health_condition(score):
+    """Map an overall score to its (condition, color) rating"""
+    if score >= 90:
+        return "Excellent", "green"
+    elif score >= 75:
+        return "Good", "blue"
+    elif score >= 60:
+        return "Fair", "orange"
+    else:
+        return "Needs Attention", "red"
+
+def abnormal_tests(tests):
+    """Tests reported HIGH, LOW or ABNORMAL"""
+    return [test for test in tests if test.get('status') in ABNORMAL_STATUSES]
+
+def score_report(report):
+    """Score one parsed report into a JSON-ready dict, without touching any plotting code"""
+    info = report.get('patient_info') or {}
+    tests = report.get('tests') or []
+    scores = category_scores(tests)
+    overall = overall_score(scores)
+    return {
+        'patient_id': patient_key(report),
+        'name': info.get('name'),
+        'collection_date': info.get('collection_date'),
+        'panel_score': panel_score(tests),
+        'overall_score': overall,
+        'condition': get_health_condition(overall)[0],
+        'category_scores': scores,
+        'abnormal': [{'name': test.get('name'), 'value': test.get('value'), 'unit': test.get('unit', ''),
+                      'status': test.get('status')} for test in abnormal_tests(tests)]
+    }
+
+def iter_source_reports(sources, skip_invalid=False):
+    """Yield parsed reports from report JSON files and JSONL dumps ('-' reads stdin)"""
+    for source in sources:
+        if is_report_stream(source):
+            yield from iter_reports(source, skip_invalid)
+        else:
+            with open(source, 'r', encoding='utf-8') as f:
+                yield json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score reports without rendering anything')
+    parser.add_argument('sources', nargs='*', default=['-'],
+                        help="report JSON files or JSONL dumps ('-' for stdin, the default)")
+    parser.add_argument('-o', '--output', help='write here instead of stdout')
+    parser.add_argument('--format', choices=['ndjson', 'json'], default='ndjson',
+                        help='one JSON object per line (default), or a single JSON array')
+    parser.add_argument('--skip-invalid', action='store_true', help='skip JSONL lines that are not valid JSON')
+    args = parser.parse_args(argv)
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    start = time.perf_counter()
+    count = 0
+    try:
+        results = (score_report(report) for report in iter_source_reports(args.sources, args.skip_invalid))
+        if args.format == 'json':
+            results = list(results)
+            count = len(results)
+            json.dump(results, out, ensure_ascii=False)
+            out.write('\n')
+        else:
+            for result in results:
+                out.write(json.dumps(result, ensure_ascii=False))
+                out.write('\n')
+                count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f"Scored {count:,} reports in {elapsed:.2f}s ({count / elapsed if elapsed else 0:,.0f}/s)",
+          file=sys.stderr)
+    return 0
+
+
+# Usage: python health_scores.py reports.jsonl > scores.ndjson
+#        cat reports.jsonl | python health_scores.py --format json
+if __name__ == "__main__":
+    sys.exit(main())
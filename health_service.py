@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import collections
+import contextlib
+import io
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from health_batch import GENERATORS, _init_worker
+from health_output import CONTENT_TYPES, render_bytes
+
+# Requests larger than this are rejected with 413
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+# Latencies kept for the metrics percentiles
+LATENCY_WINDOW = 1000
+
+# Options each generator accepts in a render request, with their types
+RENDER_OPTIONS = {
+    'blood': {'format': str, 'use_template': bool},
+    'radar': {'format': str},
+    'trends': {'format': str}
+}
+JSON_TYPES = {str: 'string', bool: 'boolean'}
+
+# Finished async jobs are kept this long for GET /jobs/<id>
+RESULT_TTL_SECONDS = 600
+
+HTTP_REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+                405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error',
+                503: 'Service Unavailable'}
+
+def _warm_worker():
+    """Draw some text once so the worker has pyplot, seaborn and the font cache loaded"""
+    import health_runtime
+    health_runtime.get_seaborn()
+    with health_runtime.render_figure((2, 1)) as fig:
+        fig.text(0.5, 0.5, 'warm-up', fontweight='bold')
+        fig.canvas.draw()
+    time.sleep(0.2)  # Hold this process so the other warm-ups go to other workers
+    return os.getpid()
+
+def render_job_bytes(generator, reports, options):
+    """Render one image in memory inside a worker and return (image bytes, seconds, error)"""
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            image = render_bytes(generator, reports, **options)
+        return image, time.perf_counter() - start, None
+    except Exception:
+        return None, time.perf_counter() - start, traceback.format_exc().strip().splitlines()[-1]
+
+def parse_render_request(generator, body):
+    """Validate a render request body, returning (reports, options)
+
+    The body is one report, a list of reports (oldest first), or
+    {"reports": [...], "options": {...}}; options may set "format" (png,
+    svg or pdf), and "use_template" for the blood panel. Only the trend
+    chart uses more than the latest report. Raises ValueError for anything
+    else, so the client gets a 400.
+    """
+    if generator not in GENERATORS:
+        raise ValueError(f"unknown generator '{generator}' (expected one of: {', '.join(GENERATORS)})")
+    payload = json.loads(body)
+    options = {}
+    if isinstance(payload, dict) and 'reports' in payload:
+        options = payload.get('options') or {}
+        if not isinstance(options, dict):
+            raise ValueError("'options' must be a JSON object")
+        options = dict(options)
+        payload = payload['reports']
+    reports = payload if isinstance(payload, list) else [payload]
+    if not reports or not all(isinstance(report, dict) for report in reports):
+        raise ValueError('expected a report object or a non-empty list of reports')
+    if not all(isinstance(report.get('patient_info') or {}, dict) for report in reports):
+        raise ValueError("'patient_info' must be a JSON object")
+    accepted = RENDER_OPTIONS[generator]
+    for name, value in options.items():
+        if name not in accepted:
+            raise ValueError(f"unknown option '{name}' for {generator} (expected: {', '.join(accepted)})")
+        if not isinstance(value, accepted[name]):
+            raise ValueError(f"option '{name}' must be a JSON {JSON_TYPES[accepted[name]]}")
+    if options.setdefault('format', 'png') not in CONTENT_TYPES:
+        raise ValueError(f"unsupported format '{options['format']}' (expected one of: {', '.join(CONTENT_TYPES)})")
+    if generator == 'trends':
+        return reports, options
+    # Imported here, as it pulls in numpy
+    from health_cohort import latest_report
+    return [latest_report(reports)], options
+
+class Job:
+    """One queued render"""
+    __slots__ = ('id', 'generator', 'reports', 'options', 'queued_at', 'started_at',
+                 'finished_at', 'image', 'error', 'done')
+
+    def __init__(self, generator, reports, options):
+        self.id = uuid.uuid4().hex
+        self.generator = generator
+        self.reports = reports
+        self.options = options
+        self.queued_at = time.perf_counter()
+        self.started_at = self.finished_at = None
+        self.image = self.error = None
+        self.done = asyncio.Event()
+
+class RenderService:
+    """asyncio front end feeding a pool of pre-warmed render processes
+
+    Requests go onto a bounded queue; one dispatcher per worker takes
+    jobs off it and awaits the render in the pool, so queue depth shows
+    how far behind the workers are. If a worker process dies, the pool
+    is rebuilt and the jobs it took down are retried once.
+    """
+
+    def __init__(self, workers=None, max_queue=256):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue = asyncio.Queue(max_queue)
+        self.jobs = {}
+        self.pool = None
+        self.started = time.time()
+        self.counts = collections.Counter()
+        self.latency = {name: collections.deque(maxlen=LATENCY_WINDOW)
+                        for name in ('queue_wait', 'render', 'total')}
+        self._dispatchers = []
+        self._restart_lock = asyncio.Lock()
+
+    def start_pool(self):
+        """Start the worker processes and warm each of them up"""
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        # The warm-up tasks block for a moment, so each lands on its own process
+        warmups = [self.pool.submit(_warm_worker) for _ in range(self.workers)]
+        wait(warmups)
+        return len({future.result() for future in warmups})
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.start_pool)
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._dispatchers:
+            task.cancel()
+        if self.pool:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, generator, reports, options):
+        """Queue a render; raises asyncio.QueueFull when the queue is full"""
+        job = Job(generator, reports, options)
+        self.queue.put_nowait(job)
+        self.jobs[job.id] = job
+        self.counts['submitted'] += 1
+        self._expire_jobs()
+        return job
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            job.started_at = time.perf_counter()
+            try:
+                job.image, seconds, job.error = await self._render(job)
+            except Exception as exc:  # e.g. the retry's worker died too
+                job.error, seconds = f'{type(exc).__name__}: {exc}', time.perf_counter() - job.started_at
+            job.finished_at = time.perf_counter()
+            job.reports = None  # Finished jobs only keep their result
+            self.counts['failed' if job.error else 'completed'] += 1
+            self.counts['rendered_' + job.generator] += 1
+            self.latency['queue_wait'].append(job.started_at - job.queued_at)
+            self.latency['render'].append(seconds)
+            self.latency['total'].append(job.finished_at - job.queued_at)
+            job.done.set()
+            self.queue.task_done()
+
+    async def _render(self, job):
+        """Render a job in the pool, rebuilding the pool and retrying once if it broke"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = self.pool
+            try:
+                return await loop.run_in_executor(pool, render_job_bytes, job.generator, job.reports, job.options)
+            except BrokenProcessPool:
+                await self._restart_pool(pool)
+                if attempt:
+                    raise
+
+    async def _restart_pool(self, broken):
+        """Replace a broken pool once, however many dispatchers saw it break"""
+        async with self._restart_lock:
+            if self.pool is not broken:
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            await asyncio.get_running_loop().run_in_executor(None, self.start_pool)
+            self.counts['pool_restarts'] += 1
+
+    def _expire_jobs(self):
+        now = time.perf_counter()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > RESULT_TTL_SECONDS]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def metrics(self):
+        """Queue depth, throughput counters and latency percentiles (seconds)"""
+        def percentiles(samples):
+            if not samples:
+                return None
+            ordered = sorted(samples)
+            pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+            return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(ordered[-1], 4)}
+
+        in_flight = sum(1 for job in self.jobs.values()
+                        if job.started_at is not None and job.finished_at is None)
+        return {
+            'workers': self.workers,
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'in_flight': in_flight,
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'counts': dict(self.counts),
+            'latency_seconds': {name: percentiles(samples) for name, samples in self.latency.items()}
+        }
+
+    async def handle(self, method, path, body):
+        """Route one request, returning (status, content type, body bytes)"""
+        parts = [part for part in path.split('?', 1)[0].split('/') if part]
+        if method == 'GET' and parts == ['metrics']:
+            return _json_response(200, self.metrics())
+        if method == 'GET' and parts == ['healthz']:
+            return _json_response(200, {'status': 'ok'})
+
+        if len(parts) == 2 and parts[0] in ('render', 'jobs') and method == 'POST':
+            try:
+                reports, options = parse_render_request(parts[1], body)
+            except ValueError as exc:  # Includes invalid JSON
+                return _json_response(400, {'error': str(exc)})
+            try:
+                job = self.submit(parts[1], reports, options)
+            except asyncio.QueueFull:
+                self.counts['rejected'] += 1
+                return _json_response(503, {'error': 'render queue is full, retry later'})
+            if parts[0] == 'jobs':
+                return _json_response(202, {'job_id': job.id, 'status_url': f'/jobs/{job.id}'})
+            await job.done.wait()
+            # Nobody polls a synchronous render, so don't keep its image around
+            self.jobs.pop(job.id, None)
+            return _job_response(job)
+
+        if len(parts) == 2 and parts[0] == 'jobs' and method == 'GET':
+            job = self.jobs.get(parts[1])
+            if job is None:
+                return _json_response(404, {'error': 'unknown or expired job'})
+            if not job.done.is_set():
+                return _json_response(202, {'job_id': job.id, 'status': 'queued' if job.started_at is None
+                                            else 'rendering'})
+            return _job_response(job)
+
+        if parts and parts[0] in ('render', 'jobs', 'metrics', 'healthz'):
+            return _json_response(405, {'error': f'{method} not allowed here'})
+        return _json_response(404, {'error': 'not found'})
+
+    async def serve_connection(self, reader, writer):
+        """Handle one HTTP/1.1 request per connection"""
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1')
+                if line in ('\r\n', '\n', ''):
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                response = _json_response(400, {'error': 'malformed request line'})
+            else:
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    response = _json_response(400, {'error': 'invalid Content-Length'})
+                elif length > MAX_BODY_BYTES:
+                    response = _json_response(413, {'error': f'body over {MAX_BODY_BYTES} bytes'})
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    response = await self.handle(request_line[0].upper(), request_line[1], body)
+            status, content_type, payload = response
+            writer.write(f'HTTP/1.1 {status} {HTTP_REASONS.get(status, "")}\r\n'
+                         f'Content-Type: {content_type}\r\n'
+                         f'Content-Length: {len(payload)}\r\n'
+                         'Connection: close\r\n\r\n'.encode('latin-1') + payload)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+def _json_response(status, data):
+    return status, 'application/json', json.dumps(data).encode('utf-8')
+
+def _job_response(job):
+    if job.error:
+        return _json_response(500, {'job_id': job.id, 'error': job.error})
+    return 200, CONTENT_TYPES[job.options['format']], job.image
+
+async def serve(host='127.0.0.1', port=8750, socket_path=None, workers=None, max_queue=256):
+    """Run the service until SIGINT/SIGTERM"""
+    service = RenderService(workers, max_queue)
+    print(f"Warming up {service.workers} worker(s)...", flush=True)
+    await service.start()
+    if socket_path:
+        server = await asyncio.start_unix_server(service.serve_connection, path=socket_path)
+        where = f'unix:{socket_path}'
+    else:
+        server = await asyncio.start_server(service.serve_connection, host, port)
+        where = f'http://{host}:{port}'
+    print(f"✓ Render service listening on {where}", flush=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    async with server:
+        await stop.wait()
+    await service.stop()
+    if socket_path and os.path.exists(socket_path):
+        os.remove(socket_path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve report renders from warm worker processes')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8750)
+    parser.add_argument('--socket', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='render processes (default: CPU count)')
+    parser.add_argument('--max-queue', type=int, default=256, help='queued renders before returning 503')
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.host, args.port, args.socket, args.workers, args.max_queue))
+    return 0
+
+
+# Usage: python health_service.py --port 8750
+#        curl --data-binary @health_report_data.json http://127.0.0.1:8750/render/blood -o blood.png
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+import gzip
+import itertools
+import json
+import re
+import sys
+
+def open_report_stream(path):
+    """Open a JSONL dump for line-by-line reading ('-' reads stdin, .gz is decompressed)"""
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+def is_report_stream(path):
+    """Check whether a path names a JSONL dump rather than a single report"""
+    return path == '-' or path.endswith(('.jsonl', '.jsonl.gz', '.ndjson', '.ndjson.gz'))
+
+def iter_reports(path, skip_invalid=False):
+    """Lazily yield one parsed report per line of a JSONL dump
+
+    Only the current line is held in memory, so the file can be any size.
+    Invalid lines raise ValueError unless skip_invalid is set.
+    """
+    stream = open_report_stream(path)
+    try:
+        for line_no, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                report = json.loads(line)
+            except json.JSONDecodeError as e:
+                if skip_invalid:
+                    print(f"Warning: skipping invalid JSON on line {line_no} of '{path}': {e}",
+                          file=sys.stderr)
+                    continue
+                raise ValueError(f"Invalid JSON on line {line_no} of '{path}': {e}") from e
+            yield report
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def patient_key(report):
+    """Identify the patient a report belongs to"""
+    patient_info = report.get('patient_info') or {}
+    return str(patient_info.get('registration_number') or patient_info.get('name') or 'unknown')
+
+def safe_patient_id(key):
+    """Turn a patient key into a name usable as a file or directory name"""
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', key).strip('_') or 'unknown'
+
+def group_by_patient(reports, key=patient_key):
+    """Yield (patient_key, [reports]) for consecutive reports of the same patient
+
+    Dumps are expected to be sorted by patient; only one patient's reports
+    are held at a time.
+    """
+    for patient, group in itertools.groupby(reports, key=key):
+        yield patient, list(group)
@@ -0,0 +1,415 @@
+import argparse
+import json
+import sys
+import time
+from collections import namedtuple
+import numpy as np
+from health_classify import classify_values, LOW, NORMAL, HIGH
+from health_names import TEST_NAMES
+
+# Reports in the trailing window the rolling mean and z-score compare against
+ROLLING_WINDOW = 5
+
+# |z| at or above this marks a point as unusual for its recent history
+ANOMALY_Z = 3.0
+
+# Mean-shift statistic at or above this marks a change point
+CHANGE_POINT_SCORE = 4.0
+
+# Points needed on each side of a change point
+CHANGE_POINT_MIN_SIZE = 2
+
+# |t| of a fitted slope needed before a trend over 3+ reports counts as real
+SLOPE_T = 2.0
+
+# Fitted changes smaller than this (percent of the fitted start) count as flat
+FLAT_PERCENT = 0.1
+
+# Trend codes, matching the trend chart's legend
+FLAT, CHANGED, IMPROVED, WORSE = 0, 1, 2, 3
+TREND_NAMES = np.array(['FLAT', 'CHANGED', 'IMPROVED', 'WORSE'])
+
+# Line colors per trend code: yellow, blue, green, red
+TREND_COLORS = np.array(['#f39c12', '#3498db', '#2ecc71', '#e74c3c'])
+
+# One marker's row of a TrendStats, for plotting
+MarkerTrend = namedtuple('MarkerTrend', ['slope', 'pct_change', 'trend', 'color', 'rolling_mean',
+                                         'zscores', 'time_in_range', 'change_point', 'deteriorating'])
+
+def _centered(values):
+    """Get (mask, row means, values minus their row mean with 0 where missing)
+
+    Centering first keeps running sums of squares precise for large values.
+    """
+    mask = ~np.isnan(values)
+    counts = mask.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        center = np.where(counts > 0, np.where(mask, values, 0).sum(axis=1) / counts, 0.0)
+    return mask, center, np.where(mask, values - center[:, None], 0.0)
+
+def _positions(values, x):
+    if x is None:
+        return np.arange(values.shape[1], dtype=float)
+    return np.asarray(x, dtype=float)
+
+def linear_fits(values, x=None):
+    """Least-squares (slopes, intercepts, slope t statistics) per row, skipping NaN
+
+    Slopes and intercepts need 2 points and t statistics 3, else they are NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    x = np.broadcast_to(_positions(values, x), values.shape)
+    mask = ~np.isnan(values)
+    counts = mask.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = np.where(mask, x, 0).sum(axis=1) / counts
+        y_mean = np.where(mask, values, 0).sum(axis=1) / counts
+        dx = np.where(mask, x - x_mean[:, None], 0)
+        dy = np.where(mask, values - y_mean[:, None], 0)
+        sxx, sxy, syy = (dx * dx).sum(axis=1), (dx * dy).sum(axis=1), (dy * dy).sum(axis=1)
+        slopes = sxy / sxx
+        residual = np.maximum(syy - slopes * sxy, 0) / (counts - 2)
+        t_stats = slopes / np.sqrt(residual / sxx)
+    slopes[counts < 2] = np.nan
+    t_stats[counts < 3] = np.nan
+    return slopes, y_mean - slopes * x_mean, t_stats
+
+def rolling_stats(values, window=ROLLING_WINDOW):
+    """Get (rolling means, z-scores) comparing each point with the `window` reports before it
+
+    Missing reports count toward the window but not the statistics; a z-score
+    needs two earlier points with some spread, else it is NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    n_rows, n_points = values.shape
+    mask, center, centered = _centered(values)
+
+    def prefix(a):
+        return np.concatenate([np.zeros((n_rows, 1)), np.cumsum(a, axis=1)], axis=1)
+
+    sums, squares, counts = prefix(centered), prefix(centered ** 2), prefix(mask.astype(float))
+    end = np.arange(n_points)
+    start = np.maximum(end - window, 0)
+    n = counts[:, end] - counts[:, start]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (sums[:, end] - sums[:, start]) / n
+        var = (squares[:, end] - squares[:, start]) / n - mean ** 2
+        std = np.sqrt(np.maximum(var, 0))
+        zscores = (centered - mean) / std
+    spread = std > 1e-9 * (np.abs(center)[:, None] + 1)
+    zscores = np.where(mask & (n >= 2) & spread, zscores, np.nan)
+    return np.where(n >= 1, mean + center[:, None], np.nan), zscores
+
+def time_in_range(values, mins, maxs):
+    """Fraction of each row's measured points inside its (min, max); NaN when unknown"""
+    codes = classify_values(values, np.asarray(mins, dtype=float)[:, None],
+                            np.asarray(maxs, dtype=float)[:, None])
+    known = (codes == LOW) | (codes == NORMAL) | (codes == HIGH)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (codes == NORMAL).sum(axis=1) / known.sum(axis=1)
+
+def change_points(values, min_size=CHANGE_POINT_MIN_SIZE):
+    """Find each row's most likely single shift in level
+
+    Every split with at least min_size measured points on each side is
+    scored with a two-sample t statistic (pooled variance); returns
+    (positions, scores) of the best split per row, the position being the
+    first point after the shift (-1 and 0 when no split is possible).
+    """
+    values = np.asarray(values, dtype=float)
+    mask, center, centered = _centered(values)
+    counts, sums, squares = mask.cumsum(axis=1), centered.cumsum(axis=1), (centered ** 2).cumsum(axis=1)
+    total, total_sum, total_squares = counts[:, -1:], sums[:, -1:], squares[:, -1:]
+    # The left side of a split at k is the points before k
+    left, left_sum, left_squares = counts - mask, sums - centered, squares - centered ** 2
+    right, right_sum, right_squares = total - left, total_sum - left_sum, total_squares - left_squares
+    with np.errstate(invalid='ignore', divide='ignore'):
+        left_mean, right_mean = left_sum / left, right_sum / right
+        within = (left_squares - left_sum * left_mean) + (right_squares - right_sum * right_mean)
+        pooled = np.sqrt(np.maximum(within, 0) / (total - 2))
+        # Floor the spread, so flat segments either side of a jump score high but finite
+        pooled = np.maximum(pooled, 1e-9 * (np.abs(center)[:, None] + 1))
+        scores = np.abs(left_mean - right_mean) / (pooled * np.sqrt(1 / left + 1 / right))
+    scores = np.where(mask & (left >= min_size) & (right >= min_size), scores, 0.0)
+    positions = scores.argmax(axis=1)
+    best = scores[np.arange(len(values)), positions]
+    return np.where(best > 0, positions, -1), best
+
+class TrendStats:
+    """Trend statistics for a matrix of series, one row per marker (or patient marker)
+
+    values is (series, reports) with NaN for missing reports (at least one
+    report column); mins/maxs are each row's normal range (NaN when
+    unknown). Every statistic is computed for all rows at once:
+
+    - slope/intercept/slope_t: least-squares line over the report positions
+    - pct_change: fitted change from the first to the last measured report
+    - rolling_mean/zscores: each point against the reports before it
+    - time_in_range: share of measured points inside the range
+    - change_point/change_score: most likely shift in level (-1 for none
+      scoring at least CHANGE_POINT_SCORE)
+    - trend: FLAT/CHANGED/IMPROVED/WORSE, the trend chart's line colors
+    - deteriorating: latest value out of range and moving away from it, by
+      a significant slope (any change with two reports) or a level shift
+    - severity: distance of the latest value outside the range, in range widths
+    """
+
+    def __init__(self, values, mins, maxs, x=None, window=ROLLING_WINDOW):
+        values = np.asarray(values, dtype=float)
+        self.values = values
+        self.mins = np.asarray(mins, dtype=float)
+        self.maxs = np.asarray(maxs, dtype=float)
+        x = _positions(values, x)
+        mask = ~np.isnan(values)
+        counts = mask.sum(axis=1)
+        rows = np.arange(len(values))
+        first_idx = mask.argmax(axis=1)
+        last_idx = values.shape[1] - 1 - mask[:, ::-1].argmax(axis=1)
+        self.counts = counts
+        self.first = values[rows, first_idx]
+        self.latest = values[rows, last_idx]
+
+        self.slope, self.intercept, self.slope_t = linear_fits(values, x)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fitted_first = self.intercept + self.slope * x[first_idx]
+            change = self.slope * (x[last_idx] - x[first_idx])
+            self.pct_change = np.where((counts > 1) & (fitted_first != 0), change / fitted_first * 100, 0.0)
+        self.rolling_mean, self.zscores = rolling_stats(values, window)
+        self.time_in_range = time_in_range(values, self.mins, self.maxs)
+        positions, scores = change_points(values)
+        self.change_score = scores
+        self.change_point = np.where(scores >= CHANGE_POINT_SCORE, positions, -1)
+
+        first_code = classify_values(self.first, self.mins, self.maxs)
+        latest_code = classify_values(self.latest, self.mins, self.maxs)
+        self.latest_code = latest_code
+        has_range = ~(np.isnan(self.mins) | np.isnan(self.maxs))
+        flat = np.abs(self.pct_change) < FLAT_PERCENT
+        first_normal, latest_normal = first_code == NORMAL, latest_code == NORMAL
+        # Same rules as the two-report colors: judged on the range when there is
+        # one, else on the direction of change (a fall counts as improved)
+        with_range = np.where(latest_normal,
+                              np.where(first_normal, np.where(flat, FLAT, CHANGED), IMPROVED), WORSE)
+        without_range = np.where(flat, FLAT, np.where(self.pct_change > 0, WORSE, IMPROVED))
+        self.trend = np.where(has_range, with_range, without_range).astype(np.int8)
+
+        # Direction away from the range: +1 above it, -1 below it
+        away = np.where(latest_code == HIGH, 1, np.where(latest_code == LOW, -1, 0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Two reports only give a direction; longer histories need a significant slope
+            trending = np.where(counts > 2, np.abs(self.slope_t) >= SLOPE_T, counts == 2)
+            moving_away = trending & (np.sign(self.slope) == away)
+            after = mask & (np.arange(values.shape[1]) >= self.change_point[:, None])
+            before = mask & ~after
+            shift = (np.where(after, values, 0).sum(axis=1) / after.sum(axis=1)
+                     - np.where(before, values, 0).sum(axis=1) / before.sum(axis=1))
+            shifted_away = (self.change_point >= 0) & (np.sign(shift) == away)
+            self.deteriorating = has_range & (away != 0) & (moving_away | shifted_away)
+            width = np.where(self.maxs > self.mins, self.maxs - self.mins, np.abs(self.maxs) + 1)
+            outside = np.maximum(self.mins - self.latest, 0) + np.maximum(self.latest - self.maxs, 0)
+            self.severity = np.where(has_range & (counts > 0), outside / width, np.nan)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def colors(self):
+        return TREND_COLORS[self.trend]
+
+    def anomalies(self):
+        """Boolean (series, reports) mask of points at least ANOMALY_Z from their rolling mean"""
+        with np.errstate(invalid='ignore'):
+            return np.abs(self.zscores) >= ANOMALY_Z
+
+    def marker(self, idx):
+        """Get one row's statistics as a MarkerTrend"""
+        return MarkerTrend(float(self.slope[idx]), float(self.pct_change[idx]), int(self.trend[idx]),
+                           str(TREND_COLORS[self.trend[idx]]), self.rolling_mean[idx], self.zscores[idx],
+                           float(self.time_in_range[idx]), int(self.change_point[idx]),
+                           bool(self.deteriorating[idx]))
+
+def series_stats(test_data, tests=None):
+    """Compute TrendStats over build_trend_series() output, one row per test (in `tests` order)"""
+    tests = list(test_data) if tests is None else list(tests)
+    n_points = len(next(iter(test_data.values()))['values']) if test_data else 1
+    values = np.full((len(tests), n_points), np.nan)
+    bounds = np.full((len(tests), 2), np.nan)
+    for row, name in enumerate(tests):
+        values[row] = test_data[name]['values']
+        if test_data[name]['normal_range'] is not None:
+            bounds[row] = test_data[name]['normal_range']
+    return TrendStats(values, bounds[:, 0], bounds[:, 1])
+
+def _flag_rows(patient_ids, tests, stats, row_patients, row_tests):
+    """Turn a chunk's deteriorating rows into flag records"""
+    flags = []
+    for row in np.flatnonzero(stats.deteriorating).tolist():
+        flags.append({
+            'patient_id': patient_ids[row_patients[row]],
+            'test': tests[row_tests[row]],
+            'latest': float(stats.latest[row]),
+            'normal_min': float(stats.mins[row]),
+            'normal_max': float(stats.maxs[row]),
+            'status': 'HIGH' if stats.latest_code[row] == HIGH else 'LOW',
+            'reports': int(stats.counts[row]),
+            'slope_per_report': float(stats.slope[row]),
+            'time_in_range': float(stats.time_in_range[row]),
+            'change_point': int(stats.change_point[row]),
+            'severity': float(stats.severity[row])
+        })
+    return flags
+
+def flag_patients(patients, tests=None, chunk_size=5000):
+    """Flag deteriorating markers for (patient_id, reports) pairs
+
+    Each patient's reports are joined with build_trend_series(); the
+    statistics then run on a stacked (patient marker, report) matrix a
+    chunk of patients at a time. Returns (patients screened, flags sorted
+    by severity, worst first).
+    """
+    import health_trends_generator as trends
+
+    tests = list(tests or trends.key_tests)
+    patient_ids, flags = [], []
+    chunk = []
+
+    def flush():
+        if not chunk:
+            return
+        width = max(len(series['values']) for _, _, series in chunk)
+        values = np.full((len(chunk), width), np.nan)
+        bounds = np.full((len(chunk), 2), np.nan)
+        for row, (_, _, series) in enumerate(chunk):
+            values[row, :len(series['values'])] = series['values']
+            if series['normal_range'] is not None:
+                bounds[row] = series['normal_range']
+        stats = TrendStats(values, bounds[:, 0], bounds[:, 1])
+        flags.extend(_flag_rows(patient_ids, tests, stats, [c[0] for c in chunk], [c[1] for c in chunk]))
+        chunk.clear()
+
+    for patient_id, reports in patients:
+        _, test_data = trends.build_trend_series(trends.load_reports(reports))
+        for col, name in enumerate(tests):
+            if name in test_data:
+                chunk.append((len(patient_ids), col, test_data[name]))
+        patient_ids.append(patient_id)
+        if len(patient_ids) % chunk_size == 0:
+            flush()
+    flush()
+    flags.sort(key=lambda flag: -flag['severity'])
+    return len(patient_ids), flags
+
+def flag_store(store, tests=None, chunk_size=5000):
+    """Flag deteriorating markers straight from a ColumnarStore, without rebuilding reports
+
+    Rows are scattered into a (patient marker, report position) matrix by
+    array indexing, each patient's reports ordered by date (undated ones
+    first, then stored order). A marker's range is the one its latest
+    measured row states, else the sex-specific or per-test default.
+    Returns (patients screened, flags sorted by severity, worst first).
+    """
+    import health_trends_generator as trends
+    from health_ranges import RANGES, normalize_sex
+
+    tests = list(tests or trends.key_tests)
+    n_tests = len(tests)
+    patients = np.asarray(store.reports['patient'])
+    dates = np.asarray(store.reports['date']).view(np.int64)
+
+    # Patient rows in order of first appearance, and each report's position in its patient's history
+    unique, first, inverse = np.unique(patients, return_index=True, return_inverse=True)
+    patient_order = np.argsort(first, kind='stable')
+    patient_row = np.empty(len(unique), dtype=np.intp)
+    patient_row[patient_order] = np.arange(len(unique))
+    report_patient = patient_row[inverse]
+    order = np.lexsort((np.arange(len(patients)), dates, report_patient))
+    starts = np.searchsorted(report_patient[order], report_patient[order], side='left')
+    position = np.empty(len(patients), dtype=np.intp)
+    position[order] = np.arange(len(patients)) - starts
+    patient_ids = [store.strings[unique[i]] for i in patient_order]
+
+    # Fallback ranges per (test, sex id)
+    sex_of_report = np.asarray(store.reports['info_sex'])
+    sex_ids = np.unique(sex_of_report)
+    sex_index = np.full(len(store.strings), 0, dtype=np.intp)
+    sex_index[sex_ids] = np.arange(len(sex_ids))
+    defaults = np.full((n_tests, len(sex_ids), 2), np.nan)
+    for col, name in enumerate(tests):
+        for idx, sex_id in enumerate(sex_ids.tolist()):
+            bounds = RANGES.default_range(name, normalize_sex(store.strings[sex_id]))
+            if bounds:
+                defaults[col, idx] = bounds
+
+    row_reports = np.asarray(store.rows['report'])
+    row_names = np.asarray(store.rows['name'])
+    row_columns = TEST_NAMES.column_map(store.strings, row_names, tests)[row_names]
+    keep = np.flatnonzero(row_columns >= 0)
+    row_patients = report_patient[row_reports[keep]]
+    # Group rows by patient so each chunk is one contiguous slice
+    by_patient = np.argsort(row_patients, kind='stable')
+    keep, row_patients = keep[by_patient], row_patients[by_patient]
+
+    flags = []
+    for chunk_start in range(0, len(patient_ids), chunk_size):
+        lo, hi = np.searchsorted(row_patients, [chunk_start, chunk_start + chunk_size])
+        rows = keep[lo:hi]
+        series = (row_patients[lo:hi] - chunk_start) * n_tests + row_columns[rows]
+        reports = row_reports[rows]
+        n_series = min(chunk_size, len(patient_ids) - chunk_start) * n_tests
+        width = int(position[reports].max()) + 1 if len(rows) else 1
+        values = np.full((n_series, width), np.nan)
+        factors = store.unit_factors()[rows]
+        values[series, position[reports]] = store.rows['value'][rows] * factors
+
+        # Range from each series' latest measured row (later positions overwrite earlier ones)
+        measured = ~np.isnan(store.rows['value'][rows])
+        latest = np.argsort(position[reports], kind='stable')
+        latest = latest[measured[latest]]
+        bounds = np.full((n_series, 2), np.nan)
+        bounds[series[latest], 0] = (store.rows['range_min'][rows] * factors)[latest]
+        bounds[series[latest], 1] = (store.rows['range_max'][rows] * factors)[latest]
+        latest_report = np.full(n_series, -1, dtype=np.intp)
+        latest_report[series[latest]] = reports[latest]
+        missing = np.isnan(bounds[:, 0]) & (latest_report >= 0)
+        fallback = defaults[np.arange(n_series) % n_tests,
+                            sex_index[sex_of_report[np.maximum(latest_report, 0)]]]
+        bounds[missing] = fallback[missing]
+
+        stats = TrendStats(values, bounds[:, 0], bounds[:, 1])
+        series_ids = np.arange(n_series)
+        flags.extend(_flag_rows(patient_ids, tests, stats, series_ids // n_tests + chunk_start,
+                                series_ids % n_tests))
+    flags.sort(key=lambda flag: -flag['severity'])
+    return len(patient_ids), flags
+
+def main(argv=None):
+    from health_batch import discover_jobs
+    from health_columnar import ColumnarStore, is_columnar_store
+
+    parser = argparse.ArgumentParser(description='Flag patients whose markers are deteriorating across their reports')
+    parser.add_argument('source', help='directory of patients, manifest file, JSONL dump or columnar store')
+    parser.add_argument('-o', '--output', default='trend_flags.json', help='where to write the flags')
+    parser.add_argument('--top', type=int, default=10, help='flags to print (worst first)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if is_columnar_store(args.source):
+        n_patients, flags = flag_store(ColumnarStore(args.source))
+    else:
+        n_patients, flags = flag_patients(discover_jobs(args.source))
+    flagged = len({flag['patient_id'] for flag in flags})
+    print(f"Screened {n_patients:,} patients in {time.perf_counter() - start:.1f}s: "
+          f"{flagged:,} with deteriorating markers ({len(flags):,} markers)")
+    for flag in flags[:args.top]:
+        print(f"  {flag['patient_id']:<20} {flag['test']:<24} {flag['latest']:>10g} {flag['status']:<4} "
+              f"(range {flag['normal_min']:g}-{flag['normal_max']:g}, slope {flag['slope_per_report']:+.3g}/report)")
+
+    with open(args.output, 'w') as f:
+        json.dump({'patients': n_patients, 'flagged_patients': flagged, 'flags': flags}, f, indent=2)
+    print(f"✓ Flags saved to: {args.output}")
+    return 0
+
+
+# Usage: python health_trend_stats.py SOURCE -o trend_flags.json
+if __name__ == "__main__":
+    sys.exit(main())
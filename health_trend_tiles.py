@@ -0,0 +1,284 @@
+import argparse
+import bisect
+import hashlib
+import json
+import math
+import os
+import sys
+from datetime import datetime
+import numpy as np
+from health_instrument import span
+from health_names import TEST_NAMES
+from health_ranges import RANGES, report_context
+from health_render_cache import normalize_report
+from health_runtime import get_pyplot, get_seaborn
+from health_units import resolve_unit
+import health_trends_generator as trends
+
+# Tile and strip sizes in inches; 3 tiles across make the 20 inch wide trend figure
+TILE_SIZE = (20 / 3, 4.3)
+HEADER_SIZE = (20, 0.9)
+FOOTER_SIZE = (20, 1.3)
+GRID_COLUMNS = 3
+MAX_PANELS = 18
+BACKGROUND = '#f8f9fa'
+
+# Bump when the layout of state.json changes
+STATE_VERSION = 2
+
+class IncrementalTrendChart:
+    """Trend figure that re-renders only the panels whose series changed
+
+    Per-patient state lives in state_dir: the reports added so far (by
+    content digest, in date order) and each marker's observed series
+    (reports, values, statuses) in state.json, and every panel rendered
+    as an RGB tile keyed by a digest of its series. Each panel's x-axis covers
+    only that marker's own observations, so a report that doesn't contain
+    a marker leaves its tile untouched. The output is recomposited from
+    the tiles.
+    """
+
+    def __init__(self, state_dir, dpi=150):
+        self.state_dir = state_dir
+        self.tile_dir = os.path.join(state_dir, 'tiles')
+        self.dpi = dpi
+        os.makedirs(self.tile_dir, exist_ok=True)
+        self.state = self._load_state()
+
+    def _state_path(self):
+        return os.path.join(self.state_dir, 'state.json')
+
+    def _load_state(self):
+        try:
+            with open(self._state_path(), 'r') as f:
+                state = json.load(f)
+            if state.get('version') == trends.RENDER_VERSION and state.get('dpi') == self.dpi and \
+                    state.get('state_version') == STATE_VERSION:
+                return state
+        except FileNotFoundError:
+            pass
+        return self._empty_state()
+
+    def _empty_state(self):
+        return {'version': trends.RENDER_VERSION, 'state_version': STATE_VERSION, 'dpi': self.dpi,
+                'reports': [], 'patient_info': {}, 'series': {}, 'tiles': {}}
+
+    def _save_state(self):
+        tmp_path = self._state_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self._state_path())
+
+    def reset(self):
+        """Forget all series (tiles are cleaned up on the next render)"""
+        self.state = self._empty_state()
+
+    def add_report(self, report):
+        """Add a report's values to the series it contains; returns False when it was already added
+
+        Reports may arrive in any order: each is placed by collection date
+        (undated ones after the dated, in arrival order). A report whose
+        content, or whose date, matches one already added is skipped, so a
+        re-delivered file adds nothing.
+        """
+        digest = hashlib.sha1(normalize_report(report)).hexdigest()
+        date = trends.get_report_date(report)
+        entry = {'digest': digest, 'date': date.isoformat() if date else None}
+        known = self.state['reports']
+        if any(other['digest'] == digest or (entry['date'] and other['date'] == entry['date']) for other in known):
+            return False
+        position = bisect.bisect_right([_date_order(other) for other in known], _date_order(entry))
+        known.insert(position, entry)
+        rank = {other['digest']: idx for idx, other in enumerate(known)}
+        latest = position == len(known) - 1
+        if latest:
+            self.state['patient_info'] = report.get('patient_info') or self.state['patient_info']
+
+        context = report_context(report)
+        for test in report.get('tests', []):
+            name = TEST_NAMES.canonical(test['name'])
+            value = trends.get_numeric_value(test['value'])
+            if value is None:
+                continue
+            # Stored in the test's canonical unit, like the ranges
+            conversion = resolve_unit(name, test.get('unit', ''))
+            value *= conversion.factor
+            series = self.state['series'].setdefault(name, {
+                'reports': [], 'values': [], 'statuses': [],
+                'unit': conversion.unit
+            })
+            at = bisect.bisect_right([rank[other] for other in series['reports']], position)
+            series['reports'].insert(at, digest)
+            series['values'].insert(at, value)
+            series['statuses'].insert(at, test.get('status', 'NORMAL'))
+            # The latest report's range is the one drawn
+            if at == len(series['values']) - 1:
+                series['normal_range'] = RANGES.resolve_range(name, context, test)
+        return True
+
+    def _labels(self, name):
+        """X-axis labels of a series' points, numbered by report position"""
+        positions = {entry['digest']: (idx, entry['date']) for idx, entry in enumerate(self.state['reports'])}
+        labels = []
+        for digest in self.state['series'][name]['reports']:
+            idx, date = positions[digest]
+            labels.append(f'Report {idx + 1}\n({datetime.fromisoformat(date).strftime("%b %Y")})' if date
+                          else f'Report {idx + 1}')
+        return labels
+
+    def _series_data(self, name):
+        """Convert a stored series to the dict plot_marker() takes"""
+        series = self.state['series'][name]
+        return {
+            'values': np.array(series['values'], dtype=float),
+            'statuses': np.array(series['statuses'], dtype=object),
+            'unit': series['unit'],
+            'normal_range': tuple(series['normal_range']) if series['normal_range'] else None
+        }
+
+    def _digest(self, *parts):
+        payload = json.dumps([trends.RENDER_VERSION, self.dpi, *parts], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _tile_path(self, digest):
+        return os.path.join(self.tile_dir, digest + '.npy')
+
+    def _rasterize(self, figsize, draw):
+        """Draw onto a standalone Agg figure and return its pixels as an RGB array"""
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        plt = get_pyplot()
+        sns = get_seaborn()
+        with sns.axes_style(trends.TREND_STYLE), plt.rc_context(trends.TREND_RC):
+            fig = Figure(figsize=figsize, dpi=self.dpi, facecolor=BACKGROUND)
+            canvas = FigureCanvasAgg(fig)
+            draw(fig)
+            canvas.draw()
+            return np.asarray(canvas.buffer_rgba())[:, :, :3].copy()
+
+    def _get_tile(self, digest, figsize, draw):
+        """Load a cached tile, or render and cache it; returns (pixels, rendered)"""
+        path = self._tile_path(digest)
+        if os.path.exists(path):
+            return np.load(path), False
+        pixels = self._rasterize(figsize, draw)
+        np.save(path, pixels)
+        return pixels, True
+
+    def render(self, output_file='health_trends.png'):
+        """Recomposite the trend figure as PNG, rendering only changed panels
+
+        output_file is a path or a binary file-like object. Returns
+        (rendered, reused) panel counts.
+        """
+        series = self.state['series']
+        panels = [name for name in trends.key_tests if name in series][:MAX_PANELS]
+        tiles = {}
+        rendered = reused = 0
+
+        with span('trends.tiles', panels=len(panels)):
+            for name in panels:
+                entry = series[name]
+                labels = self._labels(name)
+                digest = self._digest('panel', name, entry, labels)
+
+                def draw_panel(fig, name=name, labels=labels):
+                    ax = fig.add_subplot()
+                    trends.plot_marker(ax, name, self._series_data(name), labels)
+                    fig.tight_layout()
+
+                tiles[name], was_rendered = self._get_tile(digest, TILE_SIZE, draw_panel)
+                self.state['tiles'][name] = digest
+                rendered += was_rendered
+                reused += not was_rendered
+
+            # Header and footer are cheap, but are cached the same way
+            info = self.state['patient_info']
+            title = (f"Health Marker Trend Analysis - {info.get('name', 'Unknown Patient')} "
+                     f"({str(info.get('age', '')).replace(' ', '')}, {str(info.get('sex', '')).title()})")
+            test_data = {name: self._series_data(name) for name in panels}
+            observations = trends.summarize_changes(test_data, panels)
+
+            def draw_header(fig):
+                fig.text(0.5, 0.5, title, ha='center', va='center', fontsize=24, fontweight='bold')
+
+            def draw_footer(fig):
+                fig.text(0.5, 0.62, observations, ha='center', va='center', fontsize=11,
+                         bbox=dict(boxstyle='round,pad=1', facecolor='#ecf0f1', edgecolor='#34495e',
+                                   linewidth=2))
+                fig.text(0.5, 0.15, trends.LEGEND_TEXT, ha='center', va='center', fontsize=9,
+                         style='italic',
+                         bbox=dict(boxstyle='round,pad=0.8', facecolor='white',
+                                   edgecolor='#7f8c8d', linewidth=1.5, alpha=0.9))
+
+            header, _ = self._get_tile(self._digest('header', title), HEADER_SIZE, draw_header)
+            footer, _ = self._get_tile(self._digest('footer', observations), FOOTER_SIZE, draw_footer)
+            self.state['strips'] = {'header': self._digest('header', title),
+                                    'footer': self._digest('footer', observations)}
+
+        with span('trends.composite'):
+            image = self._composite(header, [tiles[name] for name in panels], footer)
+        with span('trends.save'):
+            from PIL import Image
+            Image.fromarray(image).save(output_file, format='png', dpi=(self.dpi, self.dpi))
+
+        self._save_state()
+        self._remove_stale_tiles()
+        return rendered, reused
+
+    def _composite(self, header, tiles, footer):
+        """Place the header, the tile grid and the footer on one canvas"""
+        width = header.shape[1]
+        tile_h, tile_w = (tiles[0].shape[:2] if tiles else (0, width // GRID_COLUMNS))
+        rows = math.ceil(len(tiles) / GRID_COLUMNS)
+        height = header.shape[0] + rows * tile_h + footer.shape[0]
+
+        background = np.array([int(BACKGROUND[i:i + 2], 16) for i in (1, 3, 5)], dtype=np.uint8)
+        canvas = np.empty((height, width, 3), dtype=np.uint8)
+        canvas[:] = background
+        canvas[:header.shape[0], :header.shape[1]] = header
+        top = header.shape[0]
+        for idx, tile in enumerate(tiles):
+            row, col = divmod(idx, GRID_COLUMNS)
+            y, x = top + row * tile_h, col * tile_w
+            canvas[y:y + tile_h, x:x + tile_w] = tile
+        canvas[height - footer.shape[0]:, :footer.shape[1]] = footer
+        return canvas
+
+    def _remove_stale_tiles(self):
+        """Delete tiles no longer referenced by the state"""
+        live = set(self.state['tiles'].values()) | set(self.state.get('strips', {}).values())
+        live_tiles = {name: digest for name, digest in self.state['tiles'].items()
+                      if name in self.state['series']}
+        self.state['tiles'] = live_tiles
+        for name in os.listdir(self.tile_dir):
+            if name.endswith('.npy') and name[:-4] not in live:
+                os.remove(os.path.join(self.tile_dir, name))
+
+def _date_order(entry):
+    """Sort key placing dated reports by date, then undated ones"""
+    return entry['date'] is None, entry['date'] or ''
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Update a patient trend figure with new reports')
+    parser.add_argument('state_dir', help='per-patient state directory (series and cached tiles)')
+    parser.add_argument('reports', nargs='*', help='new report JSONs, in any order')
+    parser.add_argument('-o', '--output', default='health_trends.png')
+    parser.add_argument('--dpi', type=int, default=150)
+    parser.add_argument('--rebuild', action='store_true', help='forget stored series before adding reports')
+    args = parser.parse_args(argv)
+
+    chart = IncrementalTrendChart(args.state_dir, dpi=args.dpi)
+    if args.rebuild:
+        chart.reset()
+    skipped = sum(not chart.add_report(report) for report in trends.load_reports(args.reports))
+    rendered, reused = chart.render(args.output)
+    print(f"✅ Health trends chart saved as '{args.output}' "
+          f"({rendered} panel(s) rendered, {reused} reused, {skipped} report(s) already added)")
+    return 0
+
+
+# Usage: python health_trend_tiles.py state/PATIENT new_report.json -o health_trends.png
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,94 +1,30 @@
 import json
-import matplotlib.pyplot as plt
+import sys
+from datetime import datetime
 import numpy as np
-from matplotlib.patches import Rectangle
-import seaborn as sns
-
-# Set style
-sns.set_style("whitegrid")
-plt.rcParams['figure.facecolor'] = '#f8f9fa'
-plt.rcParams['axes.facecolor'] = 'white'
-
-# Load JSON data
-with open('health_report_data.json', 'r') as f:
-    report1 = json.load(f)
-
-with open('health_report_data1.json', 'r') as f:
-    report2 = json.load(f)
-
-# Define normal ranges for common tests
-NORMAL_RANGES = {
-    'HEMOGLOBIN': (13.0, 17.0),
-    'Total RBC Count': (4.5, 5.5),
-    'H.CT': (40.0, 50.0),
-    'M.C.V': (83.0, 101.0),
-    'M.C.H.': (27.0, 32.0),
-    'M.C.H.C.': (31.5, 34.5),
-    'R.D.W': (11.6, 14.0),
-    'Total WBC Count (TLC)': (4000, 11000),
-    'Platelet Count': (150000, 410000),
-    '1 Hour ESR': (0, 15),
-    'Polymorphs': (40, 75),
-    'Lymphocytes': (20, 40),
-    'Eosinophils': (1, 6),
-    'Monocytes': (2, 10),
-    'Mean Blood Glucose': (70, 100),
-    'Specific Gravity': (1.010, 1.025),
-    'Urine Volume': (800, 2000),
-    'Urine Glucose': (0, 0)
-}
+from health_classify import classify_values, NORMAL
+from health_instrument import span
+from health_model import build_report
+from health_names import TEST_NAMES
+from health_output import get_format, target_name
+from health_ranges import DEFAULT_RANGES, RANGES, report_context
+from health_runtime import get_seaborn, render_figure
+from health_trend_stats import ANOMALY_Z, TREND_COLORS, TrendStats, series_stats
+from health_units import resolve_unit
+from health_values import parse_lab_value
 
-# Extract test data
-def get_numeric_value(value):
-    """Convert test values to numeric"""
-    if isinstance(value, str):
-        # Remove non-numeric characters except dots and minus
-        value = value.replace('++', '2').replace('+', '1')
-        try:
-            return float(''.join(c for c in value if c.isdigit() or c == '.' or c == '-'))
-        except:
-            return None
-    return float(value) if value else None
+# Bump when the rendered output changes, to invalidate cached renders
+RENDER_VERSION = 7
 
-def is_within_normal_range(value, test_name):
-    """Check if value is within normal range"""
-    if test_name in NORMAL_RANGES:
-        min_val, max_val = NORMAL_RANGES[test_name]
-        return min_val <= value <= max_val
-    return None
+# Style applied while drawing (scoped, so importing the module changes nothing)
+TREND_STYLE = 'whitegrid'
+TREND_RC = {
+    'figure.facecolor': '#f8f9fa',
+    'axes.facecolor': 'white'
+}
 
-# Prepare data for plotting
-test_data = {}
-for test in report1['tests']:
-    name = test['name']
-    val1 = get_numeric_value(test['value'])
-    
-    # Find corresponding test in report2
-    val2 = None
-    test2_obj = None
-    for test2 in report2['tests']:
-        if test2['name'] == name:
-            val2 = get_numeric_value(test2['value'])
-            test2_obj = test2
-            break
-    
-    if val1 is not None and val2 is not None:
-        test_data[name] = {
-            'values': [val1, val2],
-            'unit': test.get('unit', ''),
-            'status1': test.get('status', 'NORMAL'),
-            'status2': test2_obj.get('status', 'NORMAL') if test2_obj else 'NORMAL',
-            'normal_range': NORMAL_RANGES.get(name, None)
-        }
-
-# Create subplots - 6 rows x 3 columns
-fig = plt.figure(figsize=(20, 28))
-fig.suptitle('Health Marker Trend Analysis - KIRANKUMAR PADAPUDI (38Y, Male)', 
-             fontsize=24, fontweight='bold', y=0.995)
-
-# Add subtitle
-fig.text(0.5, 0.985, '', 
-         ha='center', fontsize=14, style='italic', color='#666')
+# Fallback normal ranges, kept under their old name (reports' own ranges take priority)
+NORMAL_RANGES = DEFAULT_RANGES
 
 # Select key tests to visualize (adjust as needed)
 key_tests = [
@@ -98,159 +34,326 @@ key_tests = [
     'Mean Blood Glucose', 'Specific Gravity', 'Urine Volume', 'Urine Glucose'
 ]
 
-# Filter available tests
-available_tests = [t for t in key_tests if t in test_data]
+# Date formats seen in collection/reporting dates
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d-%b-%Y', '%d %b %Y']
 
-# Plot each test
-for idx, test_name in enumerate(available_tests[:18], 1):  # Limit to 18 charts (6x3 grid)
-    ax = plt.subplot(6, 3, idx)
-    
-    data = test_data[test_name]
-    values = data['values']
-    dates = ['Report 1\n(Jan 2025)', 'Report 2\n(Sep 2025)']
-    normal_range = data['normal_range']
-    
-    # Determine if values are within normal range
-    val1_normal = is_within_normal_range(values[0], test_name)
-    val2_normal = is_within_normal_range(values[1], test_name)
-    
-    # Calculate percentage change
-    pct_change = ((values[1] - values[0]) / values[0]) * 100 if values[0] != 0 else 0
-    
-    # Determine line color based on conditions
-    if val1_normal is not None and val2_normal is not None:
-        # Both values have normal ranges defined
-        if val1_normal and val2_normal:
-            # Both within normal range
-            if abs(pct_change) < 0.1:  # Virtually no change
-                line_color = '#f39c12'  # Yellow - no change
-            else:
-                line_color = '#3498db'  # Blue - both normal but changed
-        elif not val1_normal and not val2_normal:
-            # Both outside normal range
-            line_color = '#e74c3c'  # Red - still abnormal
-        elif not val1_normal and val2_normal:
-            # Improved to normal
-            line_color = '#2ecc71'  # Green - improved to normal
-        elif val1_normal and not val2_normal:
-            # Worsened from normal
-            line_color = '#e74c3c'  # Red - moved out of normal
-    else:
-        # No normal range defined, use percentage change
-        if abs(pct_change) < 0.1:
-            line_color = '#f39c12'  # Yellow - no change
-        elif pct_change > 0:
-            line_color = '#e74c3c'  # Red - increased
-        elif pct_change < 0:
-            line_color = '#2ecc71'  # Green - decreased
+# Color legend shown under the panels
+LEGEND_TEXT = ' | '.join([
+    '🟢 Green Band: Normal Range',
+    '🟢 Green Point/Line: Within Normal or Improved',
+    '🔵 Blue Line: Value Changed Within Normal Range',
+    '🔴 Red Point/Line: Outside Normal Range',
+    '🟡 Yellow Line: No Change in Value'
+])
+
+# Extract test data
+def get_numeric_value(value):
+    """Convert test values to numeric"""
+    return parse_lab_value(value)
+
+def is_within_normal_range(value, test_name):
+    """Check if value is within the test's fallback normal range"""
+    normal_range = RANGES.default_range(test_name)
+    if normal_range is not None:
+        min_val, max_val = normal_range
+        return bool(classify_values(value, min_val, max_val) == NORMAL)
+    return None
+
+def load_reports(paths):
+    """Load report JSON files (already-parsed reports are passed through)"""
+    reports = []
+    with span('trends.load'):
+        for path in paths:
+            if isinstance(path, dict):
+                reports.append(path)
+                continue
+            with open(path, 'r') as f:
+                reports.append(json.load(f))
+    return reports
+
+def get_report_date(report):
+    """Get collection date of a report (falls back to reporting date)"""
+    patient_info = report.get('patient_info') or {}
+    for key in ('collection_date', 'reporting_date'):
+        raw = patient_info.get(key)
+        if not raw:
+            continue
+        raw = str(raw).strip()
+        try:
+            return datetime.fromisoformat(raw)
+        except ValueError:
+            pass
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(raw, fmt)
+            except ValueError:
+                continue
+    return None
+
+def build_trend_series(reports, parsed=None):
+    """Join any number of reports into per-test series ordered by collection date
+
+    Returns (labels, test_data): one x-axis label per report and, per test name,
+    a NumPy column of values (NaN where the report lacks that test). Each test's
+    normal range is the one resolved for its latest report. Values and ranges
+    are converted to each test's canonical unit, so reports from labs using
+    different units share one axis. parsed optionally gives, per report,
+    (values, mins, maxs) arrays aligned with its tests, for callers that
+    already parsed, converted and resolved them (NaN where unknown).
+    """
+    reports = [build_report(report) for report in reports]
+    dates = [get_report_date(report) for report in reports]
+    order = list(range(len(reports)))
+    # Sort by date only when every report is dated, otherwise keep input order
+    if order and all(date is not None for date in dates):
+        order.sort(key=lambda i: dates[i])
+
+    n_reports = len(order)
+    labels = []
+    test_data = {}
+    for pos, report_idx in enumerate(order):
+        date = dates[report_idx]
+        if date is not None:
+            labels.append(f'Report {pos + 1}\n({date.strftime("%b %Y")})')
+        else:
+            labels.append(f'Report {pos + 1}')
+
+        # One pass through the report, joined on the hashed test name index
+        context = report_context(reports[report_idx])
+        if parsed is not None:
+            values, mins, maxs = parsed[report_idx]
         else:
-            line_color = '#3498db'  # Blue - no change
-    
+            values = reports[report_idx].normalized_numbers()
+        # Rows join on test id, so every spelling of a test lands in one series
+        for idx, test in enumerate(reports[report_idx].tests):
+            value = values[idx]
+            if np.isnan(value):
+                continue
+            name = TEST_NAMES.canonical(test.name)
+            data = test_data.get(name)
+            if data is None:
+                data = test_data[name] = {
+                    'values': np.full(n_reports, np.nan),
+                    'statuses': np.full(n_reports, None, dtype=object),
+                    'unit': resolve_unit(name, test.unit).unit,
+                    'normal_range': None
+                }
+            if parsed is not None:
+                data['normal_range'] = None if np.isnan(mins[idx]) or np.isnan(maxs[idx]) \
+                    else (float(mins[idx]), float(maxs[idx]))
+            else:
+                data['normal_range'] = RANGES.resolve_range(name, context, test)
+            data['values'][pos] = value
+            data['statuses'][pos] = test.status
+
+    return labels, test_data
+
+def get_trend_color(values, normal_range):
+    """Get line color from the fitted trend of a series' measured values
+
+    With two values this compares the first and the last one: yellow for no
+    change, blue for a change within range, green for improved, red for out
+    of range (or, without a range, for an increase).
+    """
+    low, high = normal_range if normal_range is not None else (np.nan, np.nan)
+    stats = TrendStats(np.asarray(values, dtype=float)[None, :], [low], [high])
+    return str(TREND_COLORS[stats.trend[0]])
+
+def plot_marker(ax, test_name, data, labels, trend=None):
+    """Plot one marker's series on its subplot
+
+    trend is the marker's MarkerTrend (from series_stats()); it is computed
+    from data when not given. Its fitted change sets both the line color
+    and the change label, so the two always agree; for longer histories
+    it also marks unusual points and a shift in level.
+    """
+    if trend is None:
+        trend = series_stats({test_name: data}).marker(0)
+    x = np.arange(len(labels))
+    mask = ~np.isnan(data['values'])
+    xs = x[mask]
+    values = data['values'][mask]
+    statuses = data['statuses'][mask]
+    normal_range = data['normal_range']
+
+    pct_change = trend.pct_change
+    line_color = trend.color
+
     # Draw normal range band if available
     if normal_range is not None:
         min_val, max_val = normal_range
-        ax.axhspan(min_val, max_val, alpha=0.15, color='#27ae60', 
+        ax.axhspan(min_val, max_val, alpha=0.15, color='#27ae60',
                    label='Normal Range', zorder=0)
         # Add range labels
-        ax.text(0.02, min_val, f'{min_val}', fontsize=8, color='#27ae60', 
+        ax.text(0.02, min_val, f'{min_val}', fontsize=8, color='#27ae60',
                 va='bottom', ha='left', alpha=0.7, fontweight='bold')
-        ax.text(0.02, max_val, f'{max_val}', fontsize=8, color='#27ae60', 
+        ax.text(0.02, max_val, f'{max_val}', fontsize=8, color='#27ae60',
                 va='top', ha='left', alpha=0.7, fontweight='bold')
-    
+
     # Plot line
-    ax.plot(dates, values, marker='o', linewidth=3, markersize=12, 
+    ax.plot(xs, values, marker='o', linewidth=3, markersize=12,
             color=line_color, alpha=0.7, zorder=3)
-    
+
     # Fill area under line
-    ax.fill_between(range(len(dates)), values, alpha=0.2, 
-                     color=line_color, zorder=1)
-    
-    # Add value labels on points
-    for i, (date, val) in enumerate(zip(dates, values)):
-        ax.text(i, val, f'{val:.2f}', ha='center', va='bottom', 
+    ax.fill_between(xs, values, alpha=0.2,
+                    color=line_color, zorder=1)
+
+    # Add value labels on points (first and last only for long histories)
+    label_idx = range(len(values)) if len(values) <= 6 else (0, len(values) - 1)
+    for i in label_idx:
+        ax.text(xs[i], values[i], f'{values[i]:.2f}', ha='center', va='bottom',
                 fontsize=10, fontweight='bold', color='#2c3e50')
-    
+
     # Display percentage change with appropriate color
-    if values[0] != 0:
+    if len(values) > 1 and values[0] != 0:
         change_text = f'{pct_change:+.1f}%'
         change_color = line_color  # Use same color as line
-        
+
         ax.text(0.98, 0.95, change_text, transform=ax.transAxes,
                 fontsize=11, fontweight='bold', color=change_color,
                 ha='right', va='top',
-                bbox=dict(boxstyle='round,pad=0.5', facecolor='white', 
-                         edgecolor=change_color, linewidth=2))
-    
+                bbox=dict(boxstyle='round,pad=0.5', facecolor='white',
+                          edgecolor=change_color, linewidth=2))
+
     # Styling
+    step = -(-len(labels) // 6)  # At most 6 tick labels
+    ax.set_xticks(x[::step])
+    ax.set_xticklabels(labels[::step])
+    ax.set_xlim(-0.5, len(labels) - 0.5)
     ax.set_title(test_name, fontsize=12, fontweight='bold', pad=10, color='#2c3e50')
     ax.set_ylabel(f'Value ({data["unit"]})', fontsize=9, color='#7f8c8d')
     ax.grid(True, alpha=0.3, linestyle='--', zorder=0)
-    
+
     # Adjust y-limits to show normal range if available
     if normal_range is not None:
-        y_min = min(min(values) * 0.9, normal_range[0] * 0.95)
-        y_max = max(max(values) * 1.1, normal_range[1] * 1.05)
+        y_min = min(values.min() * 0.9, normal_range[0] * 0.95)
+        y_max = max(values.max() * 1.1, normal_range[1] * 1.05)
         ax.set_ylim([y_min, y_max])
+    elif values.min() != values.max() or values[0] != 0:
+        ax.set_ylim([values.min() * 0.9, values.max() * 1.1])
+
+    # Add status indicators: range check when defined, else the reported status
+    if normal_range is not None:
+        point_normal = classify_values(values, *normal_range) == NORMAL
     else:
-        ax.set_ylim([min(values) * 0.9, max(values) * 1.1])
-    
-    # Add status indicators with enhanced logic
-    # Determine color for first value
-    if val1_normal is not None:
-        if val1_normal:
-            status_color1 = '#27ae60'  # Green - within normal range
-        else:
-            status_color1 = '#e74c3c'  # Red - outside normal range
-    else:
-        status_color1 = '#27ae60' if 'NORMAL' in data['status1'] else '#e74c3c'
-    
-    # Determine color for second value
-    if val2_normal is not None:
-        if val2_normal:
-            status_color2 = '#27ae60'  # Green - within normal range
-        else:
-            status_color2 = '#e74c3c'  # Red - outside normal range
-    else:
-        status_color2 = '#27ae60' if 'NORMAL' in data['status2'] else '#e74c3c'
-    
-    ax.scatter([0], [values[0]], s=200, color=status_color1, alpha=0.3, zorder=2)
-    ax.scatter([1], [values[1]], s=200, color=status_color2, alpha=0.3, zorder=2)
-    
+        point_normal = np.array(['NORMAL' in str(status) for status in statuses])
+    status_colors = np.where(point_normal, '#27ae60', '#e74c3c')
+    ax.scatter(xs, values, s=200, c=status_colors, alpha=0.3, zorder=2)
+
+    # Ring points far from their recent history, and mark a shift in level
+    with np.errstate(invalid='ignore'):
+        unusual = np.abs(trend.zscores[mask]) >= ANOMALY_Z
+    if unusual.any():
+        ax.scatter(xs[unusual], values[unusual], s=420, facecolors='none', edgecolors='#8e44ad',
+                   linewidths=2, zorder=4)
+    if trend.change_point >= 0:
+        ax.axvline(trend.change_point - 0.5, color='#8e44ad', linestyle=':', linewidth=2, zorder=1)
+        ax.text(trend.change_point - 0.45, 0.84, 'level shift', transform=ax.get_xaxis_transform(),
+                fontsize=8, color='#8e44ad', va='top', ha='left')
+
+    # Fitted trend per report, time in range and a deterioration warning
+    if len(values) > 2:
+        notes = [f'slope {trend.slope:+.3g}/report']
+        if not np.isnan(trend.time_in_range):
+            notes.append(f'{trend.time_in_range:.0%} in range')
+        ax.text(0.98, 0.02, ' | '.join(notes), transform=ax.transAxes, fontsize=8,
+                color='#7f8c8d', ha='right', va='bottom')
+    if trend.deteriorating:
+        ax.text(0.02, 0.95, 'deteriorating', transform=ax.transAxes, fontsize=9, fontweight='bold',
+                color='#c0392b', ha='left', va='top')
+
     # Remove top and right spines
     ax.spines['top'].set_visible(False)
     ax.spines['right'].set_visible(False)
 
-# Add summary box at the bottom
-fig.text(0.5, 0.02, 
-         '📊 Key Observations: Blood Glucose improved by 19.6% (271.87 → 218.45 mg/dL) | '
-         'Hemoglobin normalized (16.2 → 15.4 gm%) | MCHC within range (36.7 → 36.0%) | '
-         'All infectious disease markers negative',
-         ha='center', fontsize=11, 
-         bbox=dict(boxstyle='round,pad=1', facecolor='#ecf0f1', edgecolor='#34495e', linewidth=2),
-         wrap=True)
-
-# Add color legend
-legend_y = 0.01
-legend_items = [
-    ('🟢 Green Band: Normal Range', '#27ae60'),
-    ('🟢 Green Point/Line: Within Normal or Improved', '#2ecc71'),
-    ('🔵 Blue Line: Value Changed Within Normal Range', '#3498db'),
-    ('🔴 Red Point/Line: Outside Normal Range', '#e74c3c'),
-    ('🟡 Yellow Line: No Change in Value', '#f39c12')
-]
+def summarize_changes(test_data, tests, limit=3):
+    """Build the key observations line from the largest first-to-last changes"""
+    changes = []
+    for name in tests:
+        data = test_data[name]
+        values = data['values'][~np.isnan(data['values'])]
+        if len(values) > 1 and values[0] != 0:
+            pct_change = ((values[-1] - values[0]) / values[0]) * 100
+            changes.append((abs(pct_change), name, pct_change, values[0], values[-1], data['unit']))
+    changes.sort(reverse=True)
+    parts = [f'{name} {pct:+.1f}% ({first:g} → {last:g} {unit.strip()})'.replace(' )', ')')
+             for _, name, pct, first, last, unit in changes[:limit]]
+    if not parts:
+        return '📊 Key Observations: Not enough reports to compare'
+    return '📊 Key Observations: ' + ' | '.join(parts)
+
+def create_trend_chart(reports, output_file='health_trends.png', format=None, show=False, series=None):
+    """Generate the marker trend figure for any number of reports
+
+    output_file is a path or a binary file-like object; format defaults to
+    the path's extension, else PNG. The figure is torn down once saved;
+    with show, it is shown first (unless headless). series is an already
+    built (labels, test_data) from build_trend_series(), if any.
+    """
+    import matplotlib
+    sns = get_seaborn()
+    with sns.axes_style(TREND_STYLE), matplotlib.rc_context(TREND_RC), span('trends.render'):
+        with render_figure((20, 28), show=show) as fig:
+            _draw_trend_chart(fig, reports, output_file, get_format(output_file, format), series)
+
+def _draw_trend_chart(fig, reports, output_file, format, series=None):
+    """Draw and save the trend figure with the trend style active"""
+    if series is None:
+        with span('trends.build_series', reports=len(reports)):
+            series = build_trend_series(reports)
+    labels, test_data = series
+
+    # Imported here: health_cohort imports this module
+    from health_cohort import latest_report
+    patient_info = (latest_report(reports).get('patient_info') or {}) if reports else {}
+    name = patient_info.get('name', 'Unknown Patient')
+    age = str(patient_info.get('age', '')).replace(' ', '')
+    sex = str(patient_info.get('sex', '')).title()
+
+    # Create subplots - 6 rows x 3 columns
+    fig.suptitle(f'Health Marker Trend Analysis - {name} ({age}, {sex})',
+                 fontsize=24, fontweight='bold', y=0.995)
+
+    # Add subtitle
+    fig.text(0.5, 0.985, '',
+             ha='center', fontsize=14, style='italic', color='#666')
+
+    # Filter available tests
+    available_tests = [t for t in key_tests if t in test_data]
+
+    # Trend statistics for every plotted marker in one pass
+    with span('trends.stats'):
+        stats = series_stats(test_data, available_tests[:18])
+
+    # Plot each test
+    for idx, test_name in enumerate(available_tests[:18], 1):  # Limit to 18 charts (6x3 grid)
+        ax = fig.add_subplot(6, 3, idx)
+        plot_marker(ax, test_name, test_data[test_name], labels, stats.marker(idx - 1))
+
+    # Add summary box at the bottom
+    fig.text(0.5, 0.02,
+             summarize_changes(test_data, available_tests[:18]),
+             ha='center', fontsize=11,
+             bbox=dict(boxstyle='round,pad=1', facecolor='#ecf0f1', edgecolor='#34495e', linewidth=2),
+             wrap=True)
+
+    # Add color legend
+    fig.text(0.5, 0.01, LEGEND_TEXT,
+             ha='center', fontsize=9, style='italic',
+             bbox=dict(boxstyle='round,pad=0.8', facecolor='white',
+                       edgecolor='#7f8c8d', linewidth=1.5, alpha=0.9))
 
-legend_text = ' | '.join([f'{item[0]}' for item in legend_items])
-fig.text(0.5, legend_y, legend_text,
-         ha='center', fontsize=9, style='italic',
-         bbox=dict(boxstyle='round,pad=0.8', facecolor='white', 
-                  edgecolor='#7f8c8d', linewidth=1.5, alpha=0.9))
+    # Adjust layout
+    with span('trends.layout'):
+        fig.tight_layout(rect=[0, 0.05, 1, 0.98])
 
-# Adjust layout
-plt.tight_layout(rect=[0, 0.05, 1, 0.98])
+    # Save figure
+    with span('trends.save', figure=fig):
+        fig.savefig(output_file, format=format, dpi=300, bbox_inches='tight', facecolor='#f8f9fa')
+    print(f"✅ Health trends chart saved as '{target_name(output_file)}'")
 
-# Save figure
-plt.savefig('health_trends.png', dpi=300, bbox_inches='tight', facecolor='#f8f9fa')
-print("✅ Health trends chart saved as 'health_trends.png'")
 
-# Display the plot
-plt.show()
+# Usage: python health_trends_generator.py [report.json ...]
+if __name__ == "__main__":
+    paths = sys.argv[1:] or ['health_report_data.json', 'health_report_data1.json']
+    create_trend_chart(load_reports(paths), show=True)
@@ -0,0 +1,137 @@
+import re
+from collections import namedtuple
+import numpy as np
+from health_names import TEST_NAMES
+
+# Unit spellings (normalized by unit_key()) -> (dimension, scale to the dimension's base unit).
+# Bases: mg/dL for mass concentration, mmol/L for molar concentration, cells per
+# microlitre (= /cumm) for counts, then %, fL, pg, mm/hr and mL.
+UNITS = {
+    'mg/dl': ('mass', 1.0), 'mg%': ('mass', 1.0), 'mg/l': ('mass', 0.1),
+    'g/dl': ('mass', 1000.0), 'gm/dl': ('mass', 1000.0), 'gm%': ('mass', 1000.0), 'g%': ('mass', 1000.0),
+    'g/l': ('mass', 100.0), 'gm/l': ('mass', 100.0), 'ug/dl': ('mass', 0.001), 'mcg/dl': ('mass', 0.001),
+    'mmol/l': ('molar', 1.0), 'umol/l': ('molar', 0.001), 'mol/l': ('molar', 1000.0),
+    '/cumm': ('count', 1.0), '/cmm': ('count', 1.0), '/mm3': ('count', 1.0), '/ul': ('count', 1.0),
+    '103/ul': ('count', 1e3), '103/cumm': ('count', 1e3), '103/mm3': ('count', 1e3), '109/l': ('count', 1e3),
+    'thou/ul': ('count', 1e3), 'thou/cumm': ('count', 1e3), 'k/ul': ('count', 1e3),
+    'lakh/cumm': ('count', 1e5), 'lakhs/cumm': ('count', 1e5), 'lac/cumm': ('count', 1e5),
+    'lacs/cumm': ('count', 1e5),
+    '106/ul': ('count', 1e6), '106/cumm': ('count', 1e6), '106/mm3': ('count', 1e6), '1012/l': ('count', 1e6),
+    'mil/cumm': ('count', 1e6), 'mill/cumm': ('count', 1e6), 'million/cumm': ('count', 1e6),
+    'mil/ul': ('count', 1e6), 'million/ul': ('count', 1e6), 'm/ul': ('count', 1e6),
+    '%': ('percent', 1.0),
+    'fl': ('volume', 1.0), 'cumicron': ('volume', 1.0), 'um3': ('volume', 1.0),
+    'pg': ('mass_cell', 1.0), 'picogram': ('mass_cell', 1.0),
+    'mm/hr': ('rate', 1.0), 'mm/h': ('rate', 1.0), 'mm/1sthr': ('rate', 1.0), 'mm/1hr': ('rate', 1.0),
+    'mm': ('rate', 1.0),
+    'ml': ('fluid', 1.0), 'l': ('fluid', 1000.0), 'ml/24hr': ('fluid', 1.0)
+}
+
+# Canonical unit per test: the unit DEFAULT_RANGES are in, which values are converted to
+TEST_UNITS = {
+    'HEMOGLOBIN': 'g/dL',
+    'Total RBC Count': 'mil/cumm',
+    'H.CT': '%',
+    'M.C.V': 'fL',
+    'M.C.H.': 'pg',
+    'M.C.H.C.': 'g/dL',
+    'R.D.W': '%',
+    'Total WBC Count (TLC)': '/cumm',
+    'Platelet Count': '/cumm',
+    '1 Hour ESR': 'mm/hr',
+    'Polymorphs': '%',
+    'Lymphocytes': '%',
+    'Eosinophils': '%',
+    'Monocytes': '%',
+    'Basophils': '%',
+    'Mean Blood Glucose': 'mg/dL',
+    'Urine Volume': 'mL'
+}
+
+# Test-specific factors between dimensions' base units: (test, from, to) -> factor
+CONVERSIONS = {
+    ('Mean Blood Glucose', 'molar', 'mass'): 18.016,  # mmol/L -> mg/dL
+    ('HEMOGLOBIN', 'molar', 'mass'): 1611.0,  # mmol/L (monomer) -> mg/dL
+    ('M.C.H.C.', 'percent', 'mass'): 1000.0  # Labs printing MCHC in % mean g/dL
+}
+
+# How a row's unit was handled: stated and used as is, converted, or assumed
+# to be the canonical unit because it was missing, unreadable or impossible
+UNIT_OK, UNIT_CONVERTED, UNIT_ASSUMED = 'ok', 'converted', 'assumed'
+
+UnitConversion = namedtuple('UnitConversion', ['factor', 'unit', 'status'])
+
+_SUPERSCRIPTS = str.maketrans({'µ': 'u', 'μ': 'u', '³': '3', '⁶': '6', '⁹': '9', '¹': '1', '²': '2',
+                               '×': '', '^': '', '*': ''})
+_SPACES = re.compile(r'\s+')
+_CELLS = re.compile(r'^x(?=10)|cells?')
+
+def unit_key(text):
+    """Reduce a unit string to the spelling UNITS uses ('10^3/µL' -> '103/ul')"""
+    text = _SPACES.sub('', str(text or '').lower().translate(_SUPERSCRIPTS))
+    return _CELLS.sub('', text)
+
+def parse_unit(text):
+    """Get a unit string's (dimension, scale), or None when it isn't a known unit"""
+    return UNITS.get(unit_key(text))
+
+# Per (test id, raw unit): UnitConversion; cleared when it reaches this many
+# entries, so arbitrary units can't grow a long-running process
+_CONVERSIONS = {}
+_CONVERSIONS_LIMIT = 65536
+
+def resolve_unit(name, unit):
+    """Get the UnitConversion taking a test's values in `unit` to the test's canonical unit
+
+    Tests without a canonical unit keep their values and unit. A missing,
+    unreadable ('80 - 96') or impossible ('fL' for a differential count)
+    unit is assumed to already be the canonical one. Resolved once per
+    distinct (test, unit) pair.
+    """
+    test_id = TEST_NAMES.test_id(name)
+    key = (test_id, unit)
+    conversion = _CONVERSIONS.get(key)
+    if conversion is not None:
+        return conversion
+
+    canonical = TEST_NAMES.canonical(name)
+    target = TEST_UNITS.get(canonical)
+    stated = parse_unit(unit)
+    if target is None:
+        conversion = UnitConversion(1.0, unit, UNIT_OK)
+    else:
+        dimension, scale = UNITS[unit_key(target)]
+        if stated is None:
+            conversion = UnitConversion(1.0, target, UNIT_ASSUMED)
+        elif stated[0] == dimension:
+            factor = stated[1] / scale
+            conversion = UnitConversion(factor, unit, UNIT_OK) if factor == 1.0 else \
+                UnitConversion(factor, target, UNIT_CONVERTED)
+        elif (canonical, stated[0], dimension) in CONVERSIONS:
+            factor = stated[1] * CONVERSIONS[(canonical, stated[0], dimension)] / scale
+            conversion = UnitConversion(factor, target, UNIT_CONVERTED)
+        else:
+            conversion = UnitConversion(1.0, target, UNIT_ASSUMED)
+    if len(_CONVERSIONS) >= _CONVERSIONS_LIMIT:
+        _CONVERSIONS.clear()
+    _CONVERSIONS[key] = conversion
+    return conversion
+
+def unit_factor(name, unit):
+    """Get the factor taking one test's values in `unit` to its canonical unit"""
+    return resolve_unit(name, unit).factor
+
+def unit_factors(names, units):
+    """Get conversion factors for columns of test names and units, one lookup per distinct pair"""
+    lookup = {}
+    factors = []
+    for pair in zip(names, units):
+        factor = lookup.get(pair)
+        if factor is None:
+            factor = lookup[pair] = resolve_unit(*pair).factor
+        factors.append(factor)
+    return np.array(factors, dtype=float)
+
+def normalize_values(values, names, units):
+    """Convert a column of values to their tests' canonical units"""
+    return np.asarray(values, dtype=float) * unit_factors(names, units)
@@ -0,0 +1,79 @@
+import re
+from functools import lru_cache
+import numpy as np
+
+# Textual results that mean "not present"
+NEGATIVE_VALUES = {'nil', 'negative', 'neg', 'absent', 'none', 'non reactive',
+                   'non-reactive', 'nonreactive', 'not detected', 'not seen'}
+
+# Textual results that mean "present" without a grade
+POSITIVE_VALUES = {'present', 'positive', 'pos', 'reactive', 'detected', 'seen'}
+
+# Precompiled patterns, tried in order
+_GRADE = re.compile(r'^(?:present|positive)?\s*\(?\s*(\++)\s*\)?$')
+_TRACE = re.compile(r'^(?:present\s*)?\(?\s*(?:trace|traces|\+/-|±)\s*\)?$')
+_RANGE = re.compile(r'^(-?\d+(?:\.\d+)?)\s*(?:-|–|to)\s*(\d+(?:\.\d+)?)\b')
+_NUMBER = re.compile(r'^(?:[<>]=?|≤|≥)?\s*(-?(?:\d{1,3}(?:,\d{2,3})*,\d{3}|\d+)(?:\.\d+)?|-?\.\d+)'
+                     r'(?:[eE][-+]?\d+)?')
+_DECIMAL_COMMA = re.compile(r'^((?:[<>]=?|≤|≥)?\s*-?\d+),(\d+)(?![\d,.])')
+
+@lru_cache(maxsize=65536)
+def _parse_text(text):
+    """Parse one lab value string (memoized, since values repeat across patients)"""
+    text = ' '.join(text.lower().split())
+    if not text:
+        return None
+    if text in NEGATIVE_VALUES:
+        return 0.0
+    if text in POSITIVE_VALUES:
+        return 1.0
+
+    # Qualitative grades: '+', 'Present (++)', '+++'
+    match = _GRADE.match(text)
+    if match:
+        return float(len(match.group(1)))
+    if _TRACE.match(text):
+        return 0.5
+
+    # Ranges such as '1-2' (cells per field) use the midpoint
+    match = _RANGE.match(text)
+    if match:
+        low, high = float(match.group(1)), float(match.group(2))
+        return (low + high) / 2
+
+    # Decimal commas ('5,4'); a comma before exactly three digits separates thousands
+    match = _DECIMAL_COMMA.match(text)
+    if match and len(match.group(2)) != 3:
+        return float(match.group(1).lstrip('<>=≤≥ ') + '.' + match.group(2))
+
+    # Plain numbers, optionally with a comparator, thousands separators ('4,500',
+    # '1,50,000') or a unit; a malformed grouping ('1,234,56') is not a number
+    match = _NUMBER.match(text)
+    if match:
+        if text[match.end():match.end() + 1] == ',':
+            return None
+        return float(match.group(0).lstrip('<>=≤≥ ').replace(',', ''))
+    return None
+
+def parse_lab_value(value):
+    """Convert a lab value to a float, or None when it is not numeric
+
+    Handles numbers (thousands separators, decimal commas: '5,4' -> 5.4),
+    qualitative grades ('Present (++)' -> 2.0), ranges ('1-2' -> 1.5) and
+    textual negatives ('Nil', 'Negative' -> 0.0).
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return _parse_text(str(value))
+
+def parse_lab_values(values):
+    """Parse a whole column of lab values into a float array (NaN when not numeric)"""
+    values = list(values)
+    # Parse each distinct value once, then look the rows up
+    parsed = {}
+    for value in set(values):
+        result = parse_lab_value(value)
+        parsed[value] = np.nan if result is None else result
+    return np.fromiter((parsed[value] for value in values), dtype=float, count=len(values))
@@ -0,0 +1,264 @@
+import argparse
+import collections
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from health_batch import GENERATORS, _init_worker, iter_render_jobs, print_result, render_job
+
+# Render-to-detection lags kept for the status percentiles
+LAG_WINDOW = 1000
+
+def scan_reports(directory):
+    """Snapshot a report directory as {patient_id: {path: (mtime_ns, size)}}
+
+    Same layout as health_batch.discover_jobs(): one sub-directory of
+    report JSONs per patient, or single-report patients as top-level JSON
+    files. Only directory entries are read (one stat per file), never the
+    reports themselves.
+    """
+    patients = {}
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return patients
+    for entry in entries:
+        if entry.name.startswith('.'):
+            continue
+        try:
+            if entry.is_dir():
+                files = {}
+                for child in os.scandir(entry.path):
+                    if child.name.endswith('.json') and not child.name.startswith('.') and child.is_file():
+                        stat = child.stat()
+                        files[child.path] = (stat.st_mtime_ns, stat.st_size)
+                if files:
+                    patients[entry.name] = files
+            elif entry.name.endswith('.json') and entry.is_file():
+                stat = entry.stat()
+                patients[os.path.splitext(entry.name)[0]] = {entry.path: (stat.st_mtime_ns, stat.st_size)}
+        except FileNotFoundError:
+            continue  # Removed between listing and stat; the next poll sees it gone
+    return patients
+
+class ReportWatcher:
+    """Poll a report directory and re-render only the patients whose reports changed
+
+    Each poll compares a directory snapshot with the previous one. A
+    patient with new, changed or removed report files waits until its
+    files have been still for `debounce` seconds (so half-written files
+    and bursts of copies trigger one render), then joins the pending
+    queue once. Pending patients are dispatched to the worker pool, all
+    of a patient's generators at a time, keeping at most max_in_flight
+    jobs queued; a patient that changes again while rendering is rendered
+    once more afterwards. Lag is the time from first seeing a change to
+    the patient's outputs being written.
+    """
+
+    def __init__(self, directory, output_dir, generators=tuple(GENERATORS), workers=None, debounce=2.0,
+                 max_in_flight=None, options=None, cache_config=None, skip_existing=False):
+        self.directory = directory
+        self.output_dir = output_dir
+        self.generators = list(generators)
+        self.workers = workers or os.cpu_count() or 1
+        self.debounce = debounce
+        self.max_in_flight = max(max_in_flight or self.workers * 2, len(self.generators))
+        self.options = options or {}
+        self.cache_config = cache_config
+        self.snapshot = scan_reports(directory) if skip_existing else {}
+        self.settling = {}  # patient_id: (first change seen, last change seen)
+        self.pending = collections.OrderedDict()  # patient_id: first change seen
+        self.rendering = {}  # patient_id: [first change seen, jobs left, failed jobs]
+        self.futures = {}  # future: patient_id
+        self.started = time.time()
+        self.counts = collections.Counter()
+        self.lags = collections.deque(maxlen=LAG_WINDOW)
+
+    def poll(self, now=None):
+        """Scan once; returns the ids of patients whose reports changed since the last scan"""
+        now = time.monotonic() if now is None else now
+        snapshot = scan_reports(self.directory)
+        changed = [patient_id for patient_id in snapshot.keys() | self.snapshot.keys()
+                   if snapshot.get(patient_id) != self.snapshot.get(patient_id)]
+        self.snapshot = snapshot
+        for patient_id in changed:
+            first_seen = self.settling.get(patient_id, (now, now))[0]
+            self.settling[patient_id] = (first_seen, now)
+        self.counts['changes_seen'] += len(changed)
+
+        for patient_id, (first_seen, last_seen) in list(self.settling.items()):
+            if now - last_seen < self.debounce:
+                continue
+            del self.settling[patient_id]
+            if patient_id not in self.snapshot:
+                self.counts['patients_removed'] += 1  # Nothing left to render
+            elif patient_id in self.pending:
+                self.counts['changes_coalesced'] += 1
+            else:
+                self.pending[patient_id] = first_seen
+                self.counts['patients_queued'] += 1
+        return changed
+
+    def dispatch(self, pool):
+        """Submit pending patients while the pool has room, oldest change first"""
+        in_flight = len(self.futures)
+        for patient_id in list(self.pending):
+            if in_flight + len(self.generators) > self.max_in_flight:
+                break
+            if patient_id in self.rendering:
+                continue  # Rendered again once the current render finishes
+            first_seen = self.pending.pop(patient_id)
+            if patient_id not in self.snapshot:
+                continue
+            paths = sorted(self.snapshot[patient_id])
+            jobs = list(iter_render_jobs([(patient_id, paths)], self.output_dir, self.generators,
+                                         self.options, self.cache_config))
+            self.rendering[patient_id] = [first_seen, len(jobs), 0]
+            for job in jobs:
+                self.futures[pool.submit(render_job, job)] = patient_id
+            in_flight += len(jobs)
+
+    def collect(self, done, now=None, on_result=None, on_patient=None):
+        """Record finished jobs; a patient is done once all of its generators are"""
+        now = time.monotonic() if now is None else now
+        for future in done:
+            patient_id = self.futures.pop(future)
+            try:
+                result = future.result()
+            except Exception as exc:  # e.g. a worker process died
+                result = {'patient_id': patient_id, 'generator': '?', 'output_file': None, 'seconds': 0.0,
+                          'cached': False, 'error': f'{type(exc).__name__}: {exc}'}
+            self.counts['jobs_failed' if result['error'] else 'jobs_completed'] += 1
+            if on_result:
+                on_result(result)
+            state = self.rendering[patient_id]
+            state[1] -= 1
+            state[2] += bool(result['error'])
+            if state[1] == 0:
+                del self.rendering[patient_id]
+                lag = now - state[0]
+                self.lags.append(lag)
+                self.counts['patients_rendered'] += 1
+                if on_patient:
+                    on_patient(patient_id, lag, state[2])
+
+    def status(self, now=None):
+        """Backlog and lag: queue depths, counters and lag percentiles (seconds)"""
+        now = time.monotonic() if now is None else now
+        waiting = [first_seen for first_seen, _ in self.settling.values()]
+        waiting += list(self.pending.values())
+        waiting += [state[0] for state in self.rendering.values()]
+        ordered = sorted(self.lags)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+        return {
+            'directory': self.directory,
+            'workers': self.workers,
+            'patients_watched': len(self.snapshot),
+            'settling': len(self.settling),
+            'queue_depth': len(self.pending),
+            'rendering': len(self.rendering),
+            'jobs_in_flight': len(self.futures),
+            'oldest_change_seconds': round(now - min(waiting), 3) if waiting else 0.0,
+            'lag_seconds': {'last': round(self.lags[-1], 3), 'p50': pick(0.50), 'p95': pick(0.95),
+                            'max': round(ordered[-1], 3)} if ordered else None,
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'counts': dict(self.counts)
+        }
+
+    @property
+    def idle(self):
+        return not (self.settling or self.pending or self.futures)
+
+    def run(self, interval=1.0, once=False, status_file=None, on_result=None, on_patient=None, should_stop=None):
+        """Poll, dispatch and collect until should_stop() (or, with once, until the backlog is rendered)
+
+        With status_file, the status() JSON is rewritten atomically after
+        every poll.
+        """
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as pool:
+            next_poll = 0.0
+            while not (should_stop and should_stop()):
+                if time.monotonic() >= next_poll:
+                    self.poll()
+                    next_poll = time.monotonic() + interval
+                    if status_file:
+                        write_status(status_file, self.status())
+                self.dispatch(pool)
+                if once and self.idle:
+                    break
+                timeout = max(0.0, next_poll - time.monotonic())
+                if self.futures:
+                    done, _ = wait(self.futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                    self.collect(done, on_result=on_result, on_patient=on_patient)
+                else:
+                    time.sleep(timeout)
+            if status_file:
+                write_status(status_file, self.status())
+        return self.status()
+
+def write_status(path, status):
+    """Replace the status file in one step, so readers never see it half written"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(status, f, indent=2)
+    os.replace(tmp_path, path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Watch a report directory and render patients whose reports '
+                                                 'change')
+    parser.add_argument('directory', help='directory of report JSONs: one sub-directory per patient, or '
+                                          'single-report patients as top-level JSON files')
+    parser.add_argument('-o', '--output-dir', default='renders', help='where to write patient outputs')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('-g', '--generators', default=','.join(GENERATORS),
+                        help='comma separated subset of: ' + ', '.join(GENERATORS))
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between directory scans (default: 1)')
+    parser.add_argument('--debounce', type=float, default=2.0,
+                        help="seconds a patient's files must be unchanged before rendering (default: 2)")
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help='jobs queued on the pool at once (default: 2 x workers)')
+    parser.add_argument('--skip-existing', action='store_true',
+                        help='only render reports that change after startup')
+    parser.add_argument('--once', action='store_true', help='render the current backlog, then exit')
+    parser.add_argument('--status-file', help='keep the queue depth, lag and counters in this JSON file')
+    parser.add_argument('--template', action='store_true',
+                        help='render blood panels over a static layer cached once per worker')
+    parser.add_argument('--cache-dir', help='reuse renders of unchanged reports from this cache directory')
+    parser.add_argument('--cache-max-mb', type=float, default=1024, help='render cache size limit (default: 1024)')
+    args = parser.parse_args(argv)
+
+    generators = [g.strip() for g in args.generators.split(',') if g.strip()]
+    unknown = [g for g in generators if g not in GENERATORS]
+    if unknown:
+        parser.error(f"unknown generator(s): {', '.join(unknown)}")
+
+    options = {'blood': {'use_template': True}} if args.template else {}
+    cache_config = (args.cache_dir, int(args.cache_max_mb * 1024 * 1024)) if args.cache_dir else None
+    watcher = ReportWatcher(args.directory, args.output_dir, generators, args.workers, args.debounce,
+                            args.max_in_flight, options, cache_config, args.skip_existing)
+
+    stopping = []
+    def stop(signum, frame):
+        stopping.append(signum)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    def print_patient(patient_id, lag, failures):
+        status = watcher.status()
+        print(f"{'✗' if failures else '✓'} {patient_id} rendered {lag:.1f}s after the change "
+              f"({status['queue_depth']} queued, {status['rendering']} rendering, "
+              f"oldest change {status['oldest_change_seconds']:.1f}s ago)", flush=True)
+
+    print(f"Watching '{args.directory}' every {args.interval:g}s with {watcher.workers} worker(s)", flush=True)
+    status = watcher.run(args.interval, args.once, args.status_file, on_result=print_result,
+                         on_patient=print_patient, should_stop=lambda: bool(stopping))
+    counts = status['counts']
+    print(f"✓ {counts.get('patients_rendered', 0)} patient render(s), {counts.get('jobs_failed', 0)} failed job(s)")
+    return 1 if counts.get('jobs_failed') else 0
+
+
+# Usage: python health_watch.py reports/ -o renders/ -w 4 --status-file watch_status.json
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+import numpy as np
+from health_classify import (ABNORMAL, CODE_COLORS, DEFAULT_SCORE, HIGH, LOW, NORMAL, UNKNOWN, classify,
+                             classify_values, score_statuses, status_codes)
+
+def test_classify_values_bounds_are_inclusive():
+    codes = classify_values([3.9, 4.0, 7.0, 11.0, 11.1], 4.0, 11.0)
+    np.testing.assert_array_equal(codes, [LOW, NORMAL, NORMAL, NORMAL, HIGH])
+
+def test_classify_values_nan_is_unknown():
+    nan = np.nan
+    codes = classify_values([nan, 5.0, 5.0, 5.0], [1.0, nan, 1.0, 1.0], [9.0, 9.0, nan, 9.0])
+    np.testing.assert_array_equal(codes, [UNKNOWN, UNKNOWN, UNKNOWN, NORMAL])
+
+def test_classify_values_per_row_bounds():
+    codes = classify_values([12.0, 12.0], [13.0, 11.0], [17.0, 15.0])
+    np.testing.assert_array_equal(codes, [LOW, NORMAL])
+
+def test_classify_colors_and_scores():
+    result = classify([1.0, 5.0, 20.0, np.nan], 2.0, 10.0)
+    np.testing.assert_array_equal(result.codes, [LOW, NORMAL, HIGH, UNKNOWN])
+    np.testing.assert_array_equal(result.colors, CODE_COLORS[[LOW, NORMAL, HIGH, UNKNOWN]])
+    np.testing.assert_array_equal(result.scores, [70, 100, 70, 50])
+
+def test_status_codes():
+    codes = status_codes(['NORMAL', 'HIGH', 'LOW', 'BORDERLINE', 'NORMAL'])
+    np.testing.assert_array_equal(codes, [NORMAL, HIGH, LOW, ABNORMAL, NORMAL])
+
+def test_score_statuses():
+    scores = score_statuses(['NORMAL', 'HIGH', 'LOW', 'ABNORMAL', 'pending', None])
+    np.testing.assert_array_equal(scores, [100, 70, 70, 40, DEFAULT_SCORE, DEFAULT_SCORE])
+    assert score_statuses([]).shape == (0,)
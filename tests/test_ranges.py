@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from health_ranges import (RangeRegistry, RangeContext, get_age_band, normalize_sex, parse_reference_range,
+                           report_context, stated_range)
+
+ADULT_MALE = RangeContext('M', 'adult', 'City Lab')
+
+@pytest.mark.parametrize('text, expected', [
+    ('26 - 33', (26.0, 33.0)),
+    ('4.5 to 5.5', (4.5, 5.5)),
+    ('150000–410000', (150000.0, 410000.0)),
+    ('< 5', (0.0, 5.0)),
+    ('Up to 20', (0.0, 20.0)),
+    ('Negative', None),
+])
+def test_parse_reference_range(text, expected):
+    assert parse_reference_range(text) == expected
+
+@pytest.mark.parametrize('test, expected', [
+    ({'ranges': {'normal_min': 13, 'normal_max': 17}}, (13.0, 17.0)),
+    ({'ranges': {'normal_min': '4.0', 'normal_max': '11'}}, (4.0, 11.0)),
+    ({'ranges': {'normal_min': '', 'normal_max': 'x'}, 'reference_range': '1 - 2'}, (1.0, 2.0)),
+    ({'ranges': {'normal_min': None, 'normal_max': None}}, None),
+    ({'ranges': {'normal_min': float('nan'), 'normal_max': 5}}, None),
+    ({'ranges': 'n/a'}, None),
+    ({}, None),
+])
+def test_stated_range_never_raises(test, expected):
+    assert stated_range(test) == expected
+
+def test_context():
+    assert normalize_sex('Female') == 'F'
+    assert normalize_sex('x') is None
+    assert get_age_band('38 Y') == 'adult'
+    assert get_age_band('6 M') == 'child'
+    assert get_age_band('70') == 'senior'
+    assert report_context({'patient_info': {'sex': 'MALE', 'age': '38 Y', 'lab_name': ' City Lab '}}) == ADULT_MALE
+
+def test_defaults_by_sex_and_alias():
+    registry = RangeRegistry()
+    assert registry.resolve_range('Hb', ADULT_MALE) == (13.0, 17.0)
+    assert registry.resolve_range('HEMOGLOBIN', ADULT_MALE._replace(sex='F')) == (12.0, 15.0)
+    assert registry.resolve_range('Unknown Marker', ADULT_MALE) is None
+
+def test_stated_range_applies_to_its_row_only():
+    registry = RangeRegistry()
+    tests = [{'name': 'HEMOGLOBIN', 'ranges': {'normal_min': 11, 'normal_max': 15}},
+             {'name': 'Hb', 'ranges': {'normal_min': 14, 'normal_max': 18}},
+             {'name': 'Hgb'}]
+    mins, maxs = registry.resolve_bounds(tests, ADULT_MALE)
+    np.testing.assert_array_equal(mins, [11, 14, 13])
+    np.testing.assert_array_equal(maxs, [15, 18, 17])
+
+def test_no_range_carries_over_between_reports():
+    registry = RangeRegistry()
+    stated = {'name': 'HEMOGLOBIN', 'ranges': {'normal_min': 1, 'normal_max': 2}}
+    registry.resolve_bounds([stated], ADULT_MALE)
+    assert registry.resolve_range('HEMOGLOBIN', ADULT_MALE, {'name': 'HEMOGLOBIN'}) == (13.0, 17.0)
+    # Only the default tables take ids, however many ranges are stated
+    for low in range(100):
+        registry.resolve_bounds([{'name': 'HEMOGLOBIN', 'ranges': {'normal_min': low, 'normal_max': 200}}],
+                                ADULT_MALE)
+    assert len(registry) == 2
+
+def test_stated_range_converted_to_canonical_unit():
+    registry = RangeRegistry()
+    test = {'name': 'WBC', 'unit': '10^3/µL', 'ranges': {'normal_min': 4, 'normal_max': 11}}
+    assert registry.resolve_range('WBC', ADULT_MALE, test) == (4000.0, 11000.0)
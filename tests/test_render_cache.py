@@ -0,0 +1,50 @@
+import os
+import health_batch
+from health_render_cache import RenderCache
+
+REPORT = {'patient_info': {'name': 'A'}, 'tests': [{'name': 'HEMOGLOBIN', 'value': '14'}]}
+
+def _artifact(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b'x' * size)
+    return str(path)
+
+def test_key_ignores_key_order_but_not_content(tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'))
+    key = cache.make_key('blood', 1, [REPORT])
+    reordered = {'tests': REPORT['tests'], 'patient_info': REPORT['patient_info']}
+    assert cache.make_key('blood', 1, [reordered]) == key
+    assert cache.make_key('blood', 2, [REPORT]) != key
+    assert cache.make_key('radar', 1, [REPORT]) != key
+    assert cache.make_key('blood', 1, [REPORT], {'format': 'svg'}) != key
+    assert cache.make_key('blood', 1, [REPORT, REPORT]) != key
+
+def test_get_and_put(tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'))
+    assert cache.get('ab' * 32) is None
+    path = cache.put('ab' * 32, _artifact(tmp_path, 'a.png', 10))
+    assert cache.get('ab' * 32) == path
+    assert open(path, 'rb').read() == b'x' * 10
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'), max_bytes=250)
+    paths = [cache.put(f'{n:02d}' * 32, _artifact(tmp_path, f'{n}.png', 100)) for n in range(2)]
+    os.utime(paths[0], (1, 1))
+    os.utime(paths[1], (2, 2))
+    cache.get('00' * 32)  # Now the most recently used
+    cache.put('02' * 32, _artifact(tmp_path, '2.png', 100))
+    assert cache.get('00' * 32) is not None
+    assert cache.get('01' * 32) is None
+    assert cache.get('02' * 32) is not None
+
+def test_render_job_renders_when_hit_is_evicted(tmp_path, monkeypatch):
+    def fake_render(generator, reports, output_file, **options):
+        with open(output_file, 'wb') as f:
+            f.write(b'rendered')
+    monkeypatch.setattr(health_batch, 'render', fake_render)
+    # get() found the entry, then another worker evicted it before the copy
+    monkeypatch.setattr(RenderCache, 'get', lambda self, key, suffix='.png': str(tmp_path / 'gone.png'))
+    output_file = str(tmp_path / 'out.png')
+    result = health_batch.render_job(('p1', 'radar', [REPORT], output_file, {}, (str(tmp_path / 'cache'), 10 ** 6)))
+    assert result['error'] is None and not result['cached']
+    assert open(output_file, 'rb').read() == b'rendered'
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import pytest
+from health_service import MAX_BODY_BYTES, RenderService, parse_render_request
+
+REPORT = {'patient_info': {'name': 'A', 'collection_date': '2024-03-01'},
+          'tests': [{'name': 'HEMOGLOBIN', 'value': '14', 'unit': 'g/dL', 'status': 'NORMAL'}]}
+OLDER = {'patient_info': {'name': 'B', 'collection_date': '2023-01-01'}, 'tests': []}
+
+def _handle(service, method, path, body=b''):
+    status, _, payload = asyncio.run(service.handle(method, path, body))
+    return status, json.loads(payload)
+
+@pytest.mark.parametrize('body, error', [
+    (b'not json', 'Expecting value'),
+    (b'[]', 'non-empty list'),
+    (b'[1]', 'non-empty list'),
+    (b'{"patient_info": [1]}', "'patient_info' must be a JSON object"),
+    (b'{"reports": [{}], "options": [1]}', "'options' must be a JSON object"),
+    (b'{"reports": [{}], "options": "svg"}', "'options' must be a JSON object"),
+    (b'{"reports": [{}], "options": {"format": ["svg"]}}', "'format' must be a JSON string"),
+    (b'{"reports": [{}], "options": {"format": "gif"}}', "unsupported format 'gif'"),
+    (b'{"reports": [{}], "options": {"dpi": 72}}', "unknown option 'dpi'"),
+    (b'{"reports": [{}], "options": {"use_template": "yes"}}', "'use_template' must be a JSON boolean"),
+])
+def test_bad_render_requests_get_400(body, error):
+    status, payload = _handle(RenderService(workers=1), 'POST', '/render/blood', body)
+    assert status == 400
+    assert error in payload['error']
+
+def test_options_checked_per_generator():
+    with pytest.raises(ValueError, match="unknown option 'use_template' for radar"):
+        parse_render_request('radar', json.dumps({'reports': [REPORT], 'options': {'use_template': True}}))
+    with pytest.raises(ValueError, match="unknown generator"):
+        parse_render_request('pie', json.dumps(REPORT))
+
+def test_latest_report_by_date():
+    reports, options = parse_render_request('blood', json.dumps([REPORT, OLDER]))
+    assert reports == [REPORT] and options == {'format': 'png'}
+    reports, _ = parse_render_request('trends', json.dumps({'reports': [REPORT, OLDER]}))
+    assert reports == [REPORT, OLDER]
+
+def test_full_queue_gets_503():
+    async def run():
+        service = RenderService(workers=1, max_queue=1)
+        first = await service.handle('POST', '/jobs/radar', json.dumps(REPORT).encode())
+        second = await service.handle('POST', '/jobs/radar', json.dumps(REPORT).encode())
+        return first[0], second[0], service.metrics()
+    first, second, metrics = asyncio.run(run())
+    assert (first, second) == (202, 503)
+    assert metrics['queue_depth'] == 1 and metrics['counts']['rejected'] == 1
+
+def test_routing():
+    service = RenderService(workers=1)
+    assert _handle(service, 'GET', '/healthz') == (200, {'status': 'ok'})
+    assert _handle(service, 'GET', '/jobs/missing')[0] == 404
+    assert _handle(service, 'GET', '/render/blood')[0] == 405
+    assert _handle(service, 'GET', '/nowhere')[0] == 404
+
+@pytest.mark.parametrize('length, status', [('abc', 400), ('-5', 400), (str(MAX_BODY_BYTES + 1), 413)])
+def test_bad_content_length(length, status):
+    async def run():
+        service = RenderService(workers=1)
+        server = await asyncio.start_server(service.serve_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'POST /render/blood HTTP/1.1\r\nContent-Length: {length}\r\n\r\n'.encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response
+    assert asyncio.run(run()).startswith(f'HTTP/1.1 {status} '.encode())
@@ -0,0 +1,27 @@
+from health_columnar import ColumnarStore, write_store
+from health_trend_stats import flag_patients, flag_store
+
+def _report(date, value, ranges=None, sex='M'):
+    test = {'name': 'HEMOGLOBIN', 'value': value, 'unit': 'g/dL', 'status': 'NORMAL'}
+    if ranges:
+        test['ranges'] = {'normal_min': ranges[0], 'normal_max': ranges[1]}
+    return {'patient_info': {'sex': sex, 'lab_name': 'City Lab', 'collection_date': date}, 'tests': [test]}
+
+def _key(flag):
+    return flag['patient_id'], flag['test'], flag['normal_min'], flag['normal_max']
+
+def test_store_and_reports_flag_alike(tmp_path):
+    patients = [
+        # States a range the default would not flag against
+        ('a', [_report('2024-01-01', '15'), _report('2024-02-01', '14'), _report('2024-03-01', '13.5', (14, 18))]),
+        # Same lab, no stated range: judged against the default, never against patient a's range
+        ('b', [_report('2024-01-01', '14'), _report('2024-02-01', '13'), _report('2024-03-01', '12')]),
+        ('c', [_report('2024-01-01', '13'), _report('2024-02-01', '12'), _report('2024-03-01', '11', sex='F')])
+    ]
+    write_store(patients, str(tmp_path / 'store'))
+    from_reports = flag_patients(patients)
+    from_store = flag_store(ColumnarStore(str(tmp_path / 'store')))
+    assert from_reports[0] == from_store[0] == 3
+    assert sorted(map(_key, from_reports[1])) == sorted(map(_key, from_store[1]))
+    assert {flag['patient_id']: (flag['normal_min'], flag['normal_max']) for flag in from_reports[1]} == \
+        {'a': (14.0, 18.0), 'b': (13.0, 17.0), 'c': (12.0, 15.0)}
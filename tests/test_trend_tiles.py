@@ -0,0 +1,29 @@
+from health_trend_tiles import IncrementalTrendChart
+
+def _report(date, hemoglobin, name='A'):
+    return {'patient_info': {'name': name, 'collection_date': date},
+            'tests': [{'name': 'Hb', 'value': hemoglobin, 'unit': 'g/dL', 'status': 'NORMAL',
+                       'ranges': {'normal_min': 13, 'normal_max': float(hemoglobin) + 3}}]}
+
+def test_reports_placed_by_date(tmp_path):
+    chart = IncrementalTrendChart(str(tmp_path))
+    for report in (_report('2024-03-01', '15', 'latest'), _report('2024-01-01', '13', 'oldest'),
+                   _report('2024-02-01', '14', 'middle')):
+        assert chart.add_report(report)
+    series = chart.state['series']['HEMOGLOBIN']
+    assert series['values'] == [13.0, 14.0, 15.0]
+    assert chart._labels('HEMOGLOBIN') == ['Report 1\n(Jan 2024)', 'Report 2\n(Feb 2024)', 'Report 3\n(Mar 2024)']
+    # The latest report's range and patient info win, whatever the arrival order
+    assert series['normal_range'] == (13.0, 18.0)
+    assert chart.state['patient_info']['name'] == 'latest'
+
+def test_redelivered_report_adds_nothing(tmp_path):
+    chart = IncrementalTrendChart(str(tmp_path))
+    assert chart.add_report(_report('2024-01-01', '13'))
+    assert not chart.add_report(_report('2024-01-01', '13'))
+    assert not chart.add_report(_report('2024-01-01', '12'))  # Same date
+    undated = {'patient_info': {}, 'tests': [{'name': 'Hb', 'value': '14'}]}
+    assert chart.add_report(undated)
+    assert not chart.add_report(dict(undated))
+    assert chart.state['series']['HEMOGLOBIN']['values'] == [13.0, 14.0]
+    assert len(chart.state['reports']) == 2
@@ -0,0 +1,27 @@
+import numpy as np
+from matplotlib.figure import Figure
+from health_trend_stats import TREND_COLORS, WORSE, series_stats
+from health_trends_generator import build_trend_series, plot_marker
+
+def _report(date, value, name):
+    return {'patient_info': {'name': name, 'collection_date': date},
+            'tests': [{'name': 'Total WBC Count (TLC)', 'value': value, 'unit': '/cumm', 'status': 'NORMAL'}]}
+
+def test_series_sorted_by_date():
+    reports = [_report('2024-03-01', '7000', 'C'), _report('2024-01-01', '5000', 'A'),
+               _report('2024-02-01', '6000', 'B')]
+    labels, test_data = build_trend_series(reports)
+    assert labels == ['Report 1\n(Jan 2024)', 'Report 2\n(Feb 2024)', 'Report 3\n(Mar 2024)']
+    np.testing.assert_array_equal(test_data['Total WBC Count (TLC)']['values'], [5000, 6000, 7000])
+
+def test_change_label_agrees_with_line_color():
+    # First to last is +12%, but the fitted trend over the noisy history is downward
+    data = {'values': np.array([10.0, 14.0, 9.0, 8.0, 11.2]), 'statuses': np.array(['NORMAL'] * 5, dtype=object),
+            'unit': '', 'normal_range': None}
+    trend = series_stats({'X': data}).marker(0)
+    assert trend.pct_change < 0
+    ax = Figure().add_subplot()
+    plot_marker(ax, 'X', data, [f'Report {i}' for i in range(1, 6)], trend)
+    label = next(text for text in ax.texts if text.get_text().endswith('%'))
+    assert label.get_text() == f'{trend.pct_change:+.1f}%'
+    assert trend.color != TREND_COLORS[WORSE]
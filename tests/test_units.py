@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from health_units import (UNIT_ASSUMED, UNIT_CONVERTED, UNIT_OK, normalize_values, parse_unit, resolve_unit,
+                          unit_factors, unit_key)
+
+@pytest.mark.parametrize('text, expected', [
+    ('x10³ cells/µL', ('count', 1e3)),
+    ('10^3/uL', ('count', 1e3)),
+    ('Lakhs/cumm', ('count', 1e5)),
+    ('g/dL', ('mass', 1000.0)),
+    ('mmol/L', ('molar', 1.0)),
+    ('80 - 96', None),
+    (None, None),
+])
+def test_parse_unit(text, expected):
+    assert parse_unit(text) == expected
+
+def test_unit_key_normalizes_spellings():
+    assert unit_key('x10³/µL') == unit_key('10^3/uL') == '103/ul'
+
+@pytest.mark.parametrize('name, unit, factor, target, status', [
+    ('HEMOGLOBIN', 'g/dL', 1.0, 'g/dL', UNIT_OK),
+    ('HEMOGLOBIN', 'g/L', 0.1, 'g/dL', UNIT_CONVERTED),
+    ('HEMOGLOBIN', 'mmol/L', 1.611, 'g/dL', UNIT_CONVERTED),
+    ('Mean Blood Glucose', 'mmol/L', 18.016, 'mg/dL', UNIT_CONVERTED),
+    ('M.C.H.C.', '%', 1.0, 'g/dL', UNIT_CONVERTED),
+    ('Total WBC Count (TLC)', '10^3/µL', 1e3, '/cumm', UNIT_CONVERTED),
+    ('Platelet Count', '10^9/L', 1e3, '/cumm', UNIT_CONVERTED),
+    ('Platelet Count', 'lakhs/cumm', 1e5, '/cumm', UNIT_CONVERTED),
+    ('Urine Volume', 'L', 1000.0, 'mL', UNIT_CONVERTED),
+    # Missing, unreadable and impossible units are taken as the canonical unit
+    ('HEMOGLOBIN', None, 1.0, 'g/dL', UNIT_ASSUMED),
+    ('HEMOGLOBIN', '80 - 96', 1.0, 'g/dL', UNIT_ASSUMED),
+    ('Lymphocytes', 'fL', 1.0, '%', UNIT_ASSUMED),
+    # Tests without a canonical unit keep their own
+    ('Serum Mystery', 'zz', 1.0, 'zz', UNIT_OK),
+])
+def test_resolve_unit(name, unit, factor, target, status):
+    conversion = resolve_unit(name, unit)
+    assert conversion.factor == pytest.approx(factor)
+    assert (conversion.unit, conversion.status) == (target, status)
+
+def test_normalize_values_per_row():
+    values = normalize_values([7.2, 7200, 14.0], ['Total WBC Count (TLC)'] * 2 + ['HEMOGLOBIN'],
+                              ['10^3/µL', '/cumm', 'g/dL'])
+    np.testing.assert_allclose(values, [7200.0, 7200.0, 14.0])
+
+def test_unit_factors_empty():
+    assert unit_factors([], []).shape == (0,)
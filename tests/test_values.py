@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from health_values import parse_lab_value, parse_lab_values
+
+@pytest.mark.parametrize('value, expected', [
+    (3, 3.0),
+    (4.2, 4.2),
+    ('13.5', 13.5),
+    ('-.5', -0.5),
+    ('1e3', 1000.0),
+    ('< 5', 5.0),
+    ('>=120', 120.0),
+    ('7.2 x10^3', 7.2),
+    ('14.1 g/dL', 14.1),
+    # Thousands separators, western and Indian grouping
+    ('4,500', 4500.0),
+    ('1,234,567', 1234567.0),
+    ('1,50,000', 150000.0),
+    ('4,500.5', 4500.5),
+    # Decimal commas
+    ('5,4', 5.4),
+    ('5,40 g/dL', 5.4),
+    ('12,3456', 12.3456),
+    ('< 5,5', 5.5),
+    # Qualitative results
+    ('Present (++)', 2.0),
+    ('+++', 3.0),
+    ('Trace', 0.5),
+    ('Nil', 0.0),
+    ('Negative', 0.0),
+    ('1-2', 1.5),
+    ('4 to 6', 5.0),
+])
+def test_parse_lab_value(value, expected):
+    assert parse_lab_value(value) == pytest.approx(expected)
+
+@pytest.mark.parametrize('value', [None, True, False, '', 'abc', '1,234,56', '5,4.3', '1,2,3'])
+def test_parse_lab_value_rejects(value):
+    assert parse_lab_value(value) is None
+
+def test_parse_lab_values_column():
+    values = parse_lab_values(['5,4', None, '4,500', 'abc', '5,4'])
+    np.testing.assert_array_equal(values, [5.4, np.nan, 4500.0, np.nan, 5.4])